@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Project: Appraise evaluation system
+ Author: Christian Federmann <cfedermann@gmail.com>
+
+usage: python benchmark_logging.py
+               [-h] [--requests REQUESTS] [--hits HITS]
+               [--write-delay WRITE_DELAY]
+
+Measures the time spent in the request thread for the log calls of a WMT16
+ranking request, comparing the former setup (DEBUG level, eager str.format
+messages, synchronous RotatingFileHandler) with the current one (lazy %s
+arguments, level from settings, appraise.log_handlers.QueueHandler).  To
+separate the effect of both changes, lazy logging is also timed using the
+synchronous handler.  As in Appraise, each setup has a root logger with the
+StreamHandler installed by logging.basicConfig();  in the current setup,
+records do not propagate to it, see settings.py.  The lazy_queue_propagate
+setup shows the cost of propagating records nonetheless.  Log files and the
+stream are written to a temporary directory which is removed afterwards;
+--write-delay simulates slow log storage.
+
+Note that the background thread shares the interpreter lock, so on a busy
+or single CPU machine its formatting and write time is still partly spent
+during requests;  the queue pays off when writes block on I/O.
+
+optional arguments:
+  -h, --help            Show this help message and exit.
+  --requests REQUESTS   Number of simulated requests per setup.
+  --hits HITS           Number of HITs listed on the simulated overview.
+  --write-delay WRITE_DELAY
+                        Milliseconds each log file write is delayed.
+
+"""
+from logging.handlers import RotatingFileHandler
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import sleep, time
+import argparse
+import json
+import logging
+import os
+
+from log_handlers import QueueHandler
+
+PARSER = argparse.ArgumentParser(description="Measures per-request " \
+  "latency of WMT16 log calls for eager and lazy logging setups.")
+PARSER.add_argument("--requests", action="store", default=2000,
+  dest="requests", help="Number of simulated requests per setup.", type=int)
+PARSER.add_argument("--hits", action="store", default=20, dest="hits",
+  help="Number of HITs listed on the simulated overview.", type=int)
+PARSER.add_argument("--write-delay", action="store", default=0.0,
+  dest="write_delay", help="Milliseconds each log file write is delayed.",
+  type=float)
+
+LOG_FORMAT = "[%(asctime)s] %(name)s::%(levelname)s %(message)s"
+LOG_DATE = "%m/%d/%Y @ %H:%M:%S"
+
+
+class DelayedFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler which delays each write, simulating slow storage.
+    """
+    def __init__(self, filename, delay_seconds):
+        """
+        Creates a new handler writing to filename.
+        """
+        super(DelayedFileHandler, self).__init__(filename=filename,
+          mode="a", maxBytes=1024*1024, backupCount=5, encoding="utf-8")
+        self.delay_seconds = delay_seconds
+
+    def emit(self, record):
+        """
+        Writes the given record after waiting for delay_seconds.
+        """
+        if self.delay_seconds:
+            sleep(self.delay_seconds)
+        super(DelayedFileHandler, self).emit(record)
+
+
+class DelayedStreamHandler(logging.StreamHandler):
+    """
+    StreamHandler which delays each write, simulating a slow terminal.
+    """
+    def __init__(self, stream, delay_seconds):
+        """
+        Creates a new handler writing to stream.
+        """
+        super(DelayedStreamHandler, self).__init__(stream)
+        self.delay_seconds = delay_seconds
+
+    def emit(self, record):
+        """
+        Writes the given record after waiting for delay_seconds.
+        """
+        if self.delay_seconds:
+            sleep(self.delay_seconds)
+        super(DelayedStreamHandler, self).emit(record)
+
+
+def eager_request(logger, request_logger, hit_data, record):
+    """
+    Issues the log calls of a ranking request as formerly implemented.
+    """
+    logger.info('Rendering task handler view for user "{0}".'.format(
+      'annotator'))
+    logger.debug('User {0} currently working on HIT {1}'.format('annotator',
+      hit_data[0][2]))
+    logger.debug('item: {}, user: {}, duration: {}, raw_result: {}'.format(
+      hit_data[0], 'annotator', '0:00:30', '1,2,3,4,5'))
+    logger.debug(u'\n\nResults data for user "{0}":\n\n{1}\n'.format(
+      'annotator', u'\n'.join([str(x) for x in hit_data[0]])))
+    logger.debug(u'\n\nHIT data for user "{0}":\n\n{1}\n'.format(
+      'annotator', u'\n'.join([u'{0}\t{1}\t{2}\t{3}'.format(*x)
+      for x in hit_data])))
+    logger.info(hit_data)
+    request_logger.info(json.dumps(record, sort_keys=True))
+
+
+def lazy_request(logger, request_logger, hit_data, record):
+    """
+    Issues the log calls of a ranking request as currently implemented.
+    """
+    logger.info('Rendering task handler view for user "%s".', 'annotator')
+    logger.debug('User %s currently working on HIT %s', 'annotator',
+      hit_data[0][2])
+    logger.debug(u'item: %s, user: %s, duration: %s, raw_result: %s',
+      hit_data[0], 'annotator', '0:00:30', '1,2,3,4,5')
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(u'\n\nResults data for user "%s":\n\n%s\n',
+          'annotator', u'\n'.join([unicode(x) for x in hit_data[0]]))
+        logger.debug(u'\n\nHIT data for user "%s":\n\n%s\n', 'annotator',
+          u'\n'.join([u'{0}\t{1}\t{2}\t{3}'.format(*x) for x in hit_data]))
+    logger.debug('Overview context: %s', hit_data)
+    if request_logger.isEnabledFor(logging.INFO):
+        request_logger.info(json.dumps(record, sort_keys=True))
+
+
+def time_setup(name, request_func, handler, request_handler, root_handler,
+  level, propagate, args):
+    """
+    Returns the median request thread time in microseconds for one setup.
+    """
+    # The setup's root logger stands in for the actual root logger.
+    root_logger = logging.getLogger('benchmark.{0}'.format(name))
+    root_logger.propagate = False
+    root_logger.addHandler(root_handler)
+
+    logger = logging.getLogger('benchmark.{0}.appraise'.format(name))
+    logger.propagate = propagate
+    logger.setLevel(level)
+    logger.addHandler(handler)
+
+    request_logger = logging.getLogger('benchmark.{0}.appraise.requests'
+      .format(name))
+    request_logger.propagate = False
+    request_logger.setLevel(logging.INFO)
+    request_logger.addHandler(request_handler)
+
+    hit_data = [(u'German-English', '/appraise/wmt16/{0:08x}/'.format(x),
+      '{0:08x}'.format(x), [x, '0:01:00', '0:10:00'], 'NewsTask')
+      for x in range(args.hits)]
+    record = {'view': 'appraise.wmt16.views.hit_handler', 'queries': 8,
+      'db_ms': 1.5, 'template_ms': 4.2, 'total_ms': 30.1, 'status': 200,
+      'method': 'GET', 'path': '/appraise/wmt16/00000000/'}
+
+    durations = []
+    for _ in range(args.requests):
+        _start = time()
+        request_func(logger, request_logger, hit_data, record)
+        durations.append(time() - _start)
+
+    _start = time()
+    handler.flush()
+    request_handler.flush()
+    root_handler.flush()
+    _flush = time() - _start
+
+    durations.sort()
+    return {'median_us': round(1e6 * durations[len(durations) / 2], 1),
+      'mean_us': round(1e6 * sum(durations) / len(durations), 1),
+      'max_us': round(1e6 * durations[-1], 1),
+      'background_flush_ms': round(1000 * _flush, 1)}
+
+
+def file_handler(path, name, formatter, args):
+    """
+    Returns a DelayedFileHandler for the given file name in path.
+    """
+    handler = DelayedFileHandler(os.path.join(path, name),
+      args.write_delay / 1000.0)
+    handler.setFormatter(formatter)
+    return handler
+
+
+def stream_handler(path, name, args):
+    """
+    Returns a StreamHandler as installed by logging.basicConfig(), writing
+    to the given file name in path instead of sys.stderr.
+    """
+    handler = DelayedStreamHandler(open(os.path.join(path, name), 'w'),
+      args.write_delay / 1000.0)
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    return handler
+
+
+# Setup name, request function, queued handlers, log level and whether
+# records propagate to the root logger, for all setups to benchmark.
+SETUPS = (
+  ('eager_sync_debug', eager_request, False, logging.DEBUG, True),
+  ('lazy_sync_info', lazy_request, False, logging.INFO, True),
+  ('lazy_queue_propagate', lazy_request, True, logging.INFO, True),
+  ('lazy_queue_debug', lazy_request, True, logging.DEBUG, False),
+  ('lazy_queue_info', lazy_request, True, logging.INFO, False),
+)
+
+
+if __name__ == "__main__":
+    args = PARSER.parse_args()
+
+    _path = mkdtemp(prefix='appraise-logging-')
+    _formatter = logging.Formatter(LOG_FORMAT, LOG_DATE)
+    _message_formatter = logging.Formatter("%(message)s")
+    try:
+        results = {}
+        for _name, _request_func, _queued, _level, _propagate in SETUPS:
+            _handler = file_handler(_path, _name + '.log', _formatter, args)
+            _request_handler = file_handler(_path, _name + '-requests.log',
+              _message_formatter, args)
+            if _queued:
+                _handler = QueueHandler([_handler])
+                _request_handler = QueueHandler([_request_handler])
+
+            _root_handler = stream_handler(_path, _name + '-stderr.log',
+              args)
+
+            results[_name] = time_setup(_name, _request_func, _handler,
+              _request_handler, _root_handler, _level, _propagate, args)
+            _handler.close()
+            _request_handler.close()
+            _root_handler.stream.close()
+            _root_handler.close()
+
+        _baseline = results['eager_sync_debug']['median_us']
+        for _name in sorted(results):
+            results[_name]['saved_us'] = round(_baseline \
+              - results[_name]['median_us'], 1)
+
+        print json.dumps(results, indent=2, sort_keys=True)
+
+    finally:
+        rmtree(_path)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Project: Appraise evaluation system
+ Author: Christian Federmann <cfedermann@gmail.com>
+
+usage: python benchmark_startup.py
+               [-h] [--repeat REPEAT] [--output OUTPUT]
+               [module [module ...]]
+
+Measures cold start time, as paid by every worker process, management
+command and script.  For each run, a fresh Python process imports the
+settings and then the given modules, recording import time in milliseconds
+and the number of database queries executed while importing.  Importing
+should not query the database;  see initialize_wmt16.py for the setup
+formerly run when importing appraise.wmt16.views.
+
+positional arguments:
+  module                Modules to import after settings, defaults to the
+                        WMT16 models, views and the URL configuration.
+
+optional arguments:
+  -h, --help            Show this help message and exit.
+  --repeat REPEAT       Number of fresh processes per measurement.
+  --output OUTPUT       JSON output file, defaults to standard output.
+
+"""
+from subprocess import check_output
+import argparse
+import json
+import os
+import sys
+
+PARSER = argparse.ArgumentParser(description="Measures cold start time " \
+  "of Appraise settings and modules.")
+PARSER.add_argument("modules", metavar="module", help="Modules to import " \
+  "after settings, defaults to the WMT16 models, views and the URL " \
+  "configuration.", nargs='*', default=['appraise.wmt16.models',
+  'appraise.wmt16.views', 'appraise.urls'])
+PARSER.add_argument("--repeat", action="store", default=5, dest="repeat",
+  help="Number of fresh processes per measurement.", type=int)
+PARSER.add_argument("--output", action="store", default=None,
+  dest="output", help="JSON output file, defaults to standard output.")
+
+# Executed by each fresh process;  prints import statistics as JSON.
+CHILD_SCRIPT = '''
+import json, os, sys
+from time import time
+os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
+sys.path.append(os.path.normpath(os.getcwd() + "/.."))
+results = []
+_start = time()
+from django.conf import settings
+settings.DEBUG
+results.append(('settings', time() - _start, 0))
+settings.DEBUG = True
+from django.db import connection
+for name in sys.argv[1:]:
+    _queries = len(connection.queries)
+    _start = time()
+    __import__(name)
+    results.append((name, time() - _start,
+      len(connection.queries) - _queries))
+print json.dumps(results)
+'''
+
+
+if __name__ == "__main__":
+    args = PARSER.parse_args()
+
+    runs = {}
+    for _ in range(args.repeat):
+        _output = check_output([sys.executable, '-c', CHILD_SCRIPT]
+          + args.modules, cwd=os.path.dirname(os.path.abspath(__file__)))
+        for name, seconds, queries in json.loads(_output.splitlines()[-1]):
+            runs.setdefault(name, []).append((1000 * seconds, queries))
+
+    report = {}
+    for name in ['settings'] + args.modules:
+        _times = sorted(x[0] for x in runs[name])
+        report[name] = {'runs_ms': [round(x[0], 2) for x in runs[name]],
+          'median_ms': round(_times[len(_times) / 2], 2),
+          'queries': max(x[1] for x in runs[name])}
+
+    report['total_median_ms'] = round(sum(report[x]['median_ms']
+      for x in ['settings'] + args.modules), 2)
+
+    _json = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(_json + '\n')
+
+    else:
+        print _json
@@ -0,0 +1,475 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Project: Appraise evaluation system
+ Author: Christian Federmann <cfedermann@gmail.com>
+
+usage: python benchmark_wmt16.py
+               [-h] [--database DATABASE] [--users USERS] [--groups GROUPS]
+               [--projects PROJECTS] [--language-pairs LANGUAGE_PAIRS]
+               [--hits HITS] [--systems SYSTEMS] [--results RESULTS]
+               [--repeat REPEAT] [--seed SEED] [--output OUTPUT]
+
+Generates a synthetic WMT16 campaign into a scratch SQLite database and
+times the overview, HIT fetch and submit, annotation API submit, deferred
+task processing, status refresh, ranking cluster computation and all
+export paths on it.  Results are written as JSON, so that runs can be
+compared;  for every step, these contain the run times in milliseconds
+plus the number of queries and the database time.  The report also
+contains the EXPLAIN check of hot queries, see explain_wmt16_queries.py;
+to check a server database, run that script against it.
+
+Logging below WARNING is disabled while benchmarking, so that console
+output does not distort timings.  Ranking clusters require perl.
+
+optional arguments:
+  -h, --help            Show this help message and exit.
+  --database DATABASE   Scratch SQLite database file, replaced if it exists.
+  --users USERS         Number of annotators.
+  --groups GROUPS       Number of research groups.
+  --projects PROJECTS   Number of annotation projects.
+  --language-pairs LANGUAGE_PAIRS
+                        Number of language pairs.
+  --hits HITS           Number of HITs per project and language pair.
+  --systems SYSTEMS     Number of systems per ranking task.
+  --results RESULTS     Number of completed HITs per project and language
+                        pair.
+  --repeat REPEAT       Number of timed runs per step.
+  --seed SEED           Random seed for the synthetic campaign.
+  --output OUTPUT       JSON output file, defaults to standard output.
+
+"""
+from datetime import datetime, time as datetime_time
+from random import choice, randint, sample, seed, shuffle
+from tempfile import gettempdir
+from time import time
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+
+PARSER = argparse.ArgumentParser(description="Benchmarks WMT16 views on a " \
+  "synthetic campaign in a scratch SQLite database.")
+PARSER.add_argument("--database", action="store", dest="database",
+  default=os.path.join(gettempdir(), 'appraise-benchmark.db'),
+  help="Scratch SQLite database file, replaced if it exists.")
+PARSER.add_argument("--users", action="store", default=50, dest="users",
+  help="Number of annotators.", type=int)
+PARSER.add_argument("--groups", action="store", default=5, dest="groups",
+  help="Number of research groups.", type=int)
+PARSER.add_argument("--projects", action="store", default=2,
+  dest="projects", help="Number of annotation projects.", type=int)
+PARSER.add_argument("--language-pairs", action="store", default=3,
+  dest="language_pairs", help="Number of language pairs.", type=int)
+PARSER.add_argument("--hits", action="store", default=100, dest="hits",
+  help="Number of HITs per project and language pair.", type=int)
+PARSER.add_argument("--systems", action="store", default=5, dest="systems",
+  help="Number of systems per ranking task.", type=int)
+PARSER.add_argument("--results", action="store", default=30,
+  dest="results", help="Number of completed HITs per project and " \
+  "language pair.", type=int)
+PARSER.add_argument("--repeat", action="store", default=5, dest="repeat",
+  help="Number of timed runs per step.", type=int)
+PARSER.add_argument("--seed", action="store", default=None, dest="seed",
+  help="Random seed for the synthetic campaign.", type=int)
+PARSER.add_argument("--output", action="store", default=None,
+  dest="output", help="JSON output file, defaults to standard output.")
+
+# Each HIT contains this many ranking tasks, as assumed by the views.
+SEGMENTS_PER_HIT = 3
+
+# Consecutive segments share a document, so that context can be shown.
+SEGMENTS_PER_DOCUMENT = 10
+
+# Password of all synthetic users.
+BENCHMARK_PASSWORD = 'benchmark'
+
+# Rows per bulk_create() call.  Early Django 1.4 releases do not support
+# its batch_size argument;  batches keep SQLite below its limit of 999
+# parameters per query.
+BULK_CREATE_BATCH = 50
+
+# Vocabulary for synthetic source, reference and translation texts.
+WORDS = (u'the', u'house', u'is', u'small', u'big', u'and', u'green',
+  u'Häuser', u'sind', u'klein', u'groß', u'und', u'grün', u'cat', u'dog',
+  u'was', u'running', u'quickly', u'over', u'a', u'bridge', u'river',
+  u'Straße', u'über', u'eine', u'Brücke', u'Fluss', u'city', u'council',
+  u'decided', u'yesterday', u'to', u'build', u'new', u'school', u'€')
+
+
+def bulk_create(model, objects):
+    """
+    Inserts the given model instances in batches of BULK_CREATE_BATCH.
+    """
+    for i in range(0, len(objects), BULK_CREATE_BATCH):
+        model.objects.bulk_create(objects[i:i+BULK_CREATE_BATCH])
+
+
+def random_sentence(min_words=5, max_words=30):
+    """
+    Returns a random sentence built from WORDS.
+    """
+    return u' '.join([choice(WORDS) for _ in
+      range(randint(min_words, max_words))])
+
+
+def synthetic_hit_xml(block_id, language_pair, first_segment, systems,
+  systems_per_task):
+    """
+    Returns XML for a synthetic HIT with SEGMENTS_PER_HIT segments.
+
+    Each segment contains translations by systems_per_task random systems.
+
+    """
+    _source, _target = language_pair.split('2')
+    _hit = Element('hit', {'block-id': str(block_id),
+      'source-language': _source, 'target-language': _target})
+    for segment_id in range(first_segment, first_segment + SEGMENTS_PER_HIT):
+        _doc_id = 'doc{0}'.format(segment_id // SEGMENTS_PER_DOCUMENT)
+        _seg = SubElement(_hit, 'seg', {'doc-id': _doc_id})
+        SubElement(_seg, 'source', {'id': str(segment_id)}).text = \
+          random_sentence()
+        SubElement(_seg, 'reference').text = random_sentence()
+        for system in sample(systems, systems_per_task):
+            SubElement(_seg, 'translation', {'system': system}).text = \
+              random_sentence()
+
+    return tostring(_hit, encoding='utf-8').decode('utf-8')
+
+
+def generate_campaign(args):
+    """
+    Generates a synthetic campaign as configured by the given arguments.
+
+    Returns a dictionary containing the created users, projects and
+    language pairs, plus the number of created rows per model.
+
+    """
+    seed(args.seed)
+    language_pairs = [x[0] for x in LANGUAGE_PAIR_CHOICES[:args.language_pairs]]
+    systems = ['newstest2016.system-{0}'.format(x) for x in range(
+      2 * args.systems)]
+
+    wmt16_group = Group.objects.get_or_create(name='WMT16')[0]
+    research_groups = [Group.objects.get_or_create(name=x)[0]
+      for x in sorted(GROUP_HIT_REQUIREMENTS.keys())[:args.groups]]
+    language_groups = [Group.objects.get_or_create(name=x)[0]
+      for x in language_pairs]
+
+    # Users are created in bulk, sharing a single password hash.
+    _password = make_password(BENCHMARK_PASSWORD)
+    bulk_create(User, [User(username='user{0:05d}'.format(x),
+      email='user{0:05d}@example.org'.format(x), password=_password)
+      for x in range(args.users)])
+    users = list(User.objects.filter(username__startswith='user').order_by(
+      'username'))
+
+    # Every user knows one language pair, the first user knows all of them.
+    _memberships = []
+    for index, user in enumerate(users):
+        _groups = [wmt16_group, research_groups[index % len(research_groups)]]
+        if index == 0:
+            _groups.extend(language_groups)
+        else:
+            _groups.append(language_groups[index % len(language_groups)])
+        _memberships.extend([User.groups.through(user_id=user.id,
+          group_id=x.id) for x in _groups])
+    bulk_create(User.groups.through, _memberships)
+
+    projects = []
+    for project_index in range(args.projects):
+        project = Project.objects.create(name='Project-{0}'.format(
+          project_index))
+        bulk_create(Project.users.through, [Project.users.through(
+          project_id=project.id, user_id=x.id) for x in users])
+
+        _rows = []
+        for language_pair in language_pairs:
+            for hit_index in range(args.hits):
+                _rows.append((hit_index, language_pair, synthetic_hit_xml(
+                  hit_index, language_pair, hit_index * SEGMENTS_PER_HIT,
+                  systems, args.systems), False))
+        HIT.bulk_import(_rows, project)
+        projects.append(project)
+
+    # Completed HITs are annotated by users knowing their language pair.
+    _results = []
+    _hit_users = []
+    _completed = []
+    for project in projects:
+        for language_pair in language_pairs:
+            _annotators = [x for index, x in enumerate(users) if index == 0
+              or language_pairs[index % len(language_pairs)] == language_pair]
+            _hits = project.HITs.filter(language_pair=language_pair)
+            for index, hit in enumerate(_hits.order_by('id')[:args.results]):
+                user = _annotators[index % len(_annotators)]
+                for item in RankingTask.objects.filter(hit=hit):
+                    _ranks = [str(randint(1, 5)) for _ in item.translations]
+                    _results.append(RankingResult(item=item, user=user,
+                      duration=datetime_time(0, 0, randint(10, 59)),
+                      raw_result=u','.join(_ranks)))
+                _hit_users.append(HIT.users.through(hit_id=hit.id,
+                  user_id=user.id))
+                _completed.append(hit.id)
+
+    bulk_create(RankingResult, _results)
+    bulk_create(HIT.users.through, _hit_users)
+    for i in range(0, len(_completed), 500):
+        HIT.objects.filter(id__in=_completed[i:i+500]).update(completed=True,
+          finished=datetime.now())
+
+    counts = {}
+    for model in (User, Group, Project, HIT, RankingTask, RankingResult,
+      TextSegment):
+        counts[model.__name__] = model.objects.count()
+
+    return {'users': users, 'projects': projects,
+      'language_pairs': language_pairs, 'counts': counts}
+
+
+def summarize_runs(runs):
+    """
+    Returns minimum, median and maximum of the given run statistics.
+    """
+    _times = sorted([x['ms'] for x in runs])
+    _db_times = sorted([x['db_ms'] for x in runs])
+    return OrderedDict([
+      ('runs_ms', [round(x['ms'], 2) for x in runs]),
+      ('min_ms', round(_times[0], 2)),
+      ('median_ms', round(_times[len(_times) // 2], 2)),
+      ('max_ms', round(_times[-1], 2)),
+      ('median_db_ms', round(_db_times[len(_db_times) // 2], 2)),
+      ('queries', runs[-1]['queries']),
+    ])
+
+
+def time_step(name, func, repeat):
+    """
+    Runs func repeat times and returns its summarized run statistics.
+
+    If func returns a test client response, its query statistics as
+    recorded by RequestStatsMiddleware are used.  Errors are reported in
+    the result instead of aborting the benchmark.
+
+    """
+    runs = []
+    for _ in range(repeat):
+        try:
+            with record_query_stats() as _stats:
+                _start = time()
+                _result = func()
+                _duration = time() - _start
+
+        # pylint: disable-msg=W0703
+        except Exception, msg:
+            print >> sys.stderr, 'Step {0} failed: {1!r}'.format(name, msg)
+            return {'error': repr(msg)}
+
+        if _result is StopIteration:
+            break
+
+        _request_stats = getattr(_result, 'request_stats', None)
+        if _request_stats is not None:
+            _stats = {'queries': _request_stats['queries'],
+              'db_time': _request_stats['db_ms'] / 1000.0}
+
+            if _result.status_code >= 400:
+                return {'error': 'HTTP {0}'.format(_result.status_code)}
+
+        runs.append({'ms': 1000 * _duration, 'queries': _stats['queries'],
+          'db_ms': 1000 * _stats['db_time']})
+
+    if not runs:
+        return {'error': 'no runs, campaign exhausted'}
+
+    return summarize_runs(runs)
+
+
+def submit_next_item(client, user, project, language_pair, api=False):
+    """
+    Submits a random ranking for the next item of the user's current HIT.
+
+    If api is True, the ranking is sent to the annotation API instead of
+    the HIT handler.  Returns StopIteration if there is nothing left to
+    annotate.
+
+    """
+    hit = HIT.compute_next_task_for_user(user, project, language_pair)
+    if hit is None:
+        return StopIteration
+
+    _processed = RankingResult.objects.filter(user=user,
+      item__in=RankingTask.objects.filter(hit=hit)).order_by().values_list(
+      'item__pk', flat=True)
+    item = RankingTask.objects.filter(hit=hit).exclude(
+      pk__in=list(_processed)).order_by('id')[0]
+
+    _order = range(len(item.translations))
+    shuffle(_order)
+    _end = time()
+    data = {'item_id': item.id, 'order': ','.join([str(x) for x in _order]),
+      'start_timestamp': _end - 30, 'end_timestamp': _end,
+      'submit_button': 'SUBMIT'}
+    _ranks = [randint(1, 5) for _ in _order]
+    if api:
+        del data['submit_button']
+        data['ranks'] = _ranks
+        return client.post(reverse('appraise.wmt16.views.annotation_api',
+          kwargs={'hit_id': hit.hit_id}), json.dumps({'judgments': [data]}),
+          content_type='application/json')
+
+    for index, rank in enumerate(_ranks):
+        data['rank_{0}'.format(index)] = rank
+
+    return client.post(hit.get_absolute_url(), data)
+
+
+def export_results(project, method_name):
+    """
+    Exports completed results for project using the given export method.
+    """
+    queryset, _ = _export_results_for_project(RequestFactory().get('/'),
+      project)
+    return [getattr(x, method_name)() for x in
+      _iter_results_with_texts(queryset)]
+
+
+def export_ranking_xml(project):
+    """
+    Exports completed HITs for project in ranking XML format.
+    """
+    template = get_template('wmt16/result_export.xml')
+    _hits = HIT.objects.filter(completed=True, project=project)
+    return template.render(Context({'tasks': [x.export_to_xml()
+      for x in _hits]}))
+
+
+def run_benchmark(campaign, repeat):
+    """
+    Times all benchmark steps on the given campaign.
+
+    Returns a dictionary mapping step names to their run statistics.
+
+    """
+    user = campaign['users'][0]
+    project = campaign['projects'][0]
+    language_pair = campaign['language_pairs'][0]
+
+    client = Client()
+    if not client.login(username=user.username, password=BENCHMARK_PASSWORD):
+        raise ValueError('Could not log in as {0}'.format(user.username))
+
+    _prefix = '/{0}wmt16/'.format(DEPLOYMENT_PREFIX)
+    steps = OrderedDict()
+    steps['overview'] = lambda: client.get(_prefix)
+    steps['next_task'] = lambda: HIT.compute_next_task_for_user(user, project,
+      language_pair)
+    steps['next_item'] = lambda: _find_next_item_to_process(
+      RankingTask.objects.filter(hit=HIT.compute_next_task_for_user(user,
+      project, language_pair)), user)
+    steps['hit_fetch'] = lambda: client.get(HIT.compute_next_task_for_user(
+      user, project, language_pair).get_absolute_url())
+    steps['hit_submit'] = lambda: submit_next_item(client, user, project,
+      language_pair)
+    steps['api_submit'] = lambda: submit_next_item(client, user, project,
+      language_pair, api=True)
+    steps['process_tasks'] = process_tasks
+    steps['status_refresh'] = lambda: client.get(
+      '{0}update-status/'.format(_prefix))
+    steps['status'] = lambda: client.get('{0}status/'.format(_prefix))
+    steps['ranking_clusters'] = _compute_ranking_clusters
+    steps['export_pairwise_csv'] = lambda: export_results(project,
+      'export_to_pairwise_csv')
+    steps['export_ranking_csv'] = lambda: export_results(project,
+      'export_to_csv')
+    steps['export_ranking_xml'] = lambda: export_ranking_xml(project)
+
+    results = OrderedDict()
+    for name, func in steps.items():
+        results[name] = time_step(name, func, repeat)
+        print >> sys.stderr, '{0}: {1}'.format(name, results[name].get(
+          'median_ms', results[name].get('error')))
+
+    return results
+
+
+if __name__ == "__main__":
+    args = PARSER.parse_args()
+
+    # Properly set DJANGO_SETTINGS_MODULE environment variable.
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
+    PROJECT_HOME = os.path.normpath(os.getcwd() + "/..")
+    sys.path.append(PROJECT_HOME)
+
+    # The scratch database has to be configured before django.db is used.
+    from django.conf import settings
+    settings.DATABASES['default'] = {'ENGINE': 'django.db.backends.sqlite3',
+      'NAME': args.database}
+    if hasattr(settings, 'ALLOWED_HOSTS'):
+        settings.ALLOWED_HOSTS = ['testserver']
+    settings.DEBUG = False
+
+    if os.path.exists(args.database):
+        os.remove(args.database)
+
+    logging.disable(logging.INFO)
+
+    from django.core.management import call_command
+    call_command('syncdb', interactive=False, verbosity=0)
+
+    # We have just added appraise to the system path list, hence this works.
+    from collections import OrderedDict
+    from xml.etree.ElementTree import Element, SubElement, tostring
+    from django import get_version
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import Group, User
+    from django.core.urlresolvers import reverse
+    from django.template import Context
+    from django.template.loader import get_template
+    from django.test.client import Client, RequestFactory
+    from appraise.middleware import record_query_stats
+    from appraise.settings import COMMIT_TAG, DEPLOYMENT_PREFIX
+    from appraise.wmt16.models import GROUP_HIT_REQUIREMENTS, HIT, \
+      LANGUAGE_PAIR_CHOICES, Project, RankingResult, RankingTask, TextSegment
+    from appraise.wmt16.views import _compute_ranking_clusters, \
+      _export_results_for_project, _find_next_item_to_process, \
+      _iter_results_with_texts
+    from appraise.wmt16.tasks import process_tasks
+    from explain_wmt16_queries import check_hot_queries
+
+    _start = time()
+    campaign = generate_campaign(args)
+    _generation_seconds = time() - _start
+    print >> sys.stderr, 'Generated campaign in {0:.2f} seconds: {1}'.format(
+      _generation_seconds, campaign['counts'])
+
+    report = OrderedDict()
+    report['created'] = datetime.now().isoformat()
+    report['commit'] = COMMIT_TAG
+    report['python'] = platform.python_version()
+    report['django'] = get_version()
+    report['config'] = OrderedDict([(x, getattr(args, x)) for x in ('users',
+      'groups', 'projects', 'language_pairs', 'hits', 'systems', 'results',
+      'repeat', 'seed')])
+    report['campaign'] = campaign['counts']
+    report['generation_seconds'] = round(_generation_seconds, 3)
+    report['steps'] = run_benchmark(campaign, args.repeat)
+
+    _hit = campaign['projects'][0].HITs.filter(
+      language_pair=campaign['language_pairs'][0])[0]
+    report['explain'] = check_hot_queries(campaign['users'][0],
+      campaign['projects'][0], _hit, RankingTask.objects.filter(hit=_hit)[0],
+      _hit.language_pair)
+    for result in report['explain']:
+        print >> sys.stderr, 'explain {0}: {1}'.format(result['query'],
+          'OK' if result['passed'] else 'FAILED')
+
+    _output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(_output + '\n')
+
+    else:
+        print _output
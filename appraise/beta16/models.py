@@ -1,5 +1,5 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
 
 """
 
@@ -168,6 +168,40 @@ class AbsoluteScoringTask(models.Model):
         )
         return _unicode
 
+    @classmethod
+    def bulk_import(cls, tasks, batch_size=500):
+        """
+        Saves the given, unsaved AbsoluteScoringTask instances in bulk.
+
+        Tasks can be any iterable and are consumed in batches of batch_size
+        instances, one transaction per batch.  No MetaData is created, this
+        happens when a task gets assigned to a user.
+
+        Returns the number of imported tasks.
+        """
+        _imported = 0
+        _batch = []
+        for task in tasks:
+            _batch.append(task)
+            if len(_batch) >= batch_size:
+                _imported += cls._bulk_insert(_batch)
+                _batch = []
+
+        if _batch:
+            _imported += cls._bulk_insert(_batch)
+
+        return _imported
+
+    @classmethod
+    def _bulk_insert(cls, tasks):
+        """
+        Inserts a batch of AbsoluteScoringTask instances in one transaction.
+        """
+        with transaction.commit_on_success():
+            cls.objects.bulk_create(tasks)
+
+        return len(tasks)
+
 
 class AbsoluteScoringData(models.Model):
     """
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Project: Appraise evaluation system
+ Author: Christian Federmann <cfedermann@gmail.com>
+
+usage: python compress_xml_fields.py
+               [-h] [--app {wmt13,wmt14,wmt15,wmt16}]
+               [--batch-size BATCH_SIZE] [--decompress] [--dry-run]
+
+Converts existing hit_xml, item_xml and raw_result values to compressed
+storage, see appraise.fields.CompressedTextField.  Rows are converted in
+batches, one transaction per batch, so the conversion can be interrupted
+and resumed at any time.  Reports bytes saved and the change in latency
+for fetching and decompressing each batch.
+
+optional arguments:
+  -h, --help            Show this help message and exit.
+  --app {wmt13,wmt14,wmt15,wmt16}
+                        Application whose models should be converted.
+  --batch-size BATCH_SIZE
+                        Number of rows per transaction.
+  --decompress          Convert compressed values back to plain text.
+  --dry-run             Enable dry run to only report the effect.
+
+"""
+from time import time
+import argparse
+import os
+import sys
+
+PARSER = argparse.ArgumentParser(description="Converts existing hit_xml, " \
+  "item_xml and raw_result values to compressed storage.")
+PARSER.add_argument("--app", action="store", default="wmt16",
+  choices=('wmt13', 'wmt14', 'wmt15', 'wmt16'), dest="app",
+  help="Application whose models should be converted.")
+PARSER.add_argument("--batch-size", action="store", default=500,
+  dest="batch_size", help="Number of rows per transaction.", type=int)
+PARSER.add_argument("--decompress", action="store_true", default=False,
+  dest="decompress", help="Convert compressed values back to plain text.")
+PARSER.add_argument("--dry-run", action="store_true", default=False,
+  dest="dry_run_enabled", help="Enable dry run to only report the effect.")
+
+# Model and field names of CompressedTextField instances per application.
+COMPRESSED_FIELDS = (
+  ('HIT', 'hit_xml'),
+  ('RankingTask', 'item_xml'),
+  ('RankingResult', 'raw_result'),
+)
+
+
+def time_fetch(model, field_name, ids):
+    """
+    Returns seconds needed to fetch and decompress field values for ids.
+    """
+    _start = time()
+    _values = model.objects.filter(id__in=ids).values_list(field_name,
+      flat=True)
+    for _value in _values:
+        decompress_text(_value)
+    return time() - _start
+
+
+def convert_field(model, field_name, batch_size, decompress=False,
+  dry_run=False):
+    """
+    Converts all values of the given model field in batches.
+
+    Rows are updated using raw SQL, so that values are stored exactly as
+    converted here, independent of the COMPRESS_TEXT_FIELDS setting.
+
+    Returns a dictionary containing conversion statistics.
+
+    """
+    _table = connection.ops.quote_name(model._meta.db_table)
+    _column = connection.ops.quote_name(model._meta.get_field(
+      field_name).column)
+    _sql = 'UPDATE {0} SET {1} = %s WHERE id = %s'.format(_table, _column)
+
+    stats = {'rows': 0, 'converted': 0, 'bytes_before': 0, 'bytes_after': 0,
+      'seconds_before': 0.0, 'seconds_after': 0.0, 'batches': 0}
+
+    _last_id = 0
+    while True:
+        _rows = model.objects.filter(id__gt=_last_id).order_by('id')
+        _rows = list(_rows.values_list('id', field_name)[:batch_size])
+        if not _rows:
+            break
+
+        _last_id = _rows[-1][0]
+        _ids = [x[0] for x in _rows]
+        _seconds = time_fetch(model, field_name, _ids)
+        stats['seconds_before'] += _seconds
+
+        _updates = []
+        for _id, _value in _rows:
+            if decompress:
+                _new_value = decompress_text(_value)
+            else:
+                _new_value = compress_text_if_smaller(_value)
+
+            stats['bytes_before'] += len(_value.encode('utf-8'))
+            stats['bytes_after'] += len(_new_value.encode('utf-8'))
+            if _new_value != _value:
+                _updates.append((_new_value, _id))
+
+        if _updates and not dry_run:
+            with transaction.commit_on_success():
+                connection.cursor().executemany(_sql, _updates)
+                transaction.set_dirty()
+
+            _seconds = time_fetch(model, field_name, _ids)
+
+        stats['seconds_after'] += _seconds
+
+        stats['rows'] += len(_rows)
+        stats['converted'] += len(_updates)
+        stats['batches'] += 1
+
+    return stats
+
+
+def print_field_stats(name, stats):
+    """
+    Prints conversion statistics for the given field name.
+    """
+    _before = stats['bytes_before']
+    _after = stats['bytes_after']
+    _saved = 100.0 * (_before - _after) / (_before or 1)
+    _batches = stats['batches'] or 1
+    print '{0}: converted {1} of {2} rows, {3} -> {4} bytes, ' \
+      '{5:.1f}% saved'.format(name, stats['converted'], stats['rows'],
+      _before, _after, _saved)
+    print '{0}: fetch latency {1:.2f} ms -> {2:.2f} ms per batch'.format(
+      name, 1000 * stats['seconds_before'] / _batches,
+      1000 * stats['seconds_after'] / _batches)
+
+
+if __name__ == "__main__":
+    args = PARSER.parse_args()
+
+    # Properly set DJANGO_SETTINGS_MODULE environment variable.
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
+    PROJECT_HOME = os.path.normpath(os.getcwd() + "/..")
+    sys.path.append(PROJECT_HOME)
+
+    # We have just added appraise to the system path list, hence this works.
+    from django.db import connection, transaction
+    from django.db.models import get_model
+    from appraise.fields import compress_text_if_smaller, decompress_text
+    from appraise.settings import COMPRESS_TEXT_FIELDS
+
+    if not args.decompress and not COMPRESS_TEXT_FIELDS:
+        print 'Note: COMPRESS_TEXT_FIELDS is disabled, new rows will be ' \
+          'stored uncompressed.'
+
+    _total_before = 0
+    _total_after = 0
+    for model_name, field_name in COMPRESSED_FIELDS:
+        model = get_model(args.app, model_name)
+        if model is None:
+            print 'Application {0} is not installed, skipping {1}.'.format(
+              args.app, model_name)
+            continue
+
+        _name = '{0}.{1}.{2}'.format(args.app, model_name, field_name)
+        stats = convert_field(model, field_name, args.batch_size,
+          args.decompress, args.dry_run_enabled)
+        print_field_stats(_name, stats)
+
+        _total_before += stats['bytes_before']
+        _total_after += stats['bytes_after']
+
+    print 'Total: {0} -> {1} bytes, {2} bytes saved{3}.'.format(_total_before,
+      _total_after, _total_before - _total_after,
+      ' (dry run)' if args.dry_run_enabled else '')
@@ -1,12 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
+import re
 import sys
 import math
 import random
 import hashlib
 import argparse
+import resource
+from collections import defaultdict
+from itertools import izip_longest
 from random import shuffle
+from time import time
 
 PARSER = argparse.ArgumentParser(description="Build evaluation task input file.")
 PARSER.add_argument('-seed', type=int, default=None, help='random seed')
@@ -28,6 +33,11 @@ PARSER.add_argument('-no-sequential', dest='sequential', default=True, action='s
 PARSER.add_argument('-controls', type=str, default=None, dest="controlFile", help='file containing controls to use (implies -no-sequential)')
 PARSER.add_argument('-control_prob', type=float, default=1.0, dest="control_prob", help='probability of inserting a control into a HIT')
 PARSER.add_argument('-save', type=str, default=None, dest="saveDir", help='directory to save reduced corpora to')
+PARSER.add_argument('-benchmark', default=False, action='store_true', help='print timing and peak memory to stderr')
+
+# Precompiled, as cleanup_translation() is called for every candidate.
+WHITESPACE_PATTERN = re.compile(r'\s{2,}')
+
 
 def cleanup_translation(input_str):
     """
@@ -35,137 +45,185 @@ def cleanup_translation(input_str):
 
     Removes superfluous whitespace.
     """
-    import re
-    whitespace = re.compile('\s{2,}')
-    cleaned_str = whitespace.sub(' ', input_str)
+    cleaned_str = WHITESPACE_PATTERN.sub(' ', input_str)
     return cleaned_str
 
 
+def iter_aligned_lines(files):
+    """
+    Yields tuples of raw lines from the given line-aligned files.
+
+    Raises ValueError naming the first file which has fewer lines.
+    """
+    for lines in izip_longest(*files):
+        if None in lines:
+            short_file = files[list(lines).index(None)]
+            raise ValueError('%s has fewer lines than %s' % (short_file.name,
+              files[0].name))
+        yield lines
+
+
+def dump_file_name(name):
+    """
+    Returns the file name to dump the given file to, None if it exists.
+    """
+    outfile = os.path.join(args.saveDir, os.path.basename(name))
+    if os.path.exists(outfile):
+        return None
+    sys.stderr.write('DUMPING TO %s\n' % (outfile))
+    return outfile
+
+
 def dump_system(system_file, lines):
     """
     Dump lines to file.
     """
-    outfile = os.path.join(args.saveDir, os.path.basename(system_file))
-    if not os.path.exists(outfile):
-        sys.stderr.write('DUMPING TO %s\n' % (outfile))
+    outfile = dump_file_name(system_file)
+    if outfile is not None:
         out = open(outfile, 'w')
         for line in lines:
             out.write(u'{0}\n'.format(line).encode('utf-8'))
         out.close()
 
 
+def find_eligible_ids(source_file, parallel_files, valid_ids, maxlen):
+    """
+    Returns the list of eligible, zero-based line numbers in source_file.
+
+    Lines are eligible if they have at most maxlen tokens and their one-based
+    line number is contained in the set valid_ids;  valid_ids=None accepts
+    all lines.  Streams all files once, checking that they are line-aligned.
+    """
+    eligible = []
+    files = [source_file] + parallel_files
+    for i, lines in enumerate(iter_aligned_lines(files)):
+        if valid_ids is not None and not i+1 in valid_ids:
+            continue
+        if len(lines[0].decode("utf8").strip().split()) <= maxlen:
+            eligible.append(i)
+    return eligible
+
+
+def collect_segments(source_file, reference_file, system_files, eligible,
+  dump_files=None):
+    """
+    Collects reference and deduplicated system outputs for eligible lines.
+
+    Streams all files once and returns a dictionary mapping eligible line
+    numbers to (reference, groups) tuples, where groups is a list of
+    (system_ids, translation) tuples for unique translations.  If given,
+    dump_files maps file positions to open files to save all lines to.
+    """
+    eligible = set(eligible)
+    segments = {}
+    files = [source_file, reference_file] + system_files
+    for i, lines in enumerate(iter_aligned_lines(files)):
+        if dump_files:
+            for j, out in dump_files.items():
+                out.write(u'{0}\n'.format(lines[j].decode("utf8").strip()).encode('utf-8'))
+
+        if not i in eligible:
+            continue
+
+        # We need to avoid duplicate candidate translations.  To do so, we
+        # map unique translations to system IDs, this differs per segment.
+        unique_translations_to_system_ids_map = defaultdict(list)
+        translations = {}
+        for system_id, line in enumerate(lines[2:]):
+            current_translation = line.decode("utf8").strip()
+            cleaned_translation = cleanup_translation(current_translation)
+            unique_translations_to_system_ids_map[cleaned_translation].append(system_id)
+            translations.setdefault(cleaned_translation, current_translation)
+
+        groups = [(system_ids, translations[key]) for key, system_ids
+          in unique_translations_to_system_ids_map.items()]
+        segments[i] = (lines[1].decode("utf8").strip(), groups)
+    return segments
+
+
 if __name__ == "__main__":
     args = PARSER.parse_args()
+    start_time = time()
 
     # Initialize random number generator with given seed
     if args.seed is not None:
         random.seed(args.seed)
 
-    # Load source data
-    source = []
-    for line in args.source:
-        source.append(line.decode("utf8").strip())
-
-    # Load reference data
-    reference = []
-    if args.reference:
-        for line in args.reference:
-            reference.append(line.decode("utf8").strip())
-
-    if len(reference) != len(source):
-        sys.stderr.write('* FATAL: reference length (%d) != source length (%d)\n' % (len(source), len(reference)))
+    if args.reference is None:
+        sys.stderr.write('* FATAL: reference file required\n')
         sys.exit(1)
 
-    valid_ids = []
-    for line in args.idsfile:
-        valid_ids.append(int(line))
-
-    # Load systems data
-    systems = []
-    system_names = []
-    if len(args.system):
-        for i, system in enumerate(args.system):
-            systems.append([])
-            system_name = os.path.basename(system.name)
-            system_names.append(system_name)
-            for line in system:
-                systems[i].append(line.decode("utf8").strip())
-
-            if len(systems[i]) != len(source):
-                sys.stderr.write('* FATAL: system %s length (%d) != source length (%d)\n' % (system_name, len(source), len(reference)))
-                sys.exit(1)
+    # Set membership makes this O(1) per source line.
+    valid_ids = None
+    if args.idsfile is not None:
+        valid_ids = set(int(line) for line in args.idsfile)
 
+    system_names = [os.path.basename(x.name) for x in args.system]
     system_hashes = [hashlib.sha1(x).hexdigest() for x in system_names]
 
-    # Make a list of all eligible sentences
-    eligible = []
-    for i in range(len(source)):
-        if (len(source[i].split()) <= args.maxlen) and (i+1 in valid_ids):
-            eligible.append(i)
+    # First pass: make a list of all eligible sentences.
+    try:
+        eligible = find_eligible_ids(args.source, [args.reference] + args.system,
+          valid_ids, args.maxlen)
+    except ValueError, msg:
+        sys.stderr.write('* FATAL: %s\n' % msg)
+        sys.exit(1)
 
     # Save corpora if requested and not already existing
+    dump_files = {}
     if args.saveDir is not None:
         if not os.path.exists(args.saveDir):
             os.makedirs(args.saveDir)
-        dump_system(args.source.name, source)
-        dump_system(args.reference.name, reference)
-        for i,system in enumerate(args.system):
-            dump_system(system.name, systems[i])
+        for j, _file in enumerate([args.source, args.reference] + args.system):
+            outfile = dump_file_name(_file.name)
+            if outfile is not None:
+                dump_files[j] = open(outfile, 'w')
         dump_system('line_numbers', [x + 1 for x in eligible])
 
-    shuffle(eligible)
-    all_tasks = []
+    # Second pass: collect segment data for eligible sentences only.
+    for _file in [args.source, args.reference] + args.system:
+        _file.seek(0)
+    segments = collect_segments(args.source, args.reference, args.system,
+      eligible, dump_files)
+    for out in dump_files.values():
+        out.close()
 
-    # We need to avoid duplicate candidate translations.  To do so, we have to check
-    # which systems have identical translations -- this may be different across tasks.
-    # Hence, our random selection of system IDs might be different inside a HIT.
-    #
-    # To implement this, we loop over all sentence IDs.
-    tasks = []
+    shuffle(eligible)
 
+    # Our random selection of system IDs might be different inside a HIT;
+    # segments are written to the output file one by one.
+    out = open(args.output, 'w')
+    out.write('<segments>\n')
+    number_of_segments = 0
     for current_id in eligible:
-        from collections import defaultdict
-        unique_translations_to_system_ids_map = defaultdict(list)
+        reference_text, groups = segments[current_id]
 
-        # Then we iterate over all systems and map unique translations to system IDs.
-        for system_id in range(len(systems)):
-            try:
-                current_translation = cleanup_translation(systems[system_id][eligible[current_id]])
-                unique_translations_to_system_ids_map[current_translation].append(system_id)
-            except:
-                continue
-
-        # To randomize the selection of systems, we have to generate the list of unique translations.
-        # Note that this may result in less than five translation candidates...
-        deduped_system_ids = [x for x in unique_translations_to_system_ids_map.values()]
-        deduped_system_indexes = range(len(deduped_system_ids))
+        # To randomize the selection of systems, we shuffle the unique
+        # translations.  This may result in less than five candidates...
+        deduped_system_indexes = range(len(groups))
         random.shuffle(deduped_system_indexes)
-        # Don't constrain number of systems...
-        #deduped_system_indexes = deduped_system_indexes[:args.systemspertask]
 
-        deduped_system_names = []
-        deduped_system_output = []
         for deduped_id in deduped_system_indexes:
-            deduped_system_names.append(u','.join([system_names[system_id] for system_id in deduped_system_ids[deduped_id]]))
-            system_id = deduped_system_ids[deduped_id][0]
-            deduped_system_output.append(systems[system_id][eligible[current_id]])
-
-        try:
-            reference_text = reference[eligible[current_id]]
-        except:
-            continue
-
-        for deduped_system_name, deduped_candidate_text in zip(deduped_system_names, deduped_system_output):
-            tasks.append(
+            system_ids, deduped_candidate_text = groups[deduped_id]
+            deduped_system_name = u','.join([system_names[x] for x in system_ids])
+            if number_of_segments > 0:
+                out.write('\n')
+            out.write(
               u'<segment id="{0}" source-language="{1}" target-language="{2}">\n' \
               u'  <system-id>{3}</system-id>\n  <reference>{4}</reference>\n' \
               u'  <candidate>{5}</candidate>\n</segment>'.format(current_id,
                 args.sourceLang, args.targetLang, deduped_system_name,
-                reference_text, deduped_candidate_text)
+                reference_text, deduped_candidate_text).encode('utf-8')
             )
+            number_of_segments += 1
 
-    result_xml = u'<segments>\n{0}\n</segments>'.format(u'\n'.join(tasks))
-
-    out = open(args.output, 'w')
-    out.write(result_xml.encode('utf-8'))
+    out.write('\n</segments>')
     out.close()
+
+    if args.benchmark:
+        duration = time() - start_time
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        sys.stderr.write('%d eligible lines, %d segments in %.2f seconds, '
+          '%.1f segments/s, peak memory %d KB\n' % (len(eligible),
+          number_of_segments, duration, number_of_segments / (duration or 1),
+          peak_memory))
@@ -14,6 +14,7 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models import F
 from django.template import Context
 from django.template.loader import get_template
 
@@ -252,21 +253,14 @@ class EvaluationTask(models.Model):
         
         return _header
     
-    def get_status_for_user(self, user=None):
+    @staticmethod
+    def format_status(done, items, average_duration):
         """
-        Returns the status information with respect to the given user.
+        Returns status information for the given number of done/total items.
         """
-        # pylint: disable-msg=E1101
-        _task_type = self.get_task_type_display()
         _status = []
-        
-        # Compute completion status for this task and the given user.
-        _items = EvaluationItem.objects.filter(task=self).count()
-        _done = EvaluationResult.objects.filter(user=user,
-          item__task=self).count()
-        
-        _status.append('{0}/{1}'.format(_done, _items))
-        _percentage = 100*_done/float(_items or 1)
+        _status.append('{0}/{1}'.format(done, items))
+        _percentage = 100*done/float(items or 1)
         _status.append(_percentage)
         if _percentage < 33:
             _status.append(' progress-danger')
@@ -275,14 +269,38 @@ class EvaluationTask(models.Model):
         else:
             _status.append(' progress-success')
         
-        # Compute average duration for this task and the given user.
-        _results = EvaluationResult.objects.filter(user=user, item__task=self)
-        _durations = _results.values_list('duration', flat=True)
+        _status.append('{:.2f} sec'.format(average_duration))
+        return _status
+    
+    def get_counters_for_user(self, user=None):
+        """
+        Returns [done, duration_sum, duration_count] for the given user.
+        
+        Durations are summed in seconds;  empty durations are not counted.
+        
+        """
+        _durations = EvaluationResult.objects.filter(user=user,
+          item__task=self).values_list('duration', flat=True)
+        _durations = list(_durations)
+        _done = len(_durations)
         
         _durations = [datetime_to_seconds(d) for d in _durations if d]
-        _average_duration = sum(_durations) / (float(len(_durations)) or 1)
+        return [_done, sum(_durations), len(_durations)]
+    
+    def get_status_for_user(self, user=None):
+        """
+        Returns the status information with respect to the given user.
+        """
+        # pylint: disable-msg=E1101
+        _task_type = self.get_task_type_display()
+        
+        # Compute completion status and average duration for this task and
+        # the given user.
+        _items = EvaluationItem.objects.filter(task=self).count()
+        _done, _duration_sum, _duration_count = self.get_counters_for_user(user)
+        _average_duration = _duration_sum / (float(_duration_count) or 1)
         
-        _status.append('{:.2f} sec'.format(_average_duration))
+        _status = self.format_status(_done, _items, _average_duration)
         
         # We could add task type specific status information here.
         if _task_type == 'Quality Checking':
@@ -306,41 +324,44 @@ class EvaluationTask(models.Model):
         """
         Returns the status information with respect to all users.
         """
-        _status = []
-        
         # Compute completion status for this task and all possible users.
         _items = EvaluationItem.objects.filter(task=self).count()
-        _done = []
-        
-        for user in self.users.all():
-            _done.append(EvaluationResult.objects.filter(user=user,
-              item__task=self).count())
+        _counters = [self.get_counters_for_user(x) for x in self.users.all()]
         
         # Minimal number of completed items counts here.
-        _status.append('{0}/{1}'.format(min(_done or [0]), _items))
-        _percentage = 100*min(_done or [0])/float(_items or 1)
-        _status.append(_percentage)
-        if _percentage < 33:
-            _status.append(' progress-danger')
-        elif _percentage < 66:
-            _status.append(' progress-warning')
-        else:
-            _status.append(' progress-success')
+        _done = min([x[0] for x in _counters] or [0])
         
         # Compute average duration for this task and all possible users.
-        _durations = []
-
-        for user in self.users.all():
-            _results = EvaluationResult.objects.filter(user=user,
-              item__task=self)
-            _durations.extend(_results.values_list('duration', flat=True))
+        _duration_sum = sum([x[1] for x in _counters])
+        _duration_count = sum([x[2] for x in _counters])
+        _average_duration = _duration_sum / (float(_duration_count) or 1)
         
-        _durations = [datetime_to_seconds(d) for d in _durations if d]
-        _average_duration = sum(_durations) / (float(len(_durations)) or 1)
+        return self.format_status(_done, _items, _average_duration)
+    
+    def get_result_matrix(self, users=None):
+        """
+        Returns (item_ids, matrix) with matrix[item_id][user_id] = raw_result.
         
-        _status.append('{:.2f} sec'.format(_average_duration))
+        All results for this task are fetched in a single query;  item_ids
+        keeps the default item order.  If users is given, results from other
+        users are ignored.  Only the first result per (item, user) is kept.
         
-        return _status
+        """
+        _item_ids = list(EvaluationItem.objects.filter(task=self).values_list(
+          'id', flat=True))
+        
+        _results = EvaluationResult.objects.filter(item__task=self)
+        if users is not None:
+            _results = _results.filter(user__in=[x.id for x in users])
+        
+        _matrix = {}
+        for _item_id, _user_id, _raw_result in _results.values_list(
+          'item_id', 'user_id', 'raw_result'):
+            _cells = _matrix.setdefault(_item_id, {})
+            if not _cells.has_key(_user_id):
+                _cells[_user_id] = _raw_result
+        
+        return (_item_ids, _matrix)
     
     def is_finished_for_user(self, user=None):
         """
@@ -569,33 +590,44 @@ class EvaluationResult(models.Model):
         """
         return u'<evaluation-result id="{0}">'.format(self.id)
     
-    def reload_dynamic_fields(self):
+    @staticmethod
+    def parse_raw_result(raw_result, task_type):
         """
-        Reloads source, reference, and translations from self.item_xml.
+        Returns the dynamic results for raw_result given a task type display.
         """
-        if self.raw_result and self.raw_result != 'SKIPPED':
-            _task_type = self.item.task.get_task_type_display()
+        results = None
+        if raw_result and raw_result != 'SKIPPED':
             try:
-                if _task_type == 'Quality Checking':
-                    self.results = self.raw_result
+                if task_type == 'Quality Checking':
+                    results = raw_result
                 
-                elif _task_type == 'Ranking':
-                    self.results = self.raw_result.split(',')
-                    self.results = [int(x) for x in self.results]
+                elif task_type == 'Ranking':
+                    results = raw_result.split(',')
+                    results = [int(x) for x in results]
                 
-                elif _task_type == 'Post-editing':
-                    self.results = self.raw_result.split('\n')
+                elif task_type == 'Post-editing':
+                    results = raw_result.split('\n')
                 
-                elif _task_type == 'Error classification':
-                    self.results = self.raw_result.split('\n')
-                    self.results = [x.split('=') for x in self.results]
+                elif task_type == 'Error classification':
+                    results = raw_result.split('\n')
+                    results = [x.split('=') for x in results]
                 
-                elif _task_type == '3-Way Ranking':
-                    self.results = self.raw_result
+                elif task_type == '3-Way Ranking':
+                    results = raw_result
             
             # pylint: disable-msg=W0703
             except Exception, msg:
-                self.results = msg
+                results = msg
+        
+        return results
+    
+    def reload_dynamic_fields(self):
+        """
+        Reloads source, reference, and translations from self.item_xml.
+        """
+        if self.raw_result and self.raw_result != 'SKIPPED':
+            _task_type = self.item.task.get_task_type_display()
+            self.results = self.parse_raw_result(self.raw_result, _task_type)
     
     def export_to_xml(self):
         """
@@ -775,15 +807,126 @@ class EvaluationResult(models.Model):
         
         return template.render(Context(context))
 
+class EvaluationTaskCounters(models.Model):
+    """
+    Evaluation Task Counters object model.
+    
+    Counts the results of a user for a task and sums up their durations in
+    seconds, so that status information can be updated without re-reading
+    all results.  Counters are kept in the database, hence all processes
+    see the same values.
+    
+    """
+    task = models.ForeignKey(
+      EvaluationTask,
+      db_index=True
+    )
+    
+    user = models.ForeignKey(
+      User,
+      db_index=True
+    )
+    
+    done = models.IntegerField(default=0, editable=False)
+    duration_sum = models.FloatField(default=0.0, editable=False)
+    duration_count = models.IntegerField(default=0, editable=False)
+    
+    class Meta:
+        """
+        Metadata options for the EvaluationTaskCounters object model.
+        """
+        unique_together = ('task', 'user')
+        verbose_name = "EvaluationTaskCounters object"
+        verbose_name_plural = "EvaluationTaskCounters objects"
+    
+    def __unicode__(self):
+        """
+        Returns a Unicode String for this EvaluationTaskCounters object.
+        """
+        return u'<evaluation-task-counters id="{0}">'.format(self.id)
+    
+    @classmethod
+    def get_counters_for_users(cls, task, users):
+        """
+        Returns {user id: [done, duration_sum, duration_count]} for users.
+        
+        Missing counters are derived from the results of the user, see
+        EvaluationTask.get_counters_for_user(), and stored.
+        
+        """
+        _counters = {}
+        _values = cls.objects.filter(task=task, user__in=users).values_list(
+          'user', 'done', 'duration_sum', 'duration_count')
+        for _user_id, _done, _duration_sum, _duration_count in _values:
+            _counters[_user_id] = [_done, _duration_sum, _duration_count]
+        
+        for user in users:
+            if _counters.has_key(user.id):
+                continue
+            
+            _done, _duration_sum, _duration_count = \
+              task.get_counters_for_user(user)
+            _object, _created = cls.objects.get_or_create(task=task,
+              user=user, defaults={'done': _done,
+              'duration_sum': _duration_sum,
+              'duration_count': _duration_count})
+            _counters[user.id] = [_object.done, _object.duration_sum,
+              _object.duration_count]
+        
+        return _counters
+    
+    @classmethod
+    def add_result(cls, task, user, seconds):
+        """
+        Counts a new result for task and user taking the given seconds.
+        
+        The counters are incremented in the database;  if there are none
+        yet, they are derived from the results, including the new one, when
+        needed next.  Durations of None or zero seconds are not summed up.
+        
+        """
+        cls.objects.filter(task=task, user=user).update(done=F('done') + 1,
+          duration_sum=F('duration_sum') + (seconds or 0),
+          duration_count=F('duration_count') + (1 if seconds else 0))
+    
+    @classmethod
+    def reset(cls, task, user):
+        """
+        Deletes the counters for task and user, to be derived again.
+        """
+        cls.objects.filter(task=task, user=user).delete()
+
+
 @receiver(models.signals.post_save, sender=EvaluationResult)
 def update_task_cache(sender, instance, created, **kwargs):
     """
     Updates the APPRAISE_TASK_CACHE for the given EvaluationResult.
+    
+    The EvaluationTaskCounters for the result's task and user are updated
+    in O(1), the cached status information for all task users is derived
+    from these.
+    
     """
-    from appraise.evaluation.views import _update_task_cache
+    from appraise.evaluation.views import _update_task_caches, \
+      _update_task_counters
     
     _task = instance.item.task
-    for _user in _task.users.all():
-        _update_task_cache(_task, _user)
+    _update_task_counters(_task, instance.user, instance.duration, created)
+    _update_task_caches(_task)
+    
+    # TODO: extend this code to also update cache for staff users!
+
+
+@receiver(models.signals.post_delete, sender=EvaluationResult)
+def reset_task_counters(sender, instance, **kwargs):
+    """
+    Resets the EvaluationTaskCounters for the deleted EvaluationResult.
+    """
+    from appraise.evaluation.views import _reset_task_counters
+    
+    try:
+        _reset_task_counters(instance.item.task, instance.user)
     
-    # TODO: extend this code to also update cache for staff users!
\ No newline at end of file
+    except (EvaluationItem.DoesNotExist, EvaluationTask.DoesNotExist,
+      User.DoesNotExist):
+        pass
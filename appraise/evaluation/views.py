@@ -6,9 +6,10 @@ Project: Appraise evaluation system
 import logging
 
 from collections import Counter
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from random import randint, seed, shuffle
 from time import mktime
+import re
 
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
@@ -19,8 +20,10 @@ from django.template.defaultfilters import slugify
 from django.template.loader import get_template
 
 from appraise.evaluation.models import APPRAISE_TASK_TYPE_CHOICES, \
-  EvaluationTask, EvaluationItem, EvaluationResult
-from appraise.settings import LOG_LEVEL, LOG_HANDLER, COMMIT_TAG
+  EvaluationTask, EvaluationItem, EvaluationResult, EvaluationTaskCounters
+from appraise.settings import LOG_LEVEL, LOG_HANDLER, COMMIT_TAG, \
+  CACHE_MAX_ENTRIES, CACHE_TIMEOUT
+from appraise.utils import BoundedCache, datetime_to_seconds
 
 # Setup logging support.
 logging.basicConfig(level=LOG_LEVEL)
@@ -31,29 +34,125 @@ LOGGER.addHandler(LOG_HANDLER)
 ERROR_CLASSES = ("terminology", "lexical_choice", "syntax", "insertion",
   "morphology", "misspelling", "punctuation", "other")
 
-APPRAISE_TASK_CACHE = {}
+# Task status information, keyed by (task_id, username).
+APPRAISE_TASK_CACHE = BoundedCache('evaluation.tasks',
+  max_size=CACHE_MAX_ENTRIES, timeout=CACHE_TIMEOUT)
 
+# Durations as assigned in _save_results(), i.e., str(datetime.timedelta).
+DURATION_PATTERN = re.compile(r'^(\d{1,2}):(\d{2}):(\d{2})(\.\d{1,6})?$')
 
-def _update_task_cache(task, user):
+
+def _duration_to_seconds(duration):
     """
-    Updates the APPRAISE_TASK_CACHE for the given user.
+    Converts the given EvaluationResult duration to seconds or None.
+    
+    Durations are assigned as String values in _save_results(), hence we
+    parse these "H:MM:SS[.ffffff]" values;  None is returned for values we
+    cannot parse, including durations of a day or more.
+    
     """
-    if not APPRAISE_TASK_CACHE.has_key(task.task_id):
-        APPRAISE_TASK_CACHE[task.task_id] = {}
+    if isinstance(duration, timedelta):
+        duration = str(duration)
     
-    _cache = APPRAISE_TASK_CACHE[task.task_id]
+    if isinstance(duration, basestring):
+        _match = DURATION_PATTERN.match(duration)
+        if _match is None or int(_match.group(1)) > 23:
+            return None
+        
+        _hours, _minutes, _seconds, _fraction = _match.groups()
+        return int(_hours) * 3600 + int(_minutes) * 60 + int(_seconds) \
+          + float(_fraction or 0)
+    
+    if duration is None:
+        return None
     
-    _task_data = {
-      'finished': task.is_finished_for_user(user),
+    return datetime_to_seconds(duration)
+
+
+def _update_task_counters(task, user, duration, created):
+    """
+    Updates the EvaluationTaskCounters for a saved EvaluationResult.
+    
+    New results are counted in O(1).  For updated results, we cannot know
+    the previous duration, so we reset the counters which will be derived
+    from the database when needed next.
+    
+    """
+    _seconds = _duration_to_seconds(duration)
+    if not created or (duration is not None and _seconds is None):
+        _reset_task_counters(task, user)
+        return
+    
+    EvaluationTaskCounters.add_result(task, user, _seconds)
+
+
+def _reset_task_counters(task, user):
+    """
+    Resets the EvaluationTaskCounters for the given task and user.
+    """
+    EvaluationTaskCounters.reset(task, user)
+
+
+def _compute_task_data(task, user, users, items, counters):
+    """
+    Computes the APPRAISE_TASK_CACHE data for the given user.
+    
+    Status information is derived from counters, as returned by
+    EvaluationTaskCounters.get_counters_for_users() for user and all users
+    working on the task.
+    
+    """
+    _done, _duration_sum, _duration_count = counters[user.id]
+    _users_counters = [counters[x.id] for x in users]
+    
+    _average_duration = _duration_sum / (float(_duration_count) or 1)
+    
+    _users_done = min([x[0] for x in _users_counters] or [0])
+    _users_duration_sum = sum([x[1] for x in _users_counters])
+    _users_duration_count = sum([x[2] for x in _users_counters])
+    _users_average_duration = _users_duration_sum \
+      / (float(_users_duration_count) or 1)
+    
+    return {
+      'finished': items == _done,
       'header': task.get_status_header,
-      'status': task.get_status_for_user(user),
-      'status_users': task.get_status_for_users(),
+      'status': task.format_status(_done, items, _average_duration),
+      'status_users': task.format_status(_users_done, items,
+        _users_average_duration),
       'task_name': task.task_name,
       'url': task.get_absolute_url(),
       'status_url': task.get_status_url(),
     }
+
+
+def _update_task_cache(task, user):
+    """
+    Updates the APPRAISE_TASK_CACHE for the given user.
+    
+    Returns the updated task data.
     
-    _cache.update({user.username: _task_data})
+    """
+    _users = list(task.users.all())
+    _items = EvaluationItem.objects.filter(task=task).count()
+    _counters = EvaluationTaskCounters.get_counters_for_users(task,
+      _users + [user])
+    
+    _task_data = _compute_task_data(task, user, _users, _items, _counters)
+    APPRAISE_TASK_CACHE[(task.task_id, user.username)] = _task_data
+    return _task_data
+
+
+def _update_task_caches(task):
+    """
+    Updates the APPRAISE_TASK_CACHE for all users working on the task.
+    """
+    _users = list(task.users.all())
+    _items = EvaluationItem.objects.filter(task=task).count()
+    _counters = EvaluationTaskCounters.get_counters_for_users(task, _users)
+    
+    for _user in _users:
+        APPRAISE_TASK_CACHE[(task.task_id, _user.username)] = \
+          _compute_task_data(task, _user, _users, _items, _counters)
 
 
 def _save_results(item, user, duration, raw_result):
@@ -91,23 +190,49 @@ def _save_results(item, user, duration, raw_result):
 def _find_next_item_to_process(items, user, random_order=False):
     """
     Computes the next item the current user should process or None, if done.
+    
+    Only the user's results for the given items are considered, using a
+    subquery, so this does not depend on how many results the user has
+    submitted overall.  Random order is computed by the database.
+    
     """
-    user_results = EvaluationResult.objects.filter(user=user)
+    user_results = EvaluationResult.objects.filter(user=user, item__in=items)
     
-    processed_items = user_results.values_list('item__pk', flat=True)
+    processed_items = user_results.values_list('item', flat=True)
+    
+    unprocessed_items = items.exclude(pk__in=processed_items)
     
-    # cfedermann: this might be sub optimal wrt. performance!
-    unprocessed_items = list(items.exclude(pk__in=processed_items))
-
     if random_order:
-        shuffle(unprocessed_items)
+        unprocessed_items = unprocessed_items.order_by('?')
     
+    unprocessed_items = list(unprocessed_items[:1])
     if unprocessed_items:
         return unprocessed_items[0]
     
     return None
 
 
+def _iter_agreement_data(task, users, item_ids, matrix):
+    """
+    Yields (user, item_id, category) for items which all users have finished.
+    
+    The matrix is computed by EvaluationTask.get_result_matrix();  category
+    is the string representation of the parsed result, as used for
+    inter-annotator agreement.
+    
+    """
+    _task_type = task.get_task_type_display()
+    for item_id in item_ids:
+        cells = matrix.get(item_id, {})
+        if len(cells) < len(users):
+            continue
+        
+        for user in users:
+            category = str(EvaluationResult.parse_raw_result(
+              cells[user.id], _task_type))
+            yield (user, item_id, category)
+
+
 def _compute_context_for_item(item):
     """
     Computes the source and reference texts for item, including context.
@@ -653,14 +778,10 @@ def overview(request):
         
         # Loop over the QuerySet and compute task description data.
         for _task in _tasks:
-            if not APPRAISE_TASK_CACHE.has_key(_task.task_id):
-                APPRAISE_TASK_CACHE[_task.task_id] = {}
-            
-            _cache = APPRAISE_TASK_CACHE[_task.task_id]
-            if not _cache.has_key(request.user.username):
-                _update_task_cache(_task, request.user)
-            
-            _task_data = _cache[request.user.username]
+            _task_data = APPRAISE_TASK_CACHE.get((_task.task_id,
+              request.user.username))
+            if _task_data is None:
+                _task_data = _update_task_cache(_task, request.user)
             
             # Append new task description to current task_type list.
             evaluation_tasks[task_type].append(_task_data)
@@ -703,21 +824,15 @@ def status_view(request, task_id=None):
             status.append((user.username, task.get_status_for_user(user)))
         
         scores = None
-        result_data = []
-        raw_result_data = Counter()
         users = list(task.users.all())
+        item_ids, matrix = task.get_result_matrix(users)
         
-        for item in EvaluationItem.objects.filter(task=task):
-            results = []
-            for user in users:
-                qset = EvaluationResult.objects.filter(user=user, item=item)
-                if qset.exists():
-                    category = str(qset[0].results)
-                    results.append((user.id, item.id, category))
-                    raw_result_data[qset[0].raw_result] += 1
-            
-            if len(results) == len(users):
-                result_data.extend(results)
+        result_data = [(user.id, item_id, category) for user, item_id, category
+          in _iter_agreement_data(task, users, item_ids, matrix)]
+        
+        raw_result_data = Counter()
+        for cells in matrix.itervalues():
+            raw_result_data.update(cells.itervalues())
         
         _raw_results = []
         _keys = raw_result_data.keys()
@@ -788,14 +903,10 @@ def status_view(request, task_id=None):
         
             # Loop over the QuerySet and compute task description data.
             for _task in _tasks:
-                if not APPRAISE_TASK_CACHE.has_key(_task.task_id):
-                    APPRAISE_TASK_CACHE[_task.task_id] = {}
-                
-                _cache = APPRAISE_TASK_CACHE[_task.task_id]
-                if not _cache.has_key(request.user.username):
-                    _update_task_cache(_task, request.user)
-                
-                _task_data = _cache[request.user.username]
+                _task_data = APPRAISE_TASK_CACHE.get((_task.task_id,
+                  request.user.username))
+                if _task_data is None:
+                    _task_data = _update_task_cache(_task, request.user)
                 
                 # Append new task description to current task_type list.
                 evaluation_tasks[task_type].append(_task_data)
@@ -845,22 +956,21 @@ def export_agreement_data(request, task_id=None):
     """
     task = get_object_or_404(EvaluationTask, task_id=task_id)
     
-    result_data = []
     users = list(task.users.all())
-    
-    for item in EvaluationItem.objects.filter(task=task):
-        results = []
-        for user in users:
-            qset = EvaluationResult.objects.filter(user=user, item=item)
-            if qset.exists():
-                category = str(qset[0].results)
-                data = '{}\t{}\t{}'.format(user.username, item.id, category)
-                results.append(data)
-        
-        if len(results) == len(users):
-            result_data.extend(results)
-    
-    export_txt = '\n'.join(result_data)
+    item_ids, matrix = task.get_result_matrix(users)
+    
+    def _export_lines():
+        """
+        Yields the export lines, separated by newline characters.
+        """
+        separator = ''
+        for user, item_id, category in _iter_agreement_data(task, users,
+          item_ids, matrix):
+            yield '{}{}\t{}\t{}'.format(separator, user.username, item_id,
+              category)
+            separator = '\n'
+    
+    export_txt = _export_lines()
     export_filename = 'agreement-data-{}-{}'.format(slugify(task.task_name),
       date.today())
 
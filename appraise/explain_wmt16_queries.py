@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Project: Appraise evaluation system
+ Author: Christian Federmann <cfedermann@gmail.com>
+
+usage: python explain_wmt16_queries.py [-h] [--verbose]
+
+Checks that the hottest WMT16 queries use their indexes.  Each query is run
+through EXPLAIN on the configured database;  a check fails if the plan
+contains a full table scan or does not use the composite index created for
+the query by initialize_wmt16.py, see COMPOSITE_INDEXES in
+appraise.wmt16.models.  Queries listed in OTHER_INDEX_ALLOWED may use
+another index instead.  Supports SQLite, PostgreSQL and MySQL.  On
+PostgreSQL, sequential scans are disabled while explaining, as the planner
+prefers them for small tables;  the check then confirms that the index is
+applicable.  Nothing is written to the database.  Exits with status 1 if
+any check fails.
+
+optional arguments:
+  -h, --help            Show this help message and exit.
+  --verbose             Print query plans.
+
+"""
+import argparse
+import os
+import re
+import sys
+
+PARSER = argparse.ArgumentParser(description="Checks that hot WMT16 " \
+  "queries use indexes, using EXPLAIN.")
+PARSER.add_argument("--verbose", action="store_true", default=False,
+  dest="verbose", help="Print query plans.")
+
+# Patterns matching full table scans in query plan lines, per database.
+FULL_SCAN_PATTERNS = {
+  'sqlite': re.compile(r'^SCAN '),
+  'postgresql': re.compile(r'Seq Scan on'),
+  'mysql': re.compile(r'type=ALL\b'),
+}
+
+# Names of hot queries which pass without using their composite index, as
+# long as there is no full table scan.
+OTHER_INDEX_ALLOWED = ()
+
+
+def hot_queries(user, project, hit, item, language_pair):
+    """
+    Returns (name, queryset, composite index name) for all hot queries.
+
+    The querysets are built as in appraise.wmt16.views and models;  results
+    for a HIT are counted, hence not ordered.
+
+    """
+    # pylint: disable-msg=W0404
+    from appraise.wmt16.models import HIT, RankingResult, RankingTask, \
+      TimedKeyValueData, UserHITMapping
+
+    return (
+      ('next_hit_candidates', HIT.objects.filter(active=True,
+        mturk_only=False, completed=False, project=project,
+        language_pair=language_pair), 'wmt16_hit_status'),
+      ('result_for_item', RankingResult.objects.filter(item=item,
+        user=user), 'wmt16_rankingresult_item_user'),
+      ('results_for_hit', RankingResult.objects.filter(user=user,
+        item__in=RankingTask.objects.filter(hit=hit)).order_by(),
+        'wmt16_rankingresult_item_user'),
+      ('current_hit_mapping', UserHITMapping.objects.filter(user=user,
+        project=project, hit__language_pair=language_pair),
+        'wmt16_userhitmapping_user_project'),
+      ('latest_status_value', TimedKeyValueData.objects.filter(
+        key='hits_completed').order_by('-date_and_time', '-id')[:1],
+        'wmt16_timedkeyvaluedata_key_date'),
+    )
+
+
+def explain(queryset):
+    """
+    Returns the query plan for the given queryset as a list of lines.
+    """
+    from django.db import connection
+
+    sql, params = queryset.query.sql_with_params()
+    cursor = connection.cursor()
+    if connection.vendor == 'sqlite':
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+    elif connection.vendor == 'postgresql':
+        cursor.execute('SET enable_seqscan = off')
+        try:
+            cursor.execute('EXPLAIN ' + sql, params)
+            return [row[0].strip() for row in cursor.fetchall()]
+
+        finally:
+            cursor.execute('RESET enable_seqscan')
+
+    elif connection.vendor == 'mysql':
+        cursor.execute('EXPLAIN ' + sql, params)
+        columns = [x[0] for x in cursor.description]
+        return [' '.join(['{0}={1}'.format(key, value) for key, value
+          in zip(columns, row) if key in ('table', 'type', 'key')])
+          for row in cursor.fetchall()]
+
+    raise NotImplementedError('EXPLAIN is not supported for {0}.'.format(
+      connection.vendor))
+
+
+def check_hot_queries(user, project, hit, item, language_pair):
+    """
+    Explains all hot queries and checks their index usage.
+
+    Returns a list of dictionaries containing name, composite index, plan,
+    full table scans, whether the composite index is used and whether the
+    check passed, see OTHER_INDEX_ALLOWED.
+
+    """
+    from django.db import connection
+
+    full_scan = FULL_SCAN_PATTERNS[connection.vendor]
+    results = []
+    for name, queryset, index_name in hot_queries(user, project, hit, item,
+      language_pair):
+        plan = explain(queryset)
+        full_scans = [x for x in plan if full_scan.search(x)]
+        uses_index = any(index_name in x for x in plan)
+        passed = not full_scans and (uses_index
+          or name in OTHER_INDEX_ALLOWED)
+        results.append({'query': name, 'index': index_name, 'plan': plan,
+          'full_scans': full_scans, 'uses_index': uses_index,
+          'passed': passed})
+
+    return results
+
+
+if __name__ == "__main__":
+    args = PARSER.parse_args()
+
+    # Properly set DJANGO_SETTINGS_MODULE environment variable.
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
+    PROJECT_HOME = os.path.normpath(os.getcwd() + "/..")
+    sys.path.append(PROJECT_HOME)
+
+    # We have just added appraise to the system path list, hence this works.
+    from django.contrib.auth.models import User
+    from appraise.wmt16.models import HIT, Project, RankingTask
+
+    # Query parameters do not affect the plan, any existing rows will do.
+    hit = HIT(id=0, language_pair='deu2eng')
+    for _hit in HIT.objects.all()[:1]:
+        hit = _hit
+
+    results = check_hot_queries(User(id=0), Project(id=0), hit,
+      RankingTask(id=0), hit.language_pair)
+
+    for result in results:
+        print '{0}: {1}, {2} {3}'.format(result['query'],
+          'OK' if result['passed'] else 'FAILED', result['index'],
+          'used' if result['uses_index'] else 'not used')
+        if args.verbose or not result['passed']:
+            for line in result['plan']:
+                print '  {0}'.format(line)
+
+    if not all(x['passed'] for x in results):
+        sys.exit(1)
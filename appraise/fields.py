@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Project: Appraise evaluation system
+ Author: Christian Federmann <cfedermann@gmail.com>
+"""
+import logging
+import zlib
+
+from base64 import b64decode, b64encode
+
+from django.db import models
+
+from appraise.settings import LOG_LEVEL, LOG_HANDLER, COMPRESS_TEXT_FIELDS, \
+  COMPRESS_MIN_LENGTH
+
+# Setup logging support.
+logging.basicConfig(level=LOG_LEVEL)
+LOGGER = logging.getLogger('appraise.fields')
+LOGGER.addHandler(LOG_HANDLER)
+
+# Compressed values are stored as text, using this prefix and base64, so
+# that compressed and uncompressed rows can live in the same column.
+COMPRESSED_TEXT_PREFIX = u'zlib:'
+
+
+def is_compressed_text(value):
+    """
+    Checks if the given database value is compressed.
+    """
+    return isinstance(value, basestring) \
+      and value.startswith(COMPRESSED_TEXT_PREFIX)
+
+
+def compress_text(value):
+    """
+    Returns the compressed database value for the given text.
+    """
+    _data = zlib.compress(value.encode('utf-8'))
+    return COMPRESSED_TEXT_PREFIX + b64encode(_data).decode('ascii')
+
+
+def compress_text_if_smaller(value):
+    """
+    Returns the compressed value for the given text if this saves space.
+
+    Values shorter than COMPRESS_MIN_LENGTH or which are compressed already
+    are returned as is.
+
+    """
+    if value and len(value) >= COMPRESS_MIN_LENGTH \
+      and not is_compressed_text(value):
+        _compressed = compress_text(value)
+        if len(_compressed) < len(value):
+            return _compressed
+
+    return value
+
+
+def decompress_text(value):
+    """
+    Returns the text for the given database value, compressed or not.
+    """
+    if not is_compressed_text(value):
+        return value
+
+    _data = b64decode(value[len(COMPRESSED_TEXT_PREFIX):])
+    return zlib.decompress(_data).decode('utf-8')
+
+
+class CompressedTextDescriptor(object):
+    """
+    Decompresses a CompressedTextField value on first access.
+
+    Model instances keep the raw database value until the attribute is
+    read, so instances whose text is never used never decompress it.
+
+    """
+    def __init__(self, field):
+        """
+        Creates a new descriptor for the given field.
+        """
+        self.field = field
+
+    def __get__(self, instance, owner):
+        """
+        Returns the decompressed field value for the given instance.
+        """
+        if instance is None:
+            return self
+
+        _value = instance.__dict__.get(self.field.attname)
+        if is_compressed_text(_value):
+            _value = decompress_text(_value)
+            instance.__dict__[self.field.attname] = _value
+
+        return _value
+
+    def __set__(self, instance, value):
+        """
+        Stores the given raw or decompressed value for the given instance.
+        """
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.TextField):
+    """
+    TextField which stores its values zlib-compressed, if enabled.
+
+    Compression is opt-in using COMPRESS_TEXT_FIELDS;  values shorter than
+    COMPRESS_MIN_LENGTH or which would not get smaller are stored as is.
+    Reading supports both formats, so existing rows can be converted in
+    batches later, see compress_xml_fields.py.  Note that values() and
+    values_list() return raw database values, use decompress_text() then.
+
+    """
+    def get_internal_type(self):
+        """
+        Uses the same database column type as TextField.
+        """
+        return 'TextField'
+
+    def contribute_to_class(self, cls, name):
+        """
+        Installs a CompressedTextDescriptor for this field on the model.
+        """
+        super(CompressedTextField, self).contribute_to_class(cls, name)
+        setattr(cls, self.attname, CompressedTextDescriptor(self))
+
+    def to_python(self, value):
+        """
+        Returns the decompressed text for the given value.
+        """
+        return decompress_text(super(CompressedTextField, self).to_python(
+          value))
+
+    def get_prep_value(self, value):
+        """
+        Returns the database value for the given text, compressed if enabled.
+        """
+        value = super(CompressedTextField, self).get_prep_value(value)
+        if COMPRESS_TEXT_FIELDS:
+            return compress_text_if_smaller(value)
+
+        return value
@@ -3,12 +3,32 @@
 """
 Project: Appraise evaluation system
  Author: Christian Federmann <cfedermann@gmail.com>
+
+usage: python import_beta16_xml.py
+               [-h] [--dry-run] [--batch-size BATCH_SIZE]
+               tasks-file [tasks-file ...]
+
+Imports AbsoluteScoringTask instances from segments XML files, as created
+by create_beta16_xml.py.  Files are parsed incrementally and tasks are
+saved using bulk_create(), one transaction per batch.
+
+positional arguments:
+  tasks-file            XML file(s) containing tasks.  Can be multiple files
+                        using patterns such as '*.xml' or similar.
+
+optional arguments:
+  -h, --help            Show this help message and exit.
+  --dry-run             Enable dry run to simulate import.
+  --batch-size BATCH_SIZE
+                        Number of tasks per transaction.
+
 """
+from time import time
 import argparse
 import os
 import sys
 
-from xml.etree.ElementTree import fromstring, tostring
+from xml.etree.ElementTree import iterparse, ParseError
 
 PARSER = argparse.ArgumentParser(description="Imports tasks from a given " \
   "XML file into the Django database.")
@@ -17,6 +37,69 @@ PARSER.add_argument("tasks_file", metavar="tasks-file", help="XML file(s) " \
   "or similar.", nargs='+')
 PARSER.add_argument("--dry-run", action="store_true", default=False,
   dest="dry_run_enabled", help="Enable dry run to simulate import.")
+PARSER.add_argument("--batch-size", action="store", default=500,
+  dest="batch_size", help="Number of tasks per transaction.", type=int)
+
+
+def iter_segments(tasks_file):
+    """
+    Yields all <segment> elements from the given segments XML file.
+
+    The file is parsed incrementally;  each <segment> is removed from the
+    tree once it has been processed, so memory usage does not depend on
+    the file size.
+
+    """
+    _root = None
+    _depth = 0
+    for _event, _elem in iterparse(tasks_file, events=('start', 'end')):
+        if _event == 'start':
+            if _root is None:
+                _root = _elem
+            _depth += 1
+            continue
+
+        _depth -= 1
+        if _depth == 1:
+            yield _elem
+            _root.remove(_elem)
+
+
+def iter_tasks(tasks_file, stats):
+    """
+    Yields one unsaved AbsoluteScoringTask per <candidate> in tasks_file.
+
+    If a <segment> contains as many <system-id> as <candidate> elements,
+    these are paired in order;  otherwise, all candidates are attributed
+    to the first <system-id>.  Segments with candidates but without any
+    <system-id> are reported and skipped.  Updates segment, task and
+    invalid segment counts in stats.
+
+    """
+    for _segment in iter_segments(tasks_file):
+        segment_id = _segment.attrib["id"]
+        source_language = _segment.attrib["source-language"]
+        target_language = _segment.attrib["target-language"]
+        reference_text = _segment.find("reference").text
+
+        system_ids = [x.text for x in _segment.findall("system-id")]
+        candidates = [x.text for x in _segment.findall("candidate")]
+        stats['segments'] += 1
+        if candidates and not system_ids:
+            print 'Invalid segment {0}: no <system-id> for {1} ' \
+              'candidate(s)'.format(segment_id, len(candidates))
+            stats['invalid'] += 1
+            continue
+
+        if len(system_ids) != len(candidates):
+            system_ids = system_ids[:1] * len(candidates)
+
+        for system_id, candidate_text in zip(system_ids, candidates):
+            stats['tasks'] += 1
+            yield AbsoluteScoringTask(segment_id=segment_id,
+              source_language=source_language,
+              target_language=target_language, system_id=system_id,
+              reference=reference_text, candidate=candidate_text)
 
 
 if __name__ == "__main__":
@@ -28,7 +111,7 @@ if __name__ == "__main__":
     sys.path.append(PROJECT_HOME)
 
     # We have just added appraise to the system path list, hence this works.
-    from appraise.beta16.models import AbsoluteScoringTask, MetaData
+    from appraise.beta16.models import AbsoluteScoringTask
 
     ###
     # <segments>
@@ -41,30 +124,28 @@ if __name__ == "__main__":
     # </segments>
     ###
 
+    stats = {'segments': 0, 'tasks': 0, 'invalid': 0}
+    _imported = 0
+    _start = time()
     for _tasks_file in args.tasks_file:
-        tasks_xml_string = None
-        with open(_tasks_file) as infile:
-            tasks_xml_string = unicode(infile.read(), "utf-8")
-
-        _tree = fromstring(tasks_xml_string.encode("utf-8"))
-        for _child in _tree:
-            segment_id = _child.attrib["id"]
-            source_language = _child.attrib["source-language"]
-            target_language = _child.attrib["target-language"]
-            system_id = _child.findall("system-id")[0].text
-            reference_text = _child.findall("reference")[0].text
-            for candidate in _child.findall("candidate"):
-                candidate_text = candidate.text
-                print candidate_text.encode('utf-8')
-
-            new_meta = MetaData()
-            new_meta.save()
-
-            new_task = AbsoluteScoringTask()
-            new_task.segment_id = segment_id
-            new_task.source_language = source_language
-            new_task.target_language = target_language
-            new_task.system_id = system_id
-            new_task.reference = reference_text
-            new_task.candidate = candidate_text
-            new_task.save()
+        _tasks = iter_tasks(_tasks_file, stats)
+        try:
+            if args.dry_run_enabled:
+                _imported += sum(1 for _ in _tasks)
+
+            else:
+                _imported += AbsoluteScoringTask.bulk_import(_tasks,
+                  args.batch_size)
+
+        # Batches before the parse error have been committed already.
+        except ParseError, msg:
+            print 'Invalid XML in file {0}: {1}'.format(_tasks_file, msg)
+            sys.exit(-1)
+
+    _duration = time() - _start
+    print 'Read {0} tasks from {1} segments in {2} file(s), skipped {3} ' \
+      'invalid segment(s).'.format(stats['tasks'], stats['segments'],
+      len(args.tasks_file), stats['invalid'])
+    print 'Imported {0} tasks in {1:.2f} seconds, {2:.1f} tasks/s{3}.'.format(
+      _imported, _duration, _imported / (_duration or 1),
+      ' (dry run)' if args.dry_run_enabled else '')
@@ -5,11 +5,18 @@ Project: Appraise evaluation system
  Author: Christian Federmann <cfedermann@gmail.com>
 
 usage: python import_wmt16_xml.py
-               [-h] [--wait SLEEP_SECONDS] [--dry-run] [--mturk-only]
+               [-h] [--wait SLEEP_SECONDS] [--project ANNOTATION_PROJECT]
+               [--dry-run] [--mturk-only] [--bulk] [--batch-size BATCH_SIZE]
+               [--processes PROCESSES]
                hits-file [hits-file ...]
 
 Imports HITs from a given XML file into the Django database. Uses
-appraise.wmt16.validators.validate_hits_xml_file() for validation.
+appraise.wmt16.validators.iter_hits_xml_file() for validation, files are
+parsed incrementally and never loaded into memory as a whole.  Each <hit>
+is validated as it is read, in the same pass which imports it;  the first
+invalid <hit> aborts the import.  Without --bulk, the HITs of the current
+file are rolled back.  With --bulk, previous batches of the file remain
+in the database, hence the fixed file can be imported again.
 
 positional arguments:
   hits-file             XML file(s) containing HITs. Can be multiple files
@@ -18,31 +25,164 @@ positional arguments:
 optional arguments:
   -h, --help            Show this help message and exit.
   --wait SLEEP_SECONDS  Amount of seconds to wait between individual files.
+                        Defaults to 5 seconds, or 0 seconds for --bulk.
+  --project ANNOTATION_PROJECT
+                        Annotation project name.
   --dry-run             Enable dry run to simulate import.
   --mturk-only          Enable MTurk-only flag for all HITs.
+  --bulk                Enable bulk import using bulk_create().  HITs which
+                        already exist in the project are skipped, so files
+                        can be imported again safely.
+  --batch-size BATCH_SIZE
+                        Number of HITs per transaction for bulk import.
+  --processes PROCESSES
+                        Number of worker processes which parse and validate
+                        files in parallel.  Implies --bulk;  all database
+                        writes happen in the main process.
 
 """
-from time import sleep
+from collections import deque
+from multiprocessing import Pool
+from time import sleep, time
 import argparse
 import os
 import sys
 
-from xml.etree.ElementTree import fromstring, tostring
+from xml.etree.ElementTree import tostring
 
 PARSER = argparse.ArgumentParser(description="Imports HITs from a given " \
   "XML file into the Django database.\nUses appraise.wmt16.validators." \
-  "validate_hits_xml_file() for validation.")
+  "iter_hits_xml_file() for validation.")
 PARSER.add_argument("hits_file", metavar="hits-file", help="XML file(s) " \
   "containing HITs.  Can be multiple files using patterns such as '*.xml' " \
   "or similar.", nargs='+')
-PARSER.add_argument("--wait", action="store", default=5, dest="sleep_seconds",
-  help="Amount of seconds to wait between individual files.", type=int)
+PARSER.add_argument("--wait", action="store", default=None,
+  dest="sleep_seconds", help="Amount of seconds to wait between individual " \
+  "files.  Defaults to 5 seconds, or 0 seconds for --bulk.", type=int)
 PARSER.add_argument("--project", action="store", dest="annotation_project",
   help="Annotation project name.", type=str)
 PARSER.add_argument("--dry-run", action="store_true", default=False,
   dest="dry_run_enabled", help="Enable dry run to simulate import.")
 PARSER.add_argument("--mturk-only", action="store_true", default=False,
   dest="mturk_only", help="Enable MTurk-only flag for all HITs.")
+PARSER.add_argument("--bulk", action="store_true", default=False,
+  dest="bulk_enabled", help="Enable bulk import using bulk_create().  HITs " \
+  "which already exist in the project are skipped, so files can be " \
+  "imported again safely.")
+PARSER.add_argument("--batch-size", action="store", default=500,
+  dest="batch_size", help="Number of HITs per transaction for bulk import.",
+  type=int)
+PARSER.add_argument("--processes", action="store", default=1,
+  dest="processes", help="Number of worker processes which parse and " \
+  "validate files in parallel.  Implies --bulk;  all database writes " \
+  "happen in the main process.", type=int)
+
+
+def get_language_pair(hit):
+    """
+    Returns the ISO-639-3 based language pair code for the given <hit>.
+    """
+    language_pair = '{0}2{1}'.format(hit.attrib["source-language"],
+      hit.attrib["target-language"])
+    
+    # Hotfix potentially wrong ISO codes;  we are using ISO-639-3.
+    iso_639_2_to_3_mapping = {'cze': 'ces', 'fre': 'fra', 'ger': 'deu',
+      'ron': 'rom', 'tur': 'trk', 'eus': 'baq'}
+    for part2_code, part3_code in iso_639_2_to_3_mapping.items():
+        language_pair = language_pair.replace(part2_code, part3_code)
+    
+    return language_pair
+
+
+def iter_hit_rows(hits_file, language_pairs, mturk_only, stats):
+    """
+    Yields prepared HIT rows for HIT.bulk_import() from the given file.
+    
+    Rows are prepared using HIT.prepare_import_row(), so all XML parsing
+    happens here, e.g., inside worker processes.  HITs with a language pair
+    not contained in language_pairs are reported and skipped.  Updates
+    stats['total'] and stats['errors'] on the fly.
+    
+    """
+    from appraise.wmt16.models import HIT
+    from appraise.wmt16.validators import iter_hits_xml_file
+    
+    for _child in iter_hits_xml_file(hits_file):
+        stats['total'] += 1
+        language_pair = get_language_pair(_child)
+        if not language_pair in language_pairs:
+            print 'Invalid language pair "{0}"'.format(language_pair)
+            stats['errors'] += 1
+            continue
+        
+        _hit_xml = tostring(_child, encoding="utf-8").decode('utf-8')
+        yield HIT.prepare_import_row(_child.attrib["block-id"],
+          language_pair, _hit_xml, mturk_only)
+
+
+def parse_hits_file(hits_file, language_pairs, mturk_only):
+    """
+    Parses and validates the given file, returns all of its prepared rows.
+    
+    This runs inside worker processes and must not access the database;
+    the main process only has to intern texts and insert the rows.
+    Returns a (hits_file, rows, stats, error) tuple.  ValidationError cannot
+    be passed between processes, hence error contains its messages instead.
+    
+    """
+    from django.core.exceptions import ValidationError
+    
+    _stats = {'total': 0, 'errors': 0}
+    try:
+        _rows = list(iter_hit_rows(hits_file, language_pairs, mturk_only,
+          _stats))
+    
+    except ValidationError, msg:
+        return (hits_file, [], _stats, msg.messages)
+    
+    return (hits_file, _rows, _stats, None)
+
+
+def iter_parsed_hits_files(hits_files, processes, language_pairs, mturk_only):
+    """
+    Yields parse_hits_file() results for the given files, in order.
+    
+    Files are parsed by a pool of worker processes.  At most two files per
+    worker are parsed ahead of the caller to bound memory usage.
+    
+    """
+    _pool = Pool(processes)
+    _files = deque(hits_files)
+    _pending = deque()
+    
+    try:
+        while _files or _pending:
+            while _files and len(_pending) < 2 * processes:
+                _pending.append(_pool.apply_async(parse_hits_file,
+                  (_files.popleft(), language_pairs, mturk_only)))
+            
+            yield _pending.popleft().get()
+        
+        _pool.close()
+    
+    finally:
+        _pool.terminate()
+        _pool.join()
+
+
+def print_bulk_import_result(hits_file, total, errors, imported, skipped,
+  inserted, duration):
+    """
+    Prints the bulk import result for the given file.
+    """
+    print
+    print '[{0}]'.format(hits_file)
+    print 'Successfully imported {0} of {1} HITs, skipped {2} ' \
+      'existing HITs, encountered errors for {3} HITs.'.format(
+      imported, total, skipped, errors)
+    print 'Inserted {0} rows in {1:.2f} seconds, {2:.1f} rows/s.'.format(
+      inserted, duration, inserted / (duration or 1))
+    print
 
 
 if __name__ == "__main__":
@@ -54,8 +194,9 @@ if __name__ == "__main__":
     sys.path.append(PROJECT_HOME)
     
     # We have just added appraise to the system path list, hence this works.
-    from appraise.wmt16.models import HIT, Project
-    from appraise.wmt16.validators import validate_hits_xml_file
+    from appraise.wmt16.models import HIT, Project, LANGUAGE_PAIR_CHOICES
+    from appraise.wmt16.validators import iter_hits_xml_file
+    from django.db import transaction
     
     # Check if annotation project exists.
     if not Project.objects.filter(name=args.annotation_project).exists():
@@ -63,68 +204,119 @@ if __name__ == "__main__":
         sys.exit(-1)
     project_instance = Project.objects.filter(name=args.annotation_project)[0]
     
-    # We might potentially be dealing with more than a single input file.
-    first_run = True
-    for _hits_file in args.hits_file:
-        if not first_run and args.sleep_seconds > 0:
-            print 'Waiting {0} second(s)'.format(args.sleep_seconds),
-            for i in range(args.sleep_seconds):
-                print ' .',
-                sys.stdout.flush()
-                sleep(1)
-            print
-            print
-        
-        else:
-            first_run = False
-        
-        hits_xml_string = None
-        with open(_hits_file) as infile:
-            hits_xml_string = unicode(infile.read(), "utf-8")
-        
-        # Validate XML before trying to import anything from the given file.
-        validate_hits_xml_file(hits_xml_string)
+    if args.processes > 1:
+        args.bulk_enabled = True
+    
+    if args.sleep_seconds is None:
+        args.sleep_seconds = 0 if args.bulk_enabled else 5
     
-        _errors = 0
-        _total = 0
-        _tree = fromstring(hits_xml_string.encode("utf-8"))
+    _valid_language_pairs = [x[0] for x in LANGUAGE_PAIR_CHOICES]
+    _bulk_rows = 0
+    _bulk_start = time()
     
-        for _child in _tree:        
-            block_id = _child.attrib["block-id"]
-            language_pair = '{0}2{1}'.format(_child.attrib["source-language"],
-              _child.attrib["target-language"])
+    # In pipeline mode, worker processes parse and validate files while
+    # this process is the single writer to the database.
+    if args.processes > 1:
+        from django.core.exceptions import ValidationError
         
-            # Hotfix potentially wrong ISO codes;  we are using ISO-639-3.
-            iso_639_2_to_3_mapping = {'cze': 'ces', 'fre': 'fra', 'ger': 'deu',
-              'ron': 'rom', 'tur': 'trk', 'eus': 'baq'}
-            for part2_code, part3_code in iso_639_2_to_3_mapping.items():
-                language_pair = language_pair.replace(part2_code, part3_code)
+        for _hits_file, _rows, _stats, _error in iter_parsed_hits_files(
+          args.hits_file, args.processes, _valid_language_pairs,
+          args.mturk_only):
+            if _error is not None:
+                raise ValidationError(_error)
+            
+            _start = time()
+            _imported, _skipped, _inserted = 0, 0, 0
+            if not args.dry_run_enabled:
+                _imported, _skipped, _inserted = HIT.bulk_import(_rows,
+                  project_instance, batch_size=args.batch_size)
+            
+            _bulk_rows = _bulk_rows + _inserted
+            print_bulk_import_result(_hits_file, _stats['total'],
+              _stats['errors'], _imported, _skipped, _inserted,
+              time() - _start)
+    
+    else:
+        # We might potentially be dealing with more than a single input file.
+        first_run = True
+        for _hits_file in args.hits_file:
+            if not first_run and args.sleep_seconds > 0:
+                print 'Waiting {0} second(s)'.format(args.sleep_seconds),
+                for i in range(args.sleep_seconds):
+                    print ' .',
+                    sys.stdout.flush()
+                    sleep(1)
+                print
+                print
         
-            try:
-                _total = _total + 1
-                _hit_xml = tostring(_child, encoding="utf-8").decode('utf-8')
+            else:
+                first_run = False
+        
+            _errors = 0
+            _total = 0
+        
+            # In bulk mode, HIT rows are streamed from the file and inserted in
+            # batches.  Each <hit> is validated while it is read, so we only
+            # have to check the language pair which full_clean() would verify.
+            # A ValidationError aborts the import before the current batch.
+            if args.bulk_enabled:
+                _start = time()
+                _stats = {'total': 0, 'errors': 0}
+                _rows = iter_hit_rows(_hits_file, _valid_language_pairs,
+                  args.mturk_only, _stats)
             
+                _imported, _skipped, _inserted = 0, 0, 0
                 if args.dry_run_enabled:
-                    _ = HIT(block_id=block_id, hit_xml=_hit_xml,
-                      language_pair=language_pair, mturk_only=args.mturk_only)
+                    for _ in _rows:
+                        pass
             
                 else:
-                    # Use get_or_create() to avoid exact duplicates.  We do allow
-                    # them for WMT16 to measure intra-annotator agreement...
-                    h = HIT(block_id=block_id, hit_xml=_hit_xml,
-                      language_pair=language_pair, mturk_only=args.mturk_only)
-                    h.save()
+                    _imported, _skipped, _inserted = HIT.bulk_import(_rows,
+                      project_instance, batch_size=args.batch_size)
+            
+                _bulk_rows = _bulk_rows + _inserted
+                print_bulk_import_result(_hits_file, _stats['total'],
+                  _stats['errors'], _imported, _skipped, _inserted,
+                  time() - _start)
+                continue
+        
+            # The HITs of this file are saved in a single transaction;  an
+            # invalid <hit> rolls back those which have been saved already.
+            with transaction.commit_on_success():
+                for _child in iter_hits_xml_file(_hits_file):
+                    block_id = _child.attrib["block-id"]
+                    language_pair = get_language_pair(_child)
+        
+                    try:
+                        _total = _total + 1
+                        _hit_xml = tostring(_child, encoding="utf-8").decode('utf-8')
+            
+                        if args.dry_run_enabled:
+                            _ = HIT(block_id=block_id, hit_xml=_hit_xml,
+                              language_pair=language_pair, mturk_only=args.mturk_only)
+            
+                        else:
+                            # Use get_or_create() to avoid exact duplicates.  We do allow
+                            # them for WMT16 to measure intra-annotator agreement...
+                            h = HIT(block_id=block_id, hit_xml=_hit_xml,
+                              language_pair=language_pair, mturk_only=args.mturk_only)
+                            h.save()
                     
-                    # Add HIT instance to given project.
-                    project_instance.HITs.add(h)
+                            # Add HIT instance to given project.
+                            project_instance.HITs.add(h)
         
-            # pylint: disable-msg=W0703
-            except Exception, msg:
-                print msg
-                _errors = _errors + 1
-    
-        print
-        print '[{0}]'.format(_hits_file)
-        print 'Successfully imported {0} HITs, encountered errors for ' \
-          '{1} HITs.'.format(_total, _errors)
-        print
+                    # pylint: disable-msg=W0703
+                    except Exception, msg:
+                        print msg
+                        _errors = _errors + 1
+    
+            print
+            print '[{0}]'.format(_hits_file)
+            print 'Successfully imported {0} HITs, encountered errors for ' \
+              '{1} HITs.'.format(_total, _errors)
+            print
+    
+    if args.bulk_enabled:
+        _duration = time() - _bulk_start
+        print 'Inserted {0} rows in total in {1:.2f} seconds, {2:.1f} ' \
+          'rows/s.'.format(_bulk_rows, _duration, _bulk_rows / (_duration or 1))
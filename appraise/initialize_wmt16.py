@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Project: Appraise evaluation system
+ Author: Christian Federmann <cfedermann@gmail.com>
+
+usage: python initialize_wmt16.py [-h] [--dry-run]
+
+Creates the language pair, researcher and WMT16 groups required by the
+WMT16 application, as well as composite indexes for its hot queries, see
+appraise.wmt16.models.COMPOSITE_INDEXES.  Existing groups and indexes are
+kept, so this can be run any number of times, e.g., after each deployment.
+Note that syncdb also runs this once the WMT16 tables have been created.
+
+optional arguments:
+  -h, --help            Show this help message and exit.
+  --dry-run             Enable dry run to only list missing groups and
+                        indexes.
+
+"""
+import argparse
+import os
+import sys
+
+PARSER = argparse.ArgumentParser(description="Creates groups and indexes " \
+  "required by the WMT16 application.")
+PARSER.add_argument("--dry-run", action="store_true", default=False,
+  dest="dry_run_enabled", help="Enable dry run to only list missing " \
+  "groups and indexes.")
+
+
+if __name__ == "__main__":
+    args = PARSER.parse_args()
+
+    # Properly set DJANGO_SETTINGS_MODULE environment variable.
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
+    PROJECT_HOME = os.path.normpath(os.getcwd() + "/..")
+    sys.path.append(PROJECT_HOME)
+
+    # We have just added appraise to the system path list, hence this works.
+    from django.db import transaction
+    from appraise.wmt16.models import create_composite_indexes, \
+      initialize_database
+
+    _suffix = ' (dry run)' if args.dry_run_enabled else ''
+    with transaction.commit_on_success():
+        created_names = initialize_database(args.dry_run_enabled)
+
+    for group_name in created_names:
+        print 'Created group {0}{1}.'.format(group_name, _suffix)
+
+    print 'Created {0} group(s), all others exist already{1}.'.format(
+      len(created_names), _suffix)
+
+    created_names = create_composite_indexes(args.dry_run_enabled)
+    for index_name in created_names:
+        print 'Created index {0}{1}.'.format(index_name, _suffix)
+
+    print 'Created {0} index(es), all others exist already{1}.'.format(
+      len(created_names), _suffix)
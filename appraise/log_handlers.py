@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Project: Appraise evaluation system
+ Author: Christian Federmann <cfedermann@gmail.com>
+
+Logging handlers for Appraise.  This module is imported by settings.py,
+so it must not depend on Django or other Appraise modules.
+"""
+import logging
+import os
+import threading
+
+from Queue import Queue, Full
+
+
+class QueueHandler(logging.Handler):
+    """
+    Hands log records to a background thread which emits them.
+
+    The log message is formatted in the calling thread, so that arguments
+    such as model instances or querysets are evaluated where they belong;
+    writing records to the target handlers, including file rotation, is
+    done by the background thread.  The thread is started on first use and
+    restarted after fork(), so that pre-forking servers work as well.  If
+    the queue is full, records are emitted synchronously instead.
+
+    """
+    def __init__(self, handlers, max_size=10000):
+        """
+        Creates a new handler for the given list of target handlers.
+        """
+        super(QueueHandler, self).__init__()
+        self.handlers = list(handlers)
+        self.max_size = max_size
+        self.queue = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_thread(self):
+        """
+        Starts the background thread for the current process, if needed.
+        """
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+
+            self.queue = Queue(self.max_size)
+            self._thread = threading.Thread(target=self._monitor,
+              args=(self.queue,), name='appraise-logging')
+            self._thread.daemon = True
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _monitor(self, queue):
+        """
+        Emits records from the given queue until None is received.
+        """
+        while True:
+            record = queue.get()
+            try:
+                if record is None:
+                    break
+
+                self.handle_record(record)
+
+            finally:
+                queue.task_done()
+
+    def handle_record(self, record):
+        """
+        Emits the given record to all target handlers.
+        """
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def prepare(self, record):
+        """
+        Formats message and exception text of record in the calling thread.
+
+        Afterwards, the record does not reference arguments or traceback
+        objects anymore and can be emitted by any thread.
+
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+              record.exc_info)
+            record.exc_info = None
+
+        return record
+
+    def emit(self, record):
+        """
+        Queues the given record for the background thread.
+        """
+        try:
+            record = self.prepare(record)
+            self._ensure_thread()
+            self.queue.put_nowait(record)
+
+        except Full:
+            self.handle_record(record)
+
+        # pylint: disable-msg=W0703
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        """
+        Waits until all queued records have been emitted.
+        """
+        if self._pid == os.getpid() and self._thread is not None:
+            self.queue.join()
+
+        for handler in self.handlers:
+            handler.flush()
+
+    def close(self):
+        """
+        Emits all queued records, stops the background thread and closes
+        the target handlers.
+        """
+        if self._pid == os.getpid() and self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+        for handler in self.handlers:
+            handler.close()
+
+        super(QueueHandler, self).close()
@@ -0,0 +1,551 @@
+# -*- coding: utf-8 -*-
+"""
+Project: Appraise evaluation system
+ Author: Christian Federmann <cfedermann@gmail.com>
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import re
+
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+from itertools import count
+from threading import local, RLock
+from time import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.util import CursorDebugWrapper, CursorWrapper
+from django.template.base import Template
+
+from appraise.settings import LOG_LEVEL, LOG_HANDLER, \
+  REQUEST_STATS_ENABLED, REQUEST_STATS_WINDOW, REQUEST_LOG_HANDLER, \
+  PROFILE_ENABLED, PROFILE_PATH, PROFILE_SAMPLE_EVERY, PROFILE_MAX_FILES, \
+  PROFILE_TOP_FUNCTIONS
+
+# Setup logging support.
+logging.basicConfig(level=LOG_LEVEL)
+LOGGER = logging.getLogger('appraise.middleware')
+LOGGER.addHandler(LOG_HANDLER)
+
+# Per-request statistics are logged as JSON lines to their own log file.
+REQUEST_LOGGER = logging.getLogger('appraise.requests')
+REQUEST_LOGGER.addHandler(REQUEST_LOG_HANDLER)
+REQUEST_LOGGER.propagate = False
+
+# Rolling window of the latest request statistics, per view.
+REQUEST_STATS = OrderedDict()
+REQUEST_STATS_LOCK = RLock()
+
+# Statistics for the request currently handled by this thread.
+_STATE = local()
+
+# Statistics fields for which percentiles are computed.
+REQUEST_STATS_FIELDS = ('queries', 'db_ms', 'template_ms', 'total_ms')
+
+# Profile file names start with a timestamp, followed by the view name.
+PROFILE_NAME_PATTERN = re.compile(r'^(\d{8}-\d{6}-\d{6})-([\w.]+)\.prof$')
+PROFILE_HEADER = 'HTTP_X_APPRAISE_PROFILE'
+PROFILE_PARAMETER = 'profile'
+
+
+def query_budget(max_queries):
+    """
+    Declares the maximum number of queries the decorated view may execute.
+
+    RequestStatsMiddleware logs a warning for requests exceeding the budget.
+
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+
+    return decorator
+
+
+def _view_name(view_func):
+    """
+    Returns the dotted name of the given view function.
+    """
+    return '{0}.{1}'.format(getattr(view_func, '__module__', None),
+      getattr(view_func, '__name__', view_func.__class__.__name__))
+
+
+def _current_stats():
+    """
+    Returns statistics for the current request or None if not recording.
+    """
+    return getattr(_STATE, 'stats', None)
+
+
+class QueryStatsCursorWrapper(CursorWrapper):
+    """
+    Counts queries and database time for the current request.
+    """
+    def _record(self, start):
+        """
+        Adds a query started at the given time to the current statistics.
+        """
+        _stats = _current_stats()
+        if _stats is not None:
+            _stats['queries'] += 1
+            _stats['db_time'] += time() - start
+
+    def execute(self, sql, params=()):
+        """
+        Executes the given query, recording its duration.
+        """
+        self.set_dirty()
+        _start = time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self._record(_start)
+
+    def executemany(self, sql, param_list):
+        """
+        Executes the given query for all params, recording its duration.
+        """
+        self.set_dirty()
+        _start = time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self._record(_start)
+
+
+def _make_stats_cursor(connection, cursor):
+    """
+    Wraps the given cursor, keeping Django's debug cursor if DEBUG is set.
+    """
+    if settings.DEBUG:
+        cursor = CursorDebugWrapper(cursor, connection)
+    return QueryStatsCursorWrapper(cursor, connection)
+
+
+_TEMPLATE_RENDER = Template.render
+
+# Number of requests, in any thread, which currently time template renders.
+_TEMPLATE_TIMERS = [0]
+_TEMPLATE_TIMERS_LOCK = RLock()
+
+
+def _timed_template_render(template, context):
+    """
+    Renders the given template, adding its render time to the statistics.
+
+    Only top-level templates are timed, included ones are part of these.
+
+    """
+    _stats = _current_stats()
+    if _stats is None or _stats['template_depth'] > 0:
+        return _TEMPLATE_RENDER(template, context)
+
+    _stats['template_depth'] += 1
+    _start = time()
+    try:
+        return _TEMPLATE_RENDER(template, context)
+    finally:
+        _stats['template_time'] += time() - _start
+        _stats['template_depth'] -= 1
+
+
+def _install_template_timer():
+    """
+    Makes Template.render() time renders while statistics are recorded.
+
+    The timer is only installed while at least one request is recorded and
+    _timed_template_render() ignores threads which do not record.
+
+    """
+    with _TEMPLATE_TIMERS_LOCK:
+        if _TEMPLATE_TIMERS[0] == 0:
+            Template.render = _timed_template_render
+        _TEMPLATE_TIMERS[0] += 1
+
+
+def _uninstall_template_timer():
+    """
+    Restores the original Template.render() once no request is recorded.
+    """
+    with _TEMPLATE_TIMERS_LOCK:
+        _TEMPLATE_TIMERS[0] -= 1
+        if _TEMPLATE_TIMERS[0] == 0:
+            Template.render = _TEMPLATE_RENDER
+
+
+def _install_stats_cursors():
+    """
+    Makes all database connections count queries for the current thread.
+
+    Connections are thread-local, hence this only affects the current
+    thread.  Nested calls are counted;  the original cursors are restored
+    by the matching call to _uninstall_stats_cursors().
+
+    """
+    _STATE.cursors = getattr(_STATE, 'cursors', 0) + 1
+    if _STATE.cursors > 1:
+        return
+
+    # Debug cursors are created per connection, we wrap them to count.
+    _STATE.use_debug_cursor = {}
+    for _connection in connections.all():
+        _STATE.use_debug_cursor[_connection.alias] = \
+          _connection.use_debug_cursor
+        _connection.use_debug_cursor = True
+        _connection.make_debug_cursor = partial(_make_stats_cursor,
+          _connection)
+
+
+def _uninstall_stats_cursors():
+    """
+    Restores the cursors replaced by _install_stats_cursors().
+    """
+    _STATE.cursors -= 1
+    if _STATE.cursors > 0:
+        return
+
+    for _connection in connections.all():
+        if _connection.alias in _STATE.use_debug_cursor:
+            _connection.use_debug_cursor = \
+              _STATE.use_debug_cursor[_connection.alias]
+            del _connection.make_debug_cursor
+
+
+def _new_stats():
+    """
+    Returns an empty statistics dictionary, starting now.
+    """
+    return {'start': time(), 'queries': 0, 'db_time': 0.0,
+      'template_time': 0.0, 'template_depth': 0, 'view': None,
+      'budget': None}
+
+
+@contextmanager
+def record_query_stats():
+    """
+    Records statistics for code running outside of a request.
+
+    Yields the statistics dictionary, which contains the number of queries
+    and the database and template times in seconds.  Not meant to be used
+    around test client requests, which are recorded by
+    RequestStatsMiddleware and attached to the response instead.
+
+    """
+    _install_stats_cursors()
+    _install_template_timer()
+    _previous = _current_stats()
+    _STATE.stats = _new_stats()
+    try:
+        yield _STATE.stats
+
+    finally:
+        _STATE.stats = _previous
+        _uninstall_template_timer()
+        _uninstall_stats_cursors()
+
+
+def _percentile(values, percent):
+    """
+    Returns the given percentile of the sorted values, nearest rank.
+    """
+    if not values:
+        return None
+
+    _index = int(round(percent / 100.0 * len(values) + 0.5)) - 1
+    return values[min(max(_index, 0), len(values) - 1)]
+
+
+def get_request_stats():
+    """
+    Returns rolling percentiles of request statistics for all views.
+
+    Each row contains view name, query budget, number of recorded requests
+    and requests over budget, plus 50th, 90th and 99th percentiles and the
+    maximum for each of REQUEST_STATS_FIELDS.
+
+    """
+    rows = []
+    with REQUEST_STATS_LOCK:
+        _views = [(x, list(y)) for x, y in REQUEST_STATS.items()]
+
+    for view, records in _views:
+        _budget = records[-1]['budget']
+        row = {'view': view, 'budget': _budget, 'requests': len(records),
+          'over_budget': len([x for x in records if x['over_budget']])}
+
+        for field in REQUEST_STATS_FIELDS:
+            _values = sorted([x[field] for x in records])
+            row[field] = {'p50': _percentile(_values, 50),
+              'p90': _percentile(_values, 90),
+              'p99': _percentile(_values, 99), 'max': _values[-1]}
+
+        rows.append(row)
+
+    return rows
+
+
+class RequestStatsMiddleware(object):
+    """
+    Records query count, database time, template render time and total
+    latency for each request.
+
+    Statistics are logged to REQUEST_LOG_FILENAME, kept in a rolling window
+    of REQUEST_STATS_WINDOW requests per view and attached to the response
+    as request_stats attribute.  Enabled using REQUEST_STATS_ENABLED.
+
+    """
+    def __init__(self):
+        """
+        Disables this middleware unless enabled in settings.
+        """
+        if not REQUEST_STATS_ENABLED:
+            raise MiddlewareNotUsed
+
+    def process_request(self, request):
+        """
+        Starts recording statistics for the given request.
+
+        Query counting cursors and the template render timer are only
+        installed until process_response() has handled the request.
+
+        """
+        _install_stats_cursors()
+        _install_template_timer()
+        request._request_stats = True
+        _STATE.stats = _new_stats()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Remembers name and query budget of the view handling the request.
+        """
+        _stats = _current_stats()
+        if _stats is not None:
+            _stats['view'] = _view_name(view_func)
+            _stats['budget'] = getattr(view_func, 'query_budget', None)
+
+    def process_response(self, request, response):
+        """
+        Logs and stores the statistics recorded for the given request.
+        """
+        _stats = _current_stats()
+        _STATE.stats = None
+
+        # process_request() may not have run if another middleware returned
+        # a response before.
+        if getattr(request, '_request_stats', False):
+            request._request_stats = False
+            _uninstall_template_timer()
+            _uninstall_stats_cursors()
+
+        if _stats is None or _stats['view'] is None:
+            return response
+
+        record = {
+          'view': _stats['view'],
+          'method': request.method,
+          'path': request.path,
+          'status': response.status_code,
+          'queries': _stats['queries'],
+          'db_ms': round(1000 * _stats['db_time'], 2),
+          'template_ms': round(1000 * _stats['template_time'], 2),
+          'total_ms': round(1000 * (time() - _stats['start']), 2),
+          'budget': _stats['budget'],
+          'over_budget': _stats['budget'] is not None \
+            and _stats['queries'] > _stats['budget'],
+        }
+
+        if REQUEST_LOGGER.isEnabledFor(logging.INFO):
+            REQUEST_LOGGER.info(json.dumps(record, sort_keys=True))
+        if record['over_budget']:
+            LOGGER.warning('View %s executed %s queries, query budget is %s.',
+              record['view'], record['queries'], record['budget'])
+
+        with REQUEST_STATS_LOCK:
+            if not record['view'] in REQUEST_STATS:
+                REQUEST_STATS[record['view']] = deque(
+                  maxlen=REQUEST_STATS_WINDOW)
+            REQUEST_STATS[record['view']].append(record)
+
+        response.request_stats = record
+        return response
+
+
+def _profile_file_names():
+    """
+    Returns names of all profiles in PROFILE_PATH, oldest first.
+    """
+    if not os.path.isdir(PROFILE_PATH):
+        return []
+
+    return sorted([x for x in os.listdir(PROFILE_PATH)
+      if PROFILE_NAME_PATTERN.match(x)])
+
+
+def _rotate_profiles():
+    """
+    Removes all but the latest PROFILE_MAX_FILES profiles.
+    """
+    _names = _profile_file_names()
+    for _name in _names[:max(len(_names) - PROFILE_MAX_FILES, 0)]:
+        try:
+            os.remove(os.path.join(PROFILE_PATH, _name))
+
+        # Another worker process may have removed the file already.
+        except OSError:
+            pass
+
+
+def save_profile(profiler, view_name):
+    """
+    Saves the given profiler's statistics to PROFILE_PATH.
+
+    Returns the name of the new .prof file, which can be loaded using
+    pstats or any compatible viewer.
+
+    """
+    if not os.path.isdir(PROFILE_PATH):
+        os.makedirs(PROFILE_PATH)
+
+    name = '{0}-{1}.prof'.format(datetime.now().strftime('%Y%m%d-%H%M%S-%f'),
+      re.sub(r'[^\w.]', '_', view_name))
+    profiler.dump_stats(os.path.join(PROFILE_PATH, name))
+    _rotate_profiles()
+    return name
+
+
+def get_profile_path(name):
+    """
+    Returns the path for the given profile name or None if invalid.
+    """
+    if not PROFILE_NAME_PATTERN.match(name):
+        return None
+
+    path = os.path.join(PROFILE_PATH, name)
+    if not os.path.isfile(path):
+        return None
+
+    return path
+
+
+def _load_profile(name):
+    """
+    Returns a dictionary describing the given profile and its pstats.Stats.
+    """
+    _match = PROFILE_NAME_PATTERN.match(name)
+    stats = pstats.Stats(os.path.join(PROFILE_PATH, name))
+    profile = {'name': name, 'view': _match.group(2),
+      'created': datetime.strptime(_match.group(1), '%Y%m%d-%H%M%S-%f'),
+      'calls': stats.total_calls, 'total_ms': 1000 * stats.total_tt}
+    return profile, stats
+
+
+def get_recent_profiles():
+    """
+    Returns summaries for all profiles in PROFILE_PATH, latest first.
+    """
+    profiles = []
+    for name in reversed(_profile_file_names()):
+        try:
+            profiles.append(_load_profile(name)[0])
+
+        # Profiles may be rotated away or still be written to.
+        except (EnvironmentError, EOFError, ValueError), msg:
+            LOGGER.info('Skipping profile {0}: {1}'.format(name, msg))
+
+    return profiles
+
+
+def get_profile_details(name, limit=PROFILE_TOP_FUNCTIONS):
+    """
+    Returns the summary for the given profile with its top functions.
+
+    Functions are sorted by cumulative time.  Returns None if there is no
+    profile with the given name.
+
+    """
+    if get_profile_path(name) is None:
+        return None
+
+    profile, stats = _load_profile(name)
+    stats.sort_stats('cumulative')
+
+    profile['functions'] = []
+    for func in stats.fcn_list[:limit]:
+        primitive_calls, calls, total_time, cumulative_time, _ = \
+          stats.stats[func]
+        profile['functions'].append({
+          'function': pstats.func_std_string(func),
+          'calls': calls,
+          'primitive_calls': primitive_calls,
+          'total_ms': 1000 * total_time,
+          'cumulative_ms': 1000 * cumulative_time,
+          'per_call_ms': 1000 * cumulative_time / (primitive_calls or 1),
+        })
+
+    return profile
+
+
+class RequestProfilerMiddleware(object):
+    """
+    Runs selected views under cProfile and saves the results to
+    PROFILE_PATH, see save_profile().
+
+    Superusers can profile a request by adding ?profile=1 or an
+    X-Appraise-Profile header;  if PROFILE_SAMPLE_EVERY is set, every Nth
+    request is profiled as well.  Profiled responses carry the name of the
+    saved profile in their X-Appraise-Profile header.  Has to be listed
+    after AuthenticationMiddleware.
+
+    """
+    def __init__(self):
+        """
+        Disables this middleware unless enabled in settings.
+        """
+        if not PROFILE_ENABLED:
+            raise MiddlewareNotUsed
+
+        self.request_counter = count(1)
+
+    def _should_profile(self, request):
+        """
+        Checks if the given request should be profiled.
+        """
+        if PROFILE_SAMPLE_EVERY > 0 \
+          and next(self.request_counter) % PROFILE_SAMPLE_EVERY == 0:
+            return True
+
+        if not PROFILE_PARAMETER in request.GET \
+          and not PROFILE_HEADER in request.META:
+            return False
+
+        _user = getattr(request, 'user', None)
+        return _user is not None and _user.is_superuser
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Runs the view under cProfile if the request should be profiled.
+        """
+        if not self._should_profile(request):
+            return None
+
+        view_name = _view_name(view_func)
+        profiler = cProfile.Profile()
+        try:
+            response = profiler.runcall(view_func, request, *view_args,
+              **view_kwargs)
+
+        # Profiles of failing requests are saved as well.
+        finally:
+            name = save_profile(profiler, view_name)
+            LOGGER.info('Saved profile {0} for {1}.'.format(name,
+              request.path))
+
+        response['X-Appraise-Profile'] = name
+        return response
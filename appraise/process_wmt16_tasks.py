@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Project: Appraise evaluation system
+ Author: Christian Federmann <cfedermann@gmail.com>
+
+usage: python process_wmt16_tasks.py
+               [-h] [--once] [--interval INTERVAL] [--max-tasks MAX_TASKS]
+
+Processes deferred WMT16 work, such as the follow-up work after an
+annotator has completed a HIT, from the database-backed task queue; see
+appraise.wmt16.tasks.  Runs until interrupted, checking for new tasks
+every INTERVAL seconds, or drains the queue once, e.g., from cron.
+
+optional arguments:
+  -h, --help            Show this help message and exit.
+  --once                Process pending tasks once, then exit.
+  --interval INTERVAL   Seconds to wait when the queue is empty.
+  --max-tasks MAX_TASKS
+                        Maximum number of tasks to process per run.
+
+"""
+from time import sleep, time
+import argparse
+import os
+import sys
+
+PARSER = argparse.ArgumentParser(description="Processes deferred WMT16 " \
+  "work from the database-backed task queue.")
+PARSER.add_argument("--once", action="store_true", default=False,
+  dest="once", help="Process pending tasks once, then exit.")
+PARSER.add_argument("--interval", action="store", default=2.0,
+  dest="interval", help="Seconds to wait when the queue is empty.",
+  type=float)
+PARSER.add_argument("--max-tasks", action="store", default=None,
+  dest="max_tasks", help="Maximum number of tasks to process per run.",
+  type=int)
+
+
+if __name__ == "__main__":
+    args = PARSER.parse_args()
+
+    # Properly set DJANGO_SETTINGS_MODULE environment variable.
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
+    PROJECT_HOME = os.path.normpath(os.getcwd() + "/..")
+    sys.path.append(PROJECT_HOME)
+
+    # We have just added appraise to the system path list, hence this works.
+    from django.db import connection
+    from appraise.wmt16.tasks import process_tasks
+
+    try:
+        while True:
+            _start = time()
+            succeeded, failed = process_tasks(args.max_tasks)
+            if succeeded or failed or args.once:
+                print 'Processed {0} task(s), {1} failed, in {2:.2f} ' \
+                  'seconds.'.format(succeeded + failed, failed,
+                  time() - _start)
+
+            if args.once:
+                break
+
+            # Do not keep a database connection open while waiting.
+            if not succeeded and not failed:
+                connection.close()
+                sleep(args.interval)
+
+    except KeyboardInterrupt:
+        pass
@@ -5,11 +5,19 @@ Project: Appraise evaluation system
  Author: Christian Federmann <cfedermann@gmail.com>
 
 usage: python repair_wmt16_xml.py
-               [-h] [--dry-run]
-               hits-file
+               [-h] [--dry-run] [--processes PROCESSES]
+               hits-file [hits-file ...]
 
-Checks and repairs a given XML file containing HITs for WMT16. Uses
-appraise.wmt16.validators.validate_hits_xml_file() for validation.
+Checks and repairs given XML files containing HITs for WMT16. Uses
+appraise.wmt16.validators.iter_hits_xml_file() for validation.
+
+Each file is repaired in a single pass:  bare "&" and "<" characters inside
+text nodes and attribute values are escaped, and missing semicolons after
+predefined entities are added.  Every repair is reported with its line and
+column.  Tags wrapped across lines are repaired as a whole;  tags which are
+still unterminated after MAX_MARKUP_LINES lines or at the end of the file
+are reported and left unchanged.  Repaired files are written to
+"<hits-file>.fixed".
 
 positional arguments:
   hits-file             XML file(s) containing HITs. Can be multiple files
@@ -18,54 +26,290 @@ positional arguments:
 optional arguments:
   -h, --help            Show this help message and exit.
   --dry-run             Enable dry run to simulate repair.
+  --processes PROCESSES
+                        Number of worker processes repairing files in
+                        parallel.
 
 """
 from django.core.exceptions import ValidationError
 
-from time import sleep
+from functools import partial
+from multiprocessing import Pool
 import argparse
+import io
 import os
 import re
 import sys
 
-from xml.etree.ElementTree import fromstring, tostring
-
-PARSER = argparse.ArgumentParser(description="Checks and repairs a given " \
-  "XML file containing HITs for WMT16. Uses\nappraise.wmt16.validators." \
-  "validate_hits_xml_file() for validation.")
-PARSER.add_argument("hits_file", metavar="hits-file", help="XML file " \
-  "containing HITs.")
+PARSER = argparse.ArgumentParser(description="Checks and repairs given " \
+  "XML files containing HITs for WMT16. Uses\nappraise.wmt16.validators." \
+  "iter_hits_xml_file() for validation.")
+PARSER.add_argument("hits_file", metavar="hits-file", help="XML file(s) " \
+  "containing HITs.  Can be multiple files using patterns such as '*.xml' " \
+  "or similar.", nargs='+')
 PARSER.add_argument("--dry-run", action="store_true", default=False,
   dest="dry_run_enabled", help="Enable dry run to simulate repair.")
+PARSER.add_argument("--processes", action="store", default=1,
+  dest="processes", help="Number of worker processes repairing files in " \
+  "parallel.", type=int)
+
+
+# Element names which can occur in HITs XML files.  Any "<" which does not
+# start a tag for one of these, a comment or processing instruction is a
+# bare "<" inside a text node.
+HITS_XML_TAGS = ('hits', 'hit', 'seg', 'source', 'reference', 'translation')
+
+MARKUP_PATTERN = re.compile(ur'''<(?:\?.*?\?>|!--.*?-->|/?(?:{0})(?=[\s/>])
+  (?:\s+[\w.:-]+\s*=\s*(?:"[^"<]*"|'[^'<]*'))*\s*/?>)'''.format(
+  '|'.join(HITS_XML_TAGS)), re.UNICODE | re.VERBOSE | re.DOTALL)
+
+# Matches markup which is valid so far but unterminated at the end of the
+# text, i.e., a tag, comment or processing instruction wrapped across lines.
+PARTIAL_MARKUP_PATTERN = re.compile(ur'''<(?:\?(?:(?!\?>).)*|!--(?:(?!-->).)*
+  |/?(?:{0})(?=\s|\Z)(?:\s+[\w.:-]+\s*=\s*(?:"[^"<]*"|'[^'<]*'))*
+  (?:\s+[\w.:-]*(?:\s*=\s*(?:"[^"<]*|'[^'<]*)?)?)?\s*)\Z'''.format(
+  '|'.join(HITS_XML_TAGS)), re.UNICODE | re.VERBOSE | re.DOTALL)
+
+# Maximum number of lines a single tag may span.
+MAX_MARKUP_LINES = 50
+
+ENTITY_PATTERN = re.compile(ur'''&(?:(amp|lt|gt|quot|apos)(;|(?![\w#]))
+  |\#[0-9]+;|\#x[0-9a-fA-F]+;)''', re.UNICODE | re.VERBOSE)
+
+SPECIAL_PATTERN = re.compile(u'[<&]')
+
+
+class UnterminatedMarkup(Exception):
+    """
+    Raised by repair_line() for markup wrapped across lines.
+    
+    The offset attribute contains the position of the markup's "<".
+    
+    """
+    def __init__(self, offset):
+        """
+        Creates a new exception for markup starting at the given offset.
+        """
+        super(UnterminatedMarkup, self).__init__(offset)
+        self.offset = offset
+
+
+def repair_ampersands(text, line_no, offset, repairs):
+    """
+    Escapes bare "&" characters in text, which must not contain markup.
+    
+    Predefined entities missing their semicolon get one.  Repairs are
+    appended to repairs as (line, column, before, after) tuples;  offset is
+    the column of text inside its line.
+    
+    """
+    result = []
+    pos = 0
+    while True:
+        i = text.find(u'&', pos)
+        if i < 0:
+            result.append(text[pos:])
+            return u''.join(result)
+        
+        result.append(text[pos:i])
+        _match = ENTITY_PATTERN.match(text, i)
+        if _match is None:
+            result.append(u'&amp;')
+            repairs.append((line_no, offset + i + 1, u'&', u'&amp;'))
+            pos = i + 1
+        
+        elif _match.group(1) and not _match.group(2):
+            _entity = u'&{0};'.format(_match.group(1))
+            result.append(_entity)
+            repairs.append((line_no, offset + i + 1, _match.group(0), _entity))
+            pos = _match.end()
+        
+        else:
+            result.append(_match.group(0))
+            pos = _match.end()
+
+
+def repair_line(line, line_no, repairs):
+    """
+    Returns the repaired version of the given line from a HITs XML file.
+    
+    Bare "<" characters are escaped, as are bare "&" characters both in text
+    nodes and in attribute values.  Raises UnterminatedMarkup if the line
+    ends inside a tag;  the caller should then retry with the next line
+    appended, see repair_lines().
+    
+    """
+    result = []
+    pos = 0
+    while True:
+        _match = SPECIAL_PATTERN.search(line, pos)
+        if _match is None:
+            result.append(repair_ampersands(line[pos:], line_no, pos, repairs))
+            return u''.join(result)
+        
+        i = _match.start()
+        if line[i] == u'&':
+            _end = line.find(u'<', i)
+            if _end < 0:
+                _end = len(line)
+            
+            result.append(repair_ampersands(line[pos:_end], line_no, pos,
+              repairs))
+            pos = _end
+            continue
+        
+        result.append(line[pos:i])
+        _markup = MARKUP_PATTERN.match(line, i)
+        if _markup is None and PARTIAL_MARKUP_PATTERN.match(line, i):
+            raise UnterminatedMarkup(i)
+        
+        if _markup is None:
+            result.append(u'&lt;')
+            repairs.append((line_no, i + 1, u'<', u'&lt;'))
+            pos = i + 1
+        
+        else:
+            result.append(repair_ampersands(_markup.group(0), line_no, i,
+              repairs))
+            pos = _markup.end()
+
+
+def locate(text, line_no, offset):
+    """
+    Returns (line, column) of offset in text starting at line_no.
+    """
+    return (line_no + text.count(u'\n', 0, offset),
+      offset - text.rfind(u'\n', 0, offset))
+
+
+def repair_lines(text, line_no, repairs):
+    """
+    Returns the repaired version of the given text starting at line_no.
+    
+    Works like repair_line() but text may span several lines, e.g., if a
+    tag is wrapped;  repairs are reported with their actual line and column.
+    
+    """
+    _repairs = []
+    _fixed = repair_line(text, line_no, _repairs)
+    for _line, _column, _before, _after in _repairs:
+        repairs.append(locate(text, line_no, _column - 1) + (_before, _after))
+    
+    return _fixed
 
 
-XML_REPAIR_PATTERNS = [
-  (u'& ', u'&amp; '),
-  (u'&amp ', u'&amp; '),
-  (u'&quot ', u'&quot; '),
-  (u'R&D', u'R&amp;D'),
-  (u'R & D', u'R &amp; D'),
-  (u'A&E', u'A&amp;E'),
-  (u'CD&V', u'CD&amp;V'),
-  (u'CD & V', u'CD &amp; V'),
-  (u'>Grub<', u'&gt;Grub&lt;'),
-  (u'S&P', u'S&amp;P'),
-  (u'S & P', u'S &amp; P'),
-  (u'&Poor ', u'&amp;Poor '),
-  (u'&.', u'&amp;.'),
-  (u'<службе', u'&lt;службе'),
-  (u'<security', u'&lt;security'),
-  (u'< ', u'&lt; '),
-  (u'B&Q', u'B&amp;Q'),
-  (u'B&F', u'B&amp;F'),
-  (u'Q&A', u'Q&amp;A'),
-  (u'</p >', u'&lt;/p &gt;'),
-  (u'<dollar-symbol>', u'&lt;dollar-symbol&gt;'),
-  (u'Б&', u'Б&amp;'),
-  (u'B&S', u'B&amp;S'),
-  (u'b&', u'b&amp;'),
-  (u'B & Q', u'B &amp; Q'),
-]
+class RepairedHitsFile(object):
+    """
+    File-like object providing the repaired contents of a HITs XML file.
+    
+    Lines are read, repaired and, if outfile is given, written on demand.
+    Hence, the repaired contents can be validated using iterparse() while
+    the fixed file is written, all in a single pass over the input file.
+    
+    """
+    def __init__(self, hits_file, outfile=None):
+        """
+        Opens the given HITs file for reading.
+        """
+        self.infile = io.open(hits_file, encoding='utf-8', newline='')
+        self.outfile = outfile
+        self.repairs = []
+        self.unrepairable = []
+        self.line_no = 0
+        self._buffer = ''
+    
+    def read(self, size=-1):
+        """
+        Returns up to size bytes of repaired, UTF-8 encoded XML.
+        """
+        while size < 0 or len(self._buffer) < size:
+            line = self.infile.readline()
+            if not line:
+                break
+            
+            self.line_no += 1
+            _fixed = self._repair(line)
+            _fixed = _fixed.encode('utf-8')
+            if self.outfile is not None:
+                self.outfile.write(_fixed)
+            
+            self._buffer += _fixed
+        
+        if size < 0:
+            size = len(self._buffer)
+        
+        _data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return _data
+    
+    def _repair(self, line):
+        """
+        Repairs the given line, appending lines while a tag is unterminated.
+        
+        Markup still unterminated after MAX_MARKUP_LINES lines or at the end
+        of the file is recorded in self.unrepairable and left unchanged.
+        
+        """
+        _line_no = self.line_no
+        _lines = 1
+        while True:
+            try:
+                return repair_lines(line, _line_no, self.repairs)
+            
+            except UnterminatedMarkup, _error:
+                _next = u''
+                if _lines < MAX_MARKUP_LINES:
+                    _next = self.infile.readline()
+                
+                if not _next:
+                    self.unrepairable.append(locate(line, _line_no,
+                      _error.offset))
+                    return line
+                
+                self.line_no += 1
+                _lines += 1
+                line += _next
+    
+    def close(self):
+        """
+        Reads all remaining input, then closes the input file.
+        """
+        while self.read(65536):
+            pass
+        
+        self.infile.close()
+
+
+def repair_hits_file(hits_file, dry_run=False):
+    """
+    Repairs the given HITs file.
+    
+    Returns a (hits_file, repairs, unrepairable, error) tuple;  unrepairable
+    contains (line, column) positions of unterminated markup.  Unless
+    dry_run is set, the repaired file is written to hits_file.fixed.  The
+    repaired contents are validated on the fly;  error contains the
+    validation messages if the file is still invalid after repair.
+    
+    """
+    from appraise.wmt16.validators import validate_hits_xml_stream
+    
+    _outfile = None
+    if not dry_run:
+        _outfile = open('{0}.fixed'.format(hits_file), 'wb')
+    
+    _error = None
+    _repaired = RepairedHitsFile(hits_file, _outfile)
+    try:
+        validate_hits_xml_stream(_repaired)
+    
+    except ValidationError, msg:
+        _error = msg.messages
+    
+    finally:
+        _repaired.close()
+        if _outfile is not None:
+            _outfile.close()
+    
+    return (hits_file, _repaired.repairs, _repaired.unrepairable, _error)
 
 
 if __name__ == "__main__":
@@ -76,34 +320,41 @@ if __name__ == "__main__":
     PROJECT_HOME = os.path.normpath(os.getcwd() + "/..")
     sys.path.append(PROJECT_HOME)
     
-    # We have just added appraise to the system path list, hence this works.
-    from appraise.wmt16.validators import validate_hits_xml_file
-
-    with open(args.hits_file) as infile:
-        hits_xml_string = unicode(infile.read(), "utf-8")
-        loop_counter = 0
+    _repair = partial(repair_hits_file, dry_run=args.dry_run_enabled)
+    if args.processes > 1:
+        _pool = Pool(args.processes)
+        _results = _pool.imap(_repair, args.hits_file)
+    
+    else:
+        _results = (_repair(x) for x in args.hits_file)
+    
+    _invalid = 0
+    for _hits_file, _repairs, _unrepairable, _error in _results:
+        print '[{0}]'.format(_hits_file)
+        for _line, _column, _before, _after in _repairs:
+            print u'{0}:{1}: {2} --> {3}'.format(_line, _column, _before,
+              _after).encode('utf-8')
         
-        while loop_counter < 10:
-            print "loop counter: ", loop_counter
-            loop_counter += 1
-
-            try:
-                # Validate XML before trying to import anything from the given file.
-                validate_hits_xml_file(hits_xml_string)
-                break
-
-            except ValidationError, msg:
-                print msg
-                for key, value in XML_REPAIR_PATTERNS:
-                    print repr(key), "-->", repr(value)
-                    patched_hits_xml_string = unicode.replace(hits_xml_string, key, value)
-                    hits_xml_string = patched_hits_xml_string
-                    
-                continue
-
-    if not args.dry_run_enabled:
-        fixed_filename = '{0}.fixed'.format(args.hits_file)
-        print 'Writing fixed file to "{0}"...'.format(fixed_filename)
-        with open(fixed_filename, 'w') as outfile:
-            outfile.write(hits_xml_string.encode('utf-8'))
-
+        for _line, _column in _unrepairable:
+            print '{0}:{1}: unterminated tag, cannot repair'.format(_line,
+              _column)
+        
+        if _error is not None:
+            _invalid += 1
+            print u'Still invalid after {0} repair(s): {1}'.format(
+              len(_repairs), u' '.join(_error)).encode('utf-8')
+        
+        else:
+            print 'Valid after {0} repair(s).'.format(len(_repairs))
+        
+        if not args.dry_run_enabled:
+            print 'Wrote fixed file to "{0}.fixed".'.format(_hits_file)
+        
+        print
+    
+    if args.processes > 1:
+        _pool.close()
+        _pool.join()
+    
+    if _invalid:
+        sys.exit(-1)
@@ -60,12 +60,10 @@ if __name__ == "__main__":
         print "ERROR: requested number of tokens is insane..."
         sys.exit(-2)
     
-    # Generate user invite tokens.
-    generated_tokens = []
-    for _ in range(number):
-        new_token = UserInviteToken(group=group)
-        new_token.save()
-        generated_tokens.append(new_token.token)
+    # Generate user invite tokens, allocated and inserted in a single batch.
+    generated_tokens = UserInviteToken._create_tokens(number)
+    UserInviteToken.objects.bulk_create([UserInviteToken(group=group,
+      token=x) for x in generated_tokens])
     
     # Print group name:initial password to screen.
     group_password = md5(group.name).hexdigest()[:8]
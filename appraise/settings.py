@@ -40,38 +40,151 @@ except ImportError:
     GIT_BINARY = 'git'
     SECRET_KEY = ''.join([chr(choice(range(128))) for _ in range(50)])
 
+
+def read_commit_tag(git_dir):
+    """
+    Returns the commit id of HEAD in the given .git directory or None.
+
+    Reads HEAD and refs directly, so that no git process has to be run.
+
+    """
+    try:
+        # Worktrees and submodules use a .git file pointing to the repo.
+        if os.path.isfile(git_dir):
+            with open(git_dir) as git_file:
+                git_dir = os.path.join(os.path.dirname(git_dir),
+                  git_file.read().strip().split('gitdir:', 1)[1].strip())
+
+        with open(os.path.join(git_dir, 'HEAD')) as head_file:
+            head = head_file.read().strip()
+
+        if not head.startswith('ref:'):
+            return head or None
+
+        # Linked worktrees keep refs in the common .git directory.
+        common_dir = os.path.join(git_dir, 'commondir')
+        if os.path.exists(common_dir):
+            with open(common_dir) as common_file:
+                git_dir = os.path.join(git_dir, common_file.read().strip())
+
+        ref = head[len('ref:'):].strip()
+        ref_path = os.path.join(git_dir, *ref.split('/'))
+        if os.path.exists(ref_path):
+            with open(ref_path) as ref_file:
+                return ref_file.read().strip() or None
+
+        with open(os.path.join(git_dir, 'packed-refs')) as packed_file:
+            for line in packed_file:
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+
+    except (IOError, OSError, IndexError):
+        pass
+
+    return None
+
+
+# The commit tag can be set at deploy time in local_settings;  otherwise,
+# it is read from the .git directory next to the appraise package.
 try:
-    from subprocess import check_output
-    commit_log = check_output([GIT_BINARY, 'log', '--pretty=oneline'])
-    # pylint: disable-msg=E1103
-    COMMIT_TAG = commit_log.split('\n')[0].split()[0]
+    from local_settings import COMMIT_TAG
 
-# pylint: disable-msg=W0703
-except Exception, e:
-    COMMIT_TAG = None
+except ImportError:
+    COMMIT_TAG = read_commit_tag(os.path.join(os.path.dirname(
+      os.path.dirname(os.path.abspath(__file__))), '.git'))
 
 FORCE_SCRIPT_NAME = ""
 
 import logging
 from logging.handlers import RotatingFileHandler
+from log_handlers import QueueHandler
+
+# Logging settings for this Django project.  LOG_LEVELS maps logger names,
+# e.g., 'appraise.wmt16.views', to levels overriding LOG_LEVEL.  Log files
+# are written by a background thread, see appraise.log_handlers.
+try:
+    from local_settings import LOG_LEVEL
+
+except ImportError:
+    LOG_LEVEL = logging.DEBUG if DEBUG else logging.INFO
+
+try:
+    from local_settings import LOG_LEVELS
+
+except ImportError:
+    LOG_LEVELS = {}
 
-# Logging settings for this Django project.
 LOG_PATH = ROOT_PATH
-LOG_LEVEL = logging.DEBUG
 LOG_FILENAME = os.path.join(LOG_PATH, 'appraise.log')
 LOG_FORMAT = "[%(asctime)s] %(name)s::%(levelname)s %(message)s"
 LOG_DATE = "%m/%d/%Y @ %H:%M:%S"
 LOG_FORMATTER = logging.Formatter(LOG_FORMAT, LOG_DATE)
 
-LOG_HANDLER = RotatingFileHandler(filename=LOG_FILENAME, mode="a",
-  maxBytes=1024*1024, backupCount=5, encoding="utf-8")
-LOG_HANDLER.setLevel(level=LOG_LEVEL)
-LOG_HANDLER.setFormatter(LOG_FORMATTER)
+LOG_FILE_HANDLER = RotatingFileHandler(filename=LOG_FILENAME, mode="a",
+  maxBytes=1024*1024, backupCount=5, encoding="utf-8", delay=True)
+LOG_FILE_HANDLER.setFormatter(LOG_FORMATTER)
+LOG_HANDLERS = [LOG_FILE_HANDLER]
+
+# During development, log messages are also written to the console.
+if DEBUG:
+    LOG_CONSOLE_HANDLER = logging.StreamHandler()
+    LOG_CONSOLE_HANDLER.setFormatter(LOG_FORMATTER)
+    LOG_HANDLERS.append(LOG_CONSOLE_HANDLER)
+
+LOG_HANDLER = QueueHandler(LOG_HANDLERS)
+
+# Records must not propagate to the root logger:  its StreamHandler, which
+# modules install using logging.basicConfig(), writes in the request thread.
+logging.getLogger('appraise').setLevel(LOG_LEVEL)
+logging.getLogger('appraise').propagate = False
+for _name, _level in LOG_LEVELS.items():
+    logging.getLogger(_name).setLevel(_level)
+
+# Per-request query and timing statistics, see appraise.middleware.  These
+# are logged as JSON lines and kept for the latest REQUEST_STATS_WINDOW
+# requests per view.
+REQUEST_STATS_ENABLED = True
+REQUEST_STATS_WINDOW = 1000
+REQUEST_LOG_FILENAME = os.path.join(LOG_PATH, 'appraise-requests.log')
+
+REQUEST_LOG_FILE_HANDLER = RotatingFileHandler(
+  filename=REQUEST_LOG_FILENAME, mode="a", maxBytes=1024*1024,
+  backupCount=5, encoding="utf-8", delay=True)
+REQUEST_LOG_FILE_HANDLER.setFormatter(logging.Formatter("%(message)s"))
+REQUEST_LOG_HANDLER = QueueHandler([REQUEST_LOG_FILE_HANDLER])
+
+# On-demand request profiling, see appraise.middleware.  Superusers can
+# profile a single request by adding ?profile=1 or an X-Appraise-Profile
+# header;  PROFILE_SAMPLE_EVERY > 0 also profiles every Nth request.  Only
+# the latest PROFILE_MAX_FILES profiles are kept in PROFILE_PATH.
+PROFILE_ENABLED = True
+PROFILE_PATH = os.path.join(ROOT_PATH, 'profiles')
+PROFILE_SAMPLE_EVERY = 0
+PROFILE_MAX_FILES = 50
+PROFILE_TOP_FUNCTIONS = 25
 
 LOGIN_URL = '/{0}login/'.format(DEPLOYMENT_PREFIX)
 LOGIN_REDIRECT_URL = '/{0}'.format(DEPLOYMENT_PREFIX)
 LOGOUT_URL = '/{0}logout/'.format(DEPLOYMENT_PREFIX)
 
+# Deferred work such as HIT completion is stored in the database, see
+# appraise.wmt16.models.QueuedTask, and processed by process_wmt16_tasks.py.
+# Tasks are locked while being processed and retried if they fail.
+TASK_QUEUE_LOCK_SECONDS = 5 * 60
+TASK_QUEUE_MAX_ATTEMPTS = 5
+
+# Limits for in-memory caches, see appraise.utils.BoundedCache.  Entries
+# expire after CACHE_TIMEOUT seconds, None disables expiry.
+CACHE_MAX_ENTRIES = 10000
+CACHE_TIMEOUT = 24 * 60 * 60
+
+# Opt-in zlib compression for XML and result fields, see
+# appraise.fields.CompressedTextField.  Values shorter than
+# COMPRESS_MIN_LENGTH characters are stored uncompressed.
+COMPRESS_TEXT_FIELDS = False
+COMPRESS_MIN_LENGTH = 256
+
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
 # although not all choices may be available on all operating systems.
@@ -120,10 +233,12 @@ TEMPLATE_LOADERS = (
 )
 
 MIDDLEWARE_CLASSES = (
+  'appraise.middleware.RequestStatsMiddleware',
   'django.middleware.common.CommonMiddleware',
   'django.contrib.sessions.middleware.SessionMiddleware',
   'django.contrib.messages.middleware.MessageMiddleware',
   'django.contrib.auth.middleware.AuthenticationMiddleware',
+  'appraise.middleware.RequestProfilerMiddleware',
 )
 
 ROOT_URLCONF = 'appraise.urls'
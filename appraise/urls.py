@@ -22,6 +22,10 @@ urlpatterns = patterns('appraise.views',
   (r'^{0}login/$'.format(DEPLOYMENT_PREFIX), 'login', {'template_name': 'login.html'}),
   (r'^{0}logout/$'.format(DEPLOYMENT_PREFIX), 'logout', {'next_page': '/{0}'.format(DEPLOYMENT_PREFIX)}),
   (r'^{0}password/$'.format(DEPLOYMENT_PREFIX), 'password_change', {'template_name': 'password_change.html'}),
+  (r'^{0}caches/$'.format(DEPLOYMENT_PREFIX), 'cache_status'),
+  (r'^{0}requests/$'.format(DEPLOYMENT_PREFIX), 'request_stats'),
+  (r'^{0}profiles/$'.format(DEPLOYMENT_PREFIX), 'profiles'),
+  (r'^{0}profiles/(?P<name>[\w.-]+\.prof)/$'.format(DEPLOYMENT_PREFIX), 'profile_details'),
   (r'^{0}admin/'.format(DEPLOYMENT_PREFIX), include(admin.site.urls)),
 )
 
@@ -29,7 +33,9 @@ urlpatterns = patterns('appraise.views',
 urlpatterns += patterns('appraise.wmt16.views',
   (r'^{0}wmt16/$'.format(DEPLOYMENT_PREFIX), 'overview'),
   (r'^{0}wmt16/(?P<hit_id>[a-f0-9]{{8}})/'.format(DEPLOYMENT_PREFIX), 'hit_handler'),
+  (r'^{0}wmt16/api/(?P<hit_id>[a-f0-9]{{8}})/$'.format(DEPLOYMENT_PREFIX), 'annotation_api'),
   (r'^{0}wmt16/status/$'.format(DEPLOYMENT_PREFIX), 'status'),
+  (r'^{0}wmt16/progress/$'.format(DEPLOYMENT_PREFIX), 'progress'),
   (r'^{0}wmt16/update-status/(?P<key>(global_stats|language_pair_stats|group_stats|user_stats|clusters))?/?$'.format(DEPLOYMENT_PREFIX), 'update_status'),
   (r'^{0}wmt16/update-ranking/$'.format(DEPLOYMENT_PREFIX), 'update_ranking'),
   (r'^{0}wmt16/signup/$'.format(DEPLOYMENT_PREFIX), 'signup'),
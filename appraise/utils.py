@@ -4,7 +4,12 @@ Project: Appraise evaluation system
  Author: Christian Federmann <cfedermann@gmail.com>
 """
 import logging
+import sys
+import uuid
+from collections import OrderedDict
 from datetime import timedelta
+from threading import RLock
+from time import time
 
 from appraise.settings import LOG_LEVEL, LOG_HANDLER
 
@@ -46,6 +51,302 @@ def seconds_to_timedelta(value):
     _secs = value % 60
     return timedelta(days=_days, hours=_hours, minutes=_mins, seconds=_secs)
 
+# Registry of all BoundedCache instances, used for diagnostics.
+CACHE_REGISTRY = OrderedDict()
+
+
+def approximate_size(value, _seen=None):
+    """
+    Returns the approximate memory size of value in bytes.
+    
+    Container types are traversed recursively, shared objects are counted
+    once.  This is an estimate only, and expensive for large values.
+    
+    """
+    if _seen is None:
+        _seen = set()
+    
+    if id(value) in _seen:
+        return 0
+    
+    _seen.add(id(value))
+    size = sys.getsizeof(value)
+    
+    if isinstance(value, dict):
+        for key, item in value.iteritems():
+            size += approximate_size(key, _seen)
+            size += approximate_size(item, _seen)
+    
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += approximate_size(item, _seen)
+    
+    return size
+
+
+class cached_property(object):
+    """
+    Decorator computing a property on first access, caching it per instance.
+
+    Unlike django.utils.functional.cached_property, this returns itself
+    when accessed on the class, as required by admin validation.  The
+    cached value can be assigned or removed from the instance's __dict__ to
+    reset it.
+
+    """
+    def __init__(self, func):
+        """
+        Creates a new cached property for the given method.
+        """
+        self.func = func
+        self.__doc__ = func.__doc__
+        self.__name__ = func.__name__
+
+    def __get__(self, instance, owner):
+        """
+        Returns the cached value, computing it if needed.
+        """
+        if instance is None:
+            return self
+
+        _value = instance.__dict__[self.__name__] = self.func(instance)
+        return _value
+
+
+class BoundedCache(object):
+    """
+    Size-bounded, in-memory LRU cache with optional per-entry expiry.
+    
+    Supports the dictionary methods used for our module-level caches.  When
+    more than max_size entries are stored, the least recently used entries
+    are evicted.  Entries expire after timeout seconds unless a different
+    timeout is given to set();  a timeout of None means no expiry.
+    
+    Hits, misses, evictions and expirations are counted per cache, see
+    stats().  All caches are registered in CACHE_REGISTRY by name.
+    
+    """
+    def __init__(self, name, max_size=1000, timeout=None):
+        """
+        Creates a new cache and registers it under the given name.
+        """
+        self.name = name
+        self.max_size = max_size
+        self.timeout = timeout
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        
+        # Maps keys to (value, expires) tuples, least recently used first.
+        self._data = OrderedDict()
+        self._lock = RLock()
+        
+        CACHE_REGISTRY[name] = self
+    
+    def __repr__(self):
+        """
+        Returns a short description for this cache.
+        """
+        return '<BoundedCache {0} ({1}/{2})>'.format(self.name, len(self),
+          self.max_size)
+    
+    def _lookup(self, key):
+        """
+        Returns the (value, expires) tuple for key or None if not available.
+        
+        Expired entries are removed;  valid entries become most recently used.
+        
+        """
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return None
+        
+        if entry[1] is not None and entry[1] < time():
+            self.expirations += 1
+            return None
+        
+        self._data[key] = entry
+        return entry
+    
+    def __len__(self):
+        return len(self._data)
+    
+    def __contains__(self, key):
+        return self.has_key(key)
+    
+    def __getitem__(self, key):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                raise KeyError(key)
+            
+            self.hits += 1
+            return entry[0]
+    
+    def __setitem__(self, key, value):
+        self.set(key, value)
+    
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
+    
+    def has_key(self, key):
+        """
+        Returns True if a valid entry for key is available.
+        
+        Only misses are counted here as callers will read the value next.
+        
+        """
+        with self._lock:
+            if self._lookup(key) is None:
+                self.misses += 1
+                return False
+            
+            return True
+    
+    def get(self, key, default=None):
+        """
+        Returns the value for key or default if no valid entry is available.
+        """
+        try:
+            return self[key]
+        
+        except KeyError:
+            return default
+    
+    def set(self, key, value, timeout=-1):
+        """
+        Stores value for key, evicting least recently used entries if needed.
+        
+        If timeout is not given, the cache timeout is used.
+        
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        
+        expires = None
+        if timeout is not None:
+            expires = time() + timeout
+        
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+    
+    def pop(self, key, default=None):
+        """
+        Removes key from the cache and returns its value or default.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            self._data.pop(key, None)
+            if entry is None:
+                return default
+            
+            return entry[0]
+    
+    def keys(self):
+        """
+        Returns the list of cached keys, least recently used first.
+        """
+        with self._lock:
+            return self._data.keys()
+    
+    def clear(self):
+        """
+        Removes all entries from the cache, keeping the counters.
+        """
+        with self._lock:
+            self._data.clear()
+    
+    def stats(self):
+        """
+        Returns a dictionary containing size and counter information.
+        """
+        with self._lock:
+            _lookups = self.hits + self.misses
+            _values = [x[0] for x in self._data.itervalues()]
+            return {
+              'name': self.name,
+              'entries': len(self._data),
+              'max_size': self.max_size,
+              'timeout': self.timeout,
+              'hits': self.hits,
+              'misses': self.misses,
+              'hit_rate': 100 * self.hits / (float(_lookups) or 1),
+              'evictions': self.evictions,
+              'expirations': self.expirations,
+              'bytes': approximate_size(_values),
+            }
+
+
+class RandomIdAllocator(object):
+    """
+    Allocates random hex ids which are unique for the given model field.
+    
+    Candidate ids are generated in batches and checked against existing
+    values using a single IN query per batch.  Unused ids are kept in a
+    pool for later allocations and leave it when they are issued, so only
+    the pool is kept in memory.  Issued ids are expected to be saved soon;
+    later batches are checked against them in the database.
+    
+    """
+    def __init__(self, model, field, length=8, batch_size=100):
+        """
+        Creates a new allocator for the given model field.
+        """
+        self.model = model
+        self.field = field
+        self.length = length
+        self.batch_size = batch_size
+        
+        self._pool = []
+        self._lock = RLock()
+    
+    def _refill(self, count):
+        """
+        Adds up to count new, unused candidate ids to the pool.
+        """
+        _candidates = set()
+        while len(_candidates) < count:
+            _candidates.add(uuid.uuid4().hex[:self.length])
+        
+        _candidates -= set(self._pool)
+        
+        _lookup = {'{0}__in'.format(self.field): list(_candidates)}
+        _existing = self.model.objects.filter(**_lookup).values_list(
+          self.field, flat=True)
+        
+        self._pool.extend(_candidates - set(_existing))
+    
+    def allocate(self, count):
+        """
+        Returns a list of count new, unique ids.
+        """
+        with self._lock:
+            while len(self._pool) < count:
+                # We check at most 500 candidates per query to stay below
+                # the SQLite limit for query parameters.
+                _missing = count - len(self._pool)
+                self._refill(min(max(_missing, self.batch_size), 500))
+            
+            _ids = self._pool[:count]
+            del self._pool[:count]
+            return _ids
+    
+    def next_id(self):
+        """
+        Returns a single new, unique id.
+        """
+        return self.allocate(1)[0]
+
+
 # pylint: disable-msg=E0102
 class AnnotationTask(AnnotationTask):
     """
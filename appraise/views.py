@@ -4,12 +4,19 @@ Project: Appraise evaluation system
  Author: Christian Federmann <cfedermann@gmail.com>
 """
 import logging
+from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth.forms import AdminPasswordChangeForm
 from django.contrib.auth.views import login as LOGIN, logout as LOGOUT
 from django.contrib.auth.views import password_change as PASSWORD_CHANGE
 from django.core.urlresolvers import reverse
+from django.http import Http404, HttpResponse
 from django.shortcuts import render, render_to_response
-from appraise.settings import LOG_LEVEL, LOG_HANDLER, COMMIT_TAG, STATIC_URL
+from appraise.settings import LOG_LEVEL, LOG_HANDLER, COMMIT_TAG, STATIC_URL, \
+  REQUEST_LOG_FILENAME, REQUEST_STATS_WINDOW, PROFILE_PATH, \
+  PROFILE_SAMPLE_EVERY, PROFILE_MAX_FILES
+from appraise.middleware import get_request_stats, get_recent_profiles, \
+  get_profile_details, get_profile_path
+from appraise.utils import CACHE_REGISTRY
 
 # Setup logging support.
 logging.basicConfig(level=LOG_LEVEL)
@@ -151,3 +158,108 @@ def password_change(request, template_name):
     return PASSWORD_CHANGE(request, template_name,
       post_change_redirect=post_change_redirect,
       password_change_form=AdminPasswordChangeForm, extra_context=context)
+
+
+@user_passes_test(lambda u: u.is_superuser)
+def cache_status(request):
+    """
+    Renders size and hit/miss/eviction counters for all in-memory caches.
+    
+    Only caches of modules loaded by this worker process are listed.
+    
+    """
+    LOGGER.info('Rendering cache status view for user "{0}".'.format(
+      request.user.username))
+    
+    caches = [x.stats() for x in CACHE_REGISTRY.values()]
+    
+    context = {
+      'admin_url': reverse('admin:index'),
+      'caches': caches,
+      'total_bytes': sum([x['bytes'] for x in caches]),
+      'title': 'Cache status',
+    }
+    context.update(BASE_CONTEXT)
+    
+    return render(request, 'cache_status.html', context)
+
+
+@user_passes_test(lambda u: u.is_superuser)
+def request_stats(request):
+    """
+    Renders rolling percentiles of query count and timings per view.
+    
+    Only requests handled by this worker process are included.
+    
+    """
+    LOGGER.info('Rendering request stats view for user "{0}".'.format(
+      request.user.username))
+    
+    context = {
+      'admin_url': reverse('admin:index'),
+      'log_filename': REQUEST_LOG_FILENAME,
+      'title': 'Request statistics',
+      'views': get_request_stats(),
+      'window': REQUEST_STATS_WINDOW,
+    }
+    context.update(BASE_CONTEXT)
+    
+    return render(request, 'request_stats.html', context)
+
+
+@user_passes_test(lambda u: u.is_superuser)
+def profiles(request):
+    """
+    Renders the list of recent request profiles.
+    """
+    LOGGER.info('Rendering profiles view for user "{0}".'.format(
+      request.user.username))
+    
+    context = {
+      'admin_url': reverse('admin:index'),
+      'max_files': PROFILE_MAX_FILES,
+      'profile_path': PROFILE_PATH,
+      'profiles': get_recent_profiles(),
+      'sample_every': PROFILE_SAMPLE_EVERY,
+      'title': 'Request profiles',
+    }
+    context.update(BASE_CONTEXT)
+    
+    return render(request, 'profiles.html', context)
+
+
+@user_passes_test(lambda u: u.is_superuser)
+def profile_details(request, name):
+    """
+    Renders the top cumulative functions for the given profile.
+    
+    Adding ?download=1 returns the .prof file itself instead.
+    
+    """
+    LOGGER.info('Rendering profile details view for user "{0}".'.format(
+      request.user.username))
+    
+    if 'download' in request.GET:
+        path = get_profile_path(name)
+        if path is None:
+            raise Http404
+        
+        with open(path, 'rb') as profile_file:
+            response = HttpResponse(profile_file.read(),
+              content_type='application/octet-stream')
+        response['Content-Disposition'] = 'attachment; filename="{0}"'.format(
+          name)
+        return response
+    
+    profile = get_profile_details(name)
+    if profile is None:
+        raise Http404
+    
+    context = {
+      'admin_url': reverse('admin:index'),
+      'profile': profile,
+      'title': 'Request profile',
+    }
+    context.update(BASE_CONTEXT)
+    
+    return render(request, 'profile_details.html', context)
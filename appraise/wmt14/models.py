@@ -17,6 +17,7 @@ from django.template import Context
 from django.template.loader import get_template
 
 from appraise.wmt14.validators import validate_hit_xml, validate_segment_xml
+from appraise.fields import CompressedTextField
 from appraise.settings import LOG_LEVEL, LOG_HANDLER
 from appraise.utils import datetime_to_seconds, AnnotationTask
 
@@ -63,7 +64,7 @@ class HIT(models.Model):
       verbose_name="HIT block identifier"
     )
 
-    hit_xml = models.TextField(
+    hit_xml = CompressedTextField(
       help_text="XML source for this HIT instance.",
       validators=[validate_hit_xml],
       verbose_name="HIT source XML"
@@ -353,7 +354,7 @@ class RankingTask(models.Model):
       db_index=True
     )
     
-    item_xml = models.TextField(
+    item_xml = CompressedTextField(
       help_text="XML source for this RankingTask instance.",
       validators=[validate_segment_xml],
       verbose_name="RankingTask source XML"
@@ -450,7 +451,7 @@ class RankingResult(models.Model):
         """
         return '{}'.format(self.duration)
     
-    raw_result = models.TextField(editable=False, blank=False)
+    raw_result = CompressedTextField(editable=False, blank=False)
     
     results = None
     
@@ -24,7 +24,8 @@ from django.shortcuts import get_object_or_404, redirect, render
 from appraise.wmt14.models import LANGUAGE_PAIR_CHOICES, UserHITMapping, \
   HIT, RankingTask, RankingResult, UserHITMapping, UserInviteToken
 from appraise.settings import LOG_LEVEL, LOG_HANDLER, COMMIT_TAG, ROOT_PATH
-from appraise.utils import datetime_to_seconds, seconds_to_timedelta
+from appraise.utils import BoundedCache, datetime_to_seconds, \
+  seconds_to_timedelta
 
 # Setup logging support.
 logging.basicConfig(level=LOG_LEVEL)
@@ -32,9 +33,11 @@ LOGGER = logging.getLogger('appraise.wmt14.views')
 LOGGER.addHandler(LOG_HANDLER)
 
 # We keep status and ranking information available in memory to speed up
-# access and avoid lengthy delays caused by computation of this data.
-STATUS_CACHE = {}
-RANKINGS_CACHE = {}
+# access and avoid lengthy delays caused by computation of this data.  Both
+# caches only hold a few keys and are refreshed explicitly, so there is no
+# expiry;  see update_status() and update_ranking().
+STATUS_CACHE = BoundedCache('wmt14.status', max_size=32)
+RANKINGS_CACHE = BoundedCache('wmt14.rankings', max_size=32)
 
 
 def _compute_next_task_for_user(user, language_pair):
@@ -159,17 +162,22 @@ def _save_results(item, user, duration, raw_result):
 def _find_next_item_to_process(items, user, random_order=False):
     """
     Computes the next item the current user should process or None, if done.
+    
+    Only the user's results for the given items are considered, using a
+    subquery, so this does not depend on how many results the user has
+    submitted overall.  Random order is computed by the database.
+    
     """
-    user_results = RankingResult.objects.filter(user=user)
+    user_results = RankingResult.objects.filter(user=user, item__in=items)
     
-    processed_items = user_results.values_list('item__pk', flat=True)
+    processed_items = user_results.values_list('item', flat=True)
+    
+    unprocessed_items = items.exclude(pk__in=processed_items)
     
-    # cfedermann: this might be sub optimal wrt. performance!
-    unprocessed_items = list(items.exclude(pk__in=processed_items))
-
     if random_order:
-        shuffle(unprocessed_items)
+        unprocessed_items = unprocessed_items.order_by('?')
     
+    unprocessed_items = list(unprocessed_items[:1])
     if unprocessed_items:
         return unprocessed_items[0]
     
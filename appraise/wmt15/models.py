@@ -18,6 +18,7 @@ from django.template import Context
 from django.template.loader import get_template
 
 from appraise.wmt15.validators import validate_hit_xml, validate_segment_xml
+from appraise.fields import CompressedTextField
 from appraise.settings import LOG_LEVEL, LOG_HANDLER
 from appraise.utils import datetime_to_seconds, AnnotationTask
 
@@ -64,7 +65,7 @@ class HIT(models.Model):
       verbose_name="HIT block identifier"
     )
 
-    hit_xml = models.TextField(
+    hit_xml = CompressedTextField(
       help_text="XML source for this HIT instance.",
       validators=[validate_hit_xml],
       verbose_name="HIT source XML"
@@ -375,7 +376,7 @@ class RankingTask(models.Model):
       db_index=True
     )
 
-    item_xml = models.TextField(
+    item_xml = CompressedTextField(
       help_text="XML source for this RankingTask instance.",
       validators=[validate_segment_xml],
       verbose_name="RankingTask source XML"
@@ -474,7 +475,7 @@ class RankingResult(models.Model):
         """
         return '{}'.format(self.duration)
 
-    raw_result = models.TextField(editable=False, blank=False)
+    raw_result = CompressedTextField(editable=False, blank=False)
 
     results = None
 
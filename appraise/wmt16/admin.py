@@ -11,7 +11,8 @@ from django.template import Context
 from django.template.loader import get_template
 
 from appraise.wmt16.models import HIT, RankingTask, RankingResult, \
-  UserHITMapping, UserInviteToken, Project, TimedKeyValueData
+  UserHITMapping, UserInviteToken, Project, TimedKeyValueData, \
+  LatestKeyValueData, RollupKeyValueData, TextSegment, QueuedTask
 
 from appraise.settings import LOG_LEVEL, LOG_HANDLER
 
@@ -270,10 +271,49 @@ class TimedKeyValueDataAdmin(admin.ModelAdmin):
     search_fields = ('key', 'value')
 
 
+class LatestKeyValueDataAdmin(admin.ModelAdmin):
+    """
+    ModelAdmin class for LatestKeyValueData instances.
+    """
+    list_display = ('key', 'value', 'date_and_time')
+    search_fields = ('key', 'value')
+
+
+class TextSegmentAdmin(admin.ModelAdmin):
+    """
+    ModelAdmin class for TextSegment instances.
+    """
+    list_display = ('id', 'digest', 'text')
+    search_fields = ('digest', 'text')
+
+
+class RollupKeyValueDataAdmin(admin.ModelAdmin):
+    """
+    ModelAdmin class for RollupKeyValueData instances.
+    """
+    list_display = ('key', 'resolution', 'period_start', 'value', 'updates')
+    list_filter = ('resolution', 'key')
+    search_fields = ('key', 'value')
+
+
+class QueuedTaskAdmin(admin.ModelAdmin):
+    """
+    ModelAdmin class for QueuedTask instances.
+    """
+    list_display = ('id', 'name', 'arguments', 'created', 'attempts',
+      'locked_until')
+    list_filter = ('name', 'attempts')
+    search_fields = ('arguments', 'last_error')
+
+
 admin.site.register(HIT, HITAdmin)
 admin.site.register(RankingTask)
+admin.site.register(TextSegment, TextSegmentAdmin)
 admin.site.register(RankingResult, RankingResultAdmin)
 admin.site.register(UserHITMapping, UserHITMappingAdmin)
 admin.site.register(UserInviteToken, UserInviteTokenAdmin)
 admin.site.register(Project)
 admin.site.register(TimedKeyValueData, TimedKeyValueDataAdmin)
+admin.site.register(LatestKeyValueData, LatestKeyValueDataAdmin)
+admin.site.register(RollupKeyValueData, RollupKeyValueDataAdmin)
+admin.site.register(QueuedTask, QueuedTaskAdmin)
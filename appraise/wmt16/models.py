@@ -3,24 +3,32 @@
 Project: Appraise evaluation system
  Author: Christian Federmann <cfedermann@gmail.com>
 """
+import json
 import logging
-import uuid
+import re
 
-from datetime import datetime
-from xml.etree.ElementTree import fromstring, ParseError, tostring
+from collections import Counter
+from datetime import datetime, timedelta
+from hashlib import md5, sha1
+from random import shuffle
+from xml.etree.ElementTree import fromstring, ParseError, SubElement, \
+  tostring
 
 from django.dispatch import receiver
 
 from django.contrib.auth.models import User, Group
 from django.core.urlresolvers import reverse
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import connection, models, transaction, DatabaseError
 from django.template import Context
 from django.template.loader import get_template
 
-from appraise.wmt16.validators import validate_hit_xml, validate_segment_xml
-from appraise.settings import LOG_LEVEL, LOG_HANDLER
-from appraise.utils import datetime_to_seconds, AnnotationTask
+from appraise.wmt16.validators import validate_hit_xml, validate_item_xml
+from appraise.fields import CompressedTextField, decompress_text
+from appraise.settings import LOG_LEVEL, LOG_HANDLER, CACHE_MAX_ENTRIES, \
+  TASK_QUEUE_LOCK_SECONDS, TASK_QUEUE_MAX_ATTEMPTS
+from appraise.utils import datetime_to_seconds, AnnotationTask, \
+  BoundedCache, RandomIdAllocator, cached_property
 
 # Setup logging support.
 logging.basicConfig(level=LOG_LEVEL)
@@ -30,6 +38,18 @@ LOGGER.addHandler(LOG_HANDLER)
 # How many users can annotate a given HIT
 MAX_USERS_PER_HIT = 1
 
+# RankingTask texts are stored as TextSegment instances, referenced by id.
+INTERNED_TEXT_TAGS = ('source', 'reference', 'translation')
+TEXT_ID_ATTRIBUTE = 'text-id'
+TEXT_ID_PATTERN = re.compile(r'{0}="(\d+)"'.format(TEXT_ID_ATTRIBUTE))
+
+# Prepared item_xml references texts by their index, see prepare_item_xml().
+TEXT_INDEX_PATTERN = re.compile(r'{0}="#(\d+)"'.format(TEXT_ID_ATTRIBUTE))
+
+# Left and right document context is stored inside <context> in item_xml.
+CONTEXT_TAG = 'context'
+CONTEXT_SIDES = ('left', 'right')
+
 LANGUAGE_PAIR_CHOICES = (
   # News task languages
   ('eng2ces', 'English → Czech'),
@@ -131,7 +151,7 @@ class HIT(models.Model):
       verbose_name="HIT block identifier"
     )
 
-    hit_xml = models.TextField(
+    hit_xml = CompressedTextField(
       help_text="XML source for this HIT instance.",
       validators=[validate_hit_xml],
       verbose_name="HIT source XML"
@@ -145,8 +165,6 @@ class HIT(models.Model):
       verbose_name="Language pair"
     )
 
-    # This is derived from hit_xml and NOT stored in the database.
-    hit_attributes = {}
 
     users = models.ManyToManyField(
       User,
@@ -190,18 +208,6 @@ class HIT(models.Model):
         verbose_name_plural = "HIT instances"
 
     # pylint: disable-msg=E1002
-    def __init__(self, *args, **kwargs):
-        """
-        Makes sure that self.hit_attributes are available.
-        """
-        super(HIT, self).__init__(*args, **kwargs)
-
-        if not self.hit_id:
-            self.hit_id = self.__class__._create_hit_id()
-
-        # If a hit_xml file is available, populate self.hit_attributes.
-        self.reload_dynamic_fields()
-
     def __unicode__(self):
         """
         Returns a Unicode String for this HIT object.
@@ -212,11 +218,270 @@ class HIT(models.Model):
     @classmethod
     def _create_hit_id(cls):
         """Creates a random UUID-4 8-digit hex number for use as HIT id."""
-        new_id = uuid.uuid4().hex[:8]
-        while cls.objects.filter(hit_id=new_id):
-            new_id = uuid.uuid4().hex[:8]
+        return HIT_ID_ALLOCATOR.next_id()
+
+    @classmethod
+    def _create_hit_ids(cls, count):
+        """Creates count random 8-digit hex numbers for use as HIT ids."""
+        return HIT_ID_ALLOCATOR.allocate(count)
+
+    @classmethod
+    def _import_key(cls, block_id, language_pair, hit_xml):
+        """
+        Returns the key identifying identical HITs for bulk_import().
+        """
+        _digest = md5(hit_xml.encode('utf-8')).hexdigest()
+        return (int(block_id), language_pair, _digest)
+
+    @classmethod
+    def prepare_import_row(cls, block_id, language_pair, hit_xml, mturk_only):
+        """
+        Returns the prepared HIT row for bulk_import() for the given values.
+
+        Prepared rows additionally contain the parsed hit_attributes and
+        the prepared item_xml of all segments including document context,
+        see RankingTask.prepare_item_xml().  This does all parsing for the
+        import without accessing the database, e.g., in worker processes.
+
+        """
+        _tree = fromstring(hit_xml.encode("utf-8"))
+        _segments = RankingTask.add_document_context(list(_tree))
+        return (block_id, language_pair, hit_xml, mturk_only,
+          dict(_tree.attrib.items()), RankingTask.prepare_item_xml(_segments))
+
+    @classmethod
+    def bulk_import(cls, rows, project, batch_size=500):
+        """
+        Imports the given HIT rows into the given project, in bulk.
+
+        Each row is a (block_id, language_pair, hit_xml, mturk_only) tuple
+        or a prepared row as returned by prepare_import_row();  rows can be
+        any iterable and are consumed in batches of batch_size
+        HITs, so they can be streamed from a file.  Rows have to be validated
+        before, full_clean() is NOT called.  HIT, RankingTask and project
+        membership rows are created using bulk_create(), with one
+        transaction per batch.
+
+        As we allow identical HITs to measure intra-annotator agreement, a
+        row is only skipped if the project already contained as many copies
+        of it before the import.  Hence, importing the same rows again does
+        not change anything.
+
+        Returns a (imported, skipped, rows_inserted) tuple.
+
+        """
+        _imported = Counter()
+        _skipped = Counter()
+        _inserted = 0
+
+        _batch = []
+        for row in rows:
+            _batch.append(row)
+            if len(_batch) >= batch_size:
+                _inserted += cls._bulk_import_batch(_batch, project,
+                  _imported, _skipped)
+                _batch = []
+
+        if _batch:
+            _inserted += cls._bulk_import_batch(_batch, project, _imported,
+              _skipped)
+
+        return (sum(_imported.values()), sum(_skipped.values()), _inserted)
+
+    @classmethod
+    def _bulk_import_batch(cls, rows, project, imported, skipped):
+        """
+        Imports a batch of HIT rows, updating the imported/skipped counters.
+
+        Copies which existed before the import are the copies now in the
+        database minus those imported so far;  we skip as many of these as
+        we have not skipped yet.
+
+        """
+        _keys = [cls._import_key(*x[:3]) for x in rows]
+
+        _existing = Counter()
+        _blocks = set([x[0] for x in _keys])
+        _hits = project.HITs.filter(block_id__in=_blocks)
+        for _hit in _hits.values_list('block_id', 'language_pair', 'hit_xml'):
+            _block_id, _language_pair, _hit_xml = _hit
+            _existing[cls._import_key(_block_id, _language_pair,
+              decompress_text(_hit_xml))] += 1
+
+        _new_rows = []
+        for row, _key in zip(rows, _keys):
+            if _existing[_key] - imported[_key] - skipped[_key] > 0:
+                skipped[_key] += 1
+                continue
+
+            imported[_key] += 1
+            _new_rows.append(row)
+
+        if not _new_rows:
+            return 0
+
+        return cls._bulk_insert(_new_rows, project)
+
+    @classmethod
+    def _bulk_insert(cls, rows, project):
+        """
+        Inserts a batch of HIT rows in one transaction, returns row count.
+        """
+        _hits = []
+        _prepared = []
+        _hit_ids = cls._create_hit_ids(len(rows))
+        for _hit_id, row in zip(_hit_ids, rows):
+            if len(row) == 4:
+                row = cls.prepare_import_row(*row)
+
+            block_id, language_pair, hit_xml, mturk_only, _attributes, \
+              _item_xmls = row
+            _hit = cls(hit_id=_hit_id, block_id=int(block_id),
+              hit_xml=hit_xml, language_pair=language_pair,
+              mturk_only=mturk_only)
+            _hit.hit_attributes = _attributes
+            _hits.append(_hit)
+            _prepared.append(_item_xmls)
+
+        with transaction.commit_on_success():
+            cls.objects.bulk_create(_hits)
+
+            # bulk_create() does not set primary keys, so we look them up.
+            _ids = dict(cls.objects.filter(hit_id__in=[x.hit_id for x in _hits])
+              .values_list('hit_id', 'id'))
+
+            # Texts for all RankingTask instances are interned at once.
+            _segments = []
+            for _hit, _item_xmls in zip(_hits, _prepared):
+                _segments.extend([(_ids[_hit.hit_id], x) for x in _item_xmls])
+
+            _item_xmls = RankingTask.intern_prepared_item_xml(
+              [x[1] for x in _segments])
+            _tasks = [RankingTask(hit_id=x[0], item_xml=y)
+              for x, y in zip(_segments, _item_xmls)]
+
+            RankingTask.objects.bulk_create(_tasks)
+
+            _through = Project.HITs.through
+            _members = [_through(project_id=project.id, hit_id=_ids[x.hit_id])
+              for x in _hits]
+            _through.objects.bulk_create(_members)
+
+        return len(_hits) + len(_tasks) + len(_members)
+
+    @classmethod
+    def compute_next_task_for_user(cls, user, project, language_pair):
+        """
+        Computes the next task for the given user, project and language pair.
+
+        This may either be the HIT the given user is currently working on or
+        a new HIT in case the user has completed all previous HITs already.
+
+        By convention, language_pair is a String in format xxx2yyy where
+        both xxx and yyy are ISO-639-3 language codes.
+
+        """
+        # Check if project is valid for the given user.
+        if not project in user.project_set.all():
+            LOGGER.debug('User %s does not work on project %s.', user,
+              project)
+            return None
+        
+        # Check if language_pair is valid for the given user.
+        if not user.groups.filter(name=language_pair):
+            LOGGER.debug('User %s does not know language pair %s.', user,
+              language_pair)
+            return None
 
-        return new_id
+        # Check if there exists a current HIT for the given user.
+        current_hitmap = UserHITMapping.objects.filter(user=user,
+          project=project, hit__language_pair=language_pair).select_related(
+          'hit').defer('hit__hit_xml')
+
+        # If there is no current HIT to continue with, find a random HIT for
+        # the given user.  We keep generating a random block_id in [1, 1000]
+        # until we find a matching HIT which the current user has not yet
+        # completed.
+        if not current_hitmap:
+            LOGGER.debug('No current HIT for user %s, fetching HIT.', user)
+            
+            # Compatible HIT instances need to match the given language pair!
+            # Furthermore, they need to be active and not reserved for MTurk.
+            hits = cls.objects.filter(active=True, mturk_only=False,
+              completed=False, project=project, language_pair=language_pair
+              ).defer('hit_xml')
+            
+            LOGGER.debug("HITs = %s", hits)
+            
+            # Compute list of compatible block ids and randomise its order.
+            #
+            # cfedermann: for WMT14 Matt did not provide block ids anymore.
+            #   This meant that our shuffled list of block ids only
+            #   contained [-1, ..., -1] entries;  using these to filter and
+            #   check for respective HIT status is a quadratic increase of
+            #   redundant work which will take prohibitively long when there
+            #   is no next HIT.
+            #
+            #   Converting to unique HIT ids will speed up things drastically.
+            hit_ids = list(set(hits.values_list('hit_id', flat=True)))
+            shuffle(hit_ids)
+            LOGGER.debug("HIT IDs = %s", hit_ids)
+            
+            # Find the next HIT for the current user.
+            random_hit = None
+            for hit_id in hit_ids:
+                for hit in hits.filter(hit_id=hit_id):
+                    hit_users = list(hit.users.all())
+                    
+                    # Check if this HIT is mapped to users.  This code
+                    # prevents that more than MAX_USERS_PER_HIT users
+                    # complete a HIT.
+                    for hitmap in UserHITMapping.objects.filter(hit=hit):
+                        if not hitmap.user in hit_users:
+                            hit_users.append(hitmap.user)
+                    
+                    if not user in hit_users:
+                        if len(hit_users) < MAX_USERS_PER_HIT:
+                            random_hit = hit
+                            break
+                
+                if random_hit:
+                    break
+            
+            # If we still haven't found a next HIT, there simply is none...
+            if not random_hit:
+                # TODO: We should now investigate if there is any HIT
+                #   assigned to a user but has not been finished in a certain
+                #   time span.  Such a HIT can be freed and assigned to the
+                #   current user.
+                return None
+            
+            # Update User/HIT mappings s.t. the system knows about the next
+            # HIT.
+            current_hitmap = UserHITMapping.objects.create(user=user,
+              project=project, hit=random_hit)
+        
+        # Otherwise, select first match from QuerySet.
+        else:
+            current_hitmap = current_hitmap[0]
+            
+            # Sanity check preventing stale User/HIT mappings to screw up
+            # things.
+            #
+            # Before we checked if `len(hit_users) >= 3`.
+            hit_users = list(current_hitmap.hit.users.all())
+            if user in hit_users or len(hit_users) >= 1 \
+              or not current_hitmap.hit.active:
+                LOGGER.debug('Detected stale User/HIT mapping %s->%s', user,
+                  current_hitmap.hit)
+                current_hitmap.delete()
+                return cls.compute_next_task_for_user(user, project,
+                  language_pair)
+        
+        LOGGER.debug('User %s currently working on HIT %s', user,
+          current_hitmap.hit)
+        
+        return current_hitmap.hit
 
     @classmethod
     def compute_remaining_hits(cls, language_pair=None):
@@ -226,7 +491,8 @@ class HIT(models.Model):
         If language_pair is given, it constraints on the HITs' language pair.
 
         """
-        hits_qs = cls.objects.filter(active=True, mturk_only=False, completed=False)
+        hits_qs = cls.objects.filter(active=True, mturk_only=False,
+          completed=False).defer('hit_xml')
         if language_pair:
             hits_qs = hits_qs.filter(language_pair=language_pair)
 
@@ -258,7 +524,7 @@ class HIT(models.Model):
         - total duration in seconds.
 
         """
-        hits_qs = cls.objects.filter(users=user)
+        hits_qs = cls.objects.filter(users=user).defer('hit_xml')
         if project:
             project_instance = Project.objects.filter(id=project.id)
             if project_instance.exists():
@@ -273,7 +539,8 @@ class HIT(models.Model):
 
         _durations = []
         for hit in hits_qs:
-            _results = RankingResult.objects.filter(user=user, item__hit=hit)
+            _results = RankingResult.objects.filter(user=user,
+              item__in=RankingTask.objects.filter(hit=hit)).order_by()
             _durations.extend(_results.values_list('duration', flat=True))
 
         _durations = [datetime_to_seconds(d) for d in _durations if d]
@@ -307,6 +574,10 @@ class HIT(models.Model):
         """
         Makes sure that validation is run before saving an object instance.
         """
+        # Allocate a hit_id only once the HIT is actually saved.
+        if not self.hit_id:
+            self.hit_id = self.__class__._create_hit_id()
+
         # Enforce validation before saving HIT objects.
         if not self.id:
             self.full_clean()
@@ -315,9 +586,10 @@ class HIT(models.Model):
             super(HIT, self).save(*args, **kwargs)
 
             _tree = fromstring(self.hit_xml.encode("utf-8"))
+            _segments = RankingTask.add_document_context(list(_tree))
 
-            for _child in _tree:
-                new_item = RankingTask(hit=self, item_xml=tostring(_child))
+            for _item_xml in RankingTask.intern_item_xml(_segments):
+                new_item = RankingTask(hit=self, item_xml=_item_xml)
                 new_item.save()
 
         # Check ranking tasks to update
@@ -346,22 +618,34 @@ class HIT(models.Model):
         kwargs = {'hit_id': self.hit_id}
         return reverse(status_handler_view, kwargs=kwargs)
 
-    def reload_dynamic_fields(self):
+    @cached_property
+    def hit_attributes(self):
         """
-        Reloads hit_attributes from self.hit_xml contents.
+        Attributes of the <hit> element, parsed from self.hit_xml.
+
+        This is derived from hit_xml and NOT stored in the database.  It is
+        parsed on first access, so that querysets which do not need it can
+        defer loading hit_xml.
+
         """
         # If a hit_xml file is available, populate self.hit_attributes.
-        if self.hit_xml:
-            try:
-                _hit_xml = fromstring(self.hit_xml.encode("utf-8"))
-                self.hit_attributes = {}
-                for key, value in _hit_xml.attrib.items():
-                    self.hit_attributes[key] = value
+        if not self.hit_xml:
+            return {}
+
+        try:
+            _hit_xml = fromstring(self.hit_xml.encode("utf-8"))
+            return dict(_hit_xml.attrib.items())
+
+        # For parse errors, set self.hit_attributes s.t. it gives an
+        # error message to the user for debugging.
+        except (ParseError), msg:
+            return {'note': msg}
 
-            # For parse errors, set self.hit_attributes s.t. it gives an
-            # error message to the user for debugging.
-            except (ParseError), msg:
-                self.hit_attributes = {'note': msg}
+    def reload_dynamic_fields(self):
+        """
+        Reloads hit_attributes from self.hit_xml contents on next access.
+        """
+        self.__dict__.pop('hit_attributes', None)
 
     def export_to_xml(self):
         """
@@ -375,8 +659,11 @@ class HIT(models.Model):
         _attr = self.hit_attributes.items()
         attributes = ' '.join(['{}="{}"'.format(k, v) for k, v in _attr])
 
+        _items = RankingTask.objects.filter(hit=self)
+        RankingTask.prefetch_texts(_items)
+
         results = []
-        for item in RankingTask.objects.filter(hit=self):
+        for item in _items:
             item.reload_dynamic_fields()
 
             try:
@@ -398,8 +685,11 @@ class HIT(models.Model):
         """
         Exports this HIT's results to Artstein and Poesio (2007) format.
         """
+        _items = RankingTask.objects.filter(hit=self)
+        RankingTask.prefetch_texts(_items)
+
         results = []
-        for item in RankingTask.objects.filter(hit=self):
+        for item in _items:
             for _result in item.rankingresult_set.all():
                 _apf_output = _result.export_to_apf()
                 if _apf_output:
@@ -442,6 +732,10 @@ class HIT(models.Model):
         return (_alpha, _kappa, _pi, _S)
 
 
+# Allocates HIT ids in batches, avoiding one query per new HIT instance.
+HIT_ID_ALLOCATOR = RandomIdAllocator(HIT, 'hit_id')
+
+
 class Project(models.Model):
     """
     Defines object model for an annotation project
@@ -476,6 +770,119 @@ class Project(models.Model):
         return '<project id="{0}" name="{1}" users="{2}" HITs="{3}" />'.format(self.id, self.name, self.users.count(), self.HITs.count())
 
 
+class TextSegment(models.Model):
+    """
+    Interned text for RankingTask instances, keyed by content hash.
+
+    Source, reference and translation texts are stored only once, even if
+    they occur in many HITs, e.g., for redundant blocks.  RankingTask XML
+    references them using the text-id attribute.
+
+    """
+    digest = models.CharField(
+      max_length=40,
+      db_index=True,
+      unique=True,
+      editable=False,
+      help_text="SHA-1 digest of the UTF-8 encoded text.",
+      verbose_name="Text digest"
+    )
+
+    text = models.TextField(
+      editable=False,
+      help_text="Text contents for this TextSegment instance.",
+      verbose_name="Text"
+    )
+
+    class Meta:
+        """
+        Metadata options for the TextSegment object model.
+        """
+        ordering = ('id',)
+        verbose_name = "TextSegment instance"
+        verbose_name_plural = "TextSegment instances"
+
+    def __unicode__(self):
+        """
+        Returns a Unicode String for this TextSegment object.
+        """
+        return u'<text-segment id="{0}" digest="{1}">'.format(self.id,
+          self.digest)
+
+    @classmethod
+    def compute_digest(cls, text):
+        """
+        Returns the content hash identifying the given text.
+        """
+        return sha1(text.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _lookup_digests(cls, digests):
+        """
+        Returns a dictionary mapping known digests to TextSegment ids.
+        """
+        _ids = {}
+        # We look up at most 500 digests per query to stay below the SQLite
+        # limit for query parameters.
+        for i in range(0, len(digests), 500):
+            _digests = cls.objects.filter(digest__in=digests[i:i+500])
+            _ids.update(_digests.values_list('digest', 'id'))
+        return _ids
+
+    @classmethod
+    def intern_texts(cls, texts):
+        """
+        Returns a dictionary mapping each of the given texts to a text id.
+
+        Texts are looked up by digest in batches;  only unknown texts are
+        inserted, using bulk_create().
+
+        """
+        _texts = {}
+        for _text in texts:
+            _texts[cls.compute_digest(_text)] = _text
+
+        _ids = cls._lookup_digests(_texts.keys())
+
+        _missing = [x for x in _texts.keys() if not x in _ids]
+        if _missing:
+            cls.objects.bulk_create([cls(digest=x, text=_texts[x])
+              for x in _missing])
+            _ids.update(cls._lookup_digests(_missing))
+
+        return dict([(_texts[x], _ids[x]) for x in _texts.keys()])
+
+    @classmethod
+    def get_texts(cls, text_ids):
+        """
+        Returns a dictionary mapping the given text ids to their texts.
+
+        Texts are served from TEXT_CACHE where possible;  all others are
+        fetched in batches of 500 ids and added to the cache.
+
+        """
+        _texts = {}
+        _missing = []
+        for _id in set([int(x) for x in text_ids]):
+            _text = TEXT_CACHE.get(_id)
+            if _text is None:
+                _missing.append(_id)
+            else:
+                _texts[_id] = _text
+
+        for i in range(0, len(_missing), 500):
+            _segments = cls.objects.filter(id__in=_missing[i:i+500])
+            for _id, _text in _segments.values_list('id', 'text'):
+                TEXT_CACHE[_id] = _text
+                _texts[_id] = _text
+
+        return _texts
+
+
+# Texts never change once interned, hence cache entries do not expire.
+TEXT_CACHE = BoundedCache('wmt16.texts', max_size=CACHE_MAX_ENTRIES)
+
+
 class RankingTask(models.Model):
     """
     RankingTask object model for wmt16 ranking evaluation.
@@ -485,17 +892,20 @@ class RankingTask(models.Model):
       db_index=True
     )
 
-    item_xml = models.TextField(
+    item_xml = CompressedTextField(
       help_text="XML source for this RankingTask instance.",
-      validators=[validate_segment_xml],
+      validators=[validate_item_xml],
       verbose_name="RankingTask source XML"
     )
 
     # These fields are derived from item_xml and NOT stored in the database.
-    attributes = None
-    source = None
-    reference = None
-    translations = None
+    # They are parsed on first access, so that texts are only looked up for
+    # items which are actually rendered or exported.
+    attributes = property(lambda self: self._dynamic_fields['attributes'])
+    source = property(lambda self: self._dynamic_fields['source'])
+    reference = property(lambda self: self._dynamic_fields['reference'])
+    translations = property(lambda self: self._dynamic_fields['translations'])
+    context = property(lambda self: self._dynamic_fields['context'])
 
     class Meta:
         """
@@ -505,16 +915,6 @@ class RankingTask(models.Model):
         verbose_name = "RankingTask instance"
         verbose_name_plural = "RankingTask instances"
 
-    # pylint: disable-msg=E1002
-    def __init__(self, *args, **kwargs):
-        """
-        Makes sure that self.translations are available.
-        """
-        super(RankingTask, self).__init__(*args, **kwargs)
-
-        # If item_xml is available, populate dynamic fields.
-        self.reload_dynamic_fields()
-
     def __unicode__(self):
         """
         Returns a Unicode String for this RankingTask object.
@@ -531,33 +931,183 @@ class RankingTask(models.Model):
 
         super(RankingTask, self).save(*args, **kwargs)
 
-    def reload_dynamic_fields(self):
+    @staticmethod
+    def add_document_context(segments):
         """
-        Reloads source, reference, and translations from self.item_xml.
+        Adds left and right context to the given <seg> elements of a HIT.
+
+        Neighbouring segments are used as context if they have the same,
+        non-empty doc-id attribute.  Copies of their <source> and <reference> are
+        stored inside a <context> element, so that items can be rendered
+        without loading their neighbours.  Note that the given elements
+        are modified in place.  Returns the list of segments.
+
+        """
+        _neighbours = [None] + segments + [None]
+        for index, _seg in enumerate(segments):
+            _context = SubElement(_seg, CONTEXT_TAG)
+            _doc_id = _seg.get('doc-id')
+            for _side, _neighbour in zip(CONTEXT_SIDES,
+              (_neighbours[index], _neighbours[index + 2])):
+                if not _doc_id or _neighbour is None \
+                  or _neighbour.get('doc-id') != _doc_id:
+                    continue
+
+                _element = SubElement(_context, _side)
+                for _tag in ('source', 'reference'):
+                    _text = _neighbour.find(_tag)
+                    if _text is not None:
+                        SubElement(_element, _tag, _text.attrib).text = \
+                          _text.text
+
+        return segments
+
+    @staticmethod
+    def prepare_item_xml(segments):
+        """
+        Returns prepared item_xml values for the given <seg> elements.
+
+        Each value is an (item_xml, texts) tuple.  Source, reference and
+        translation texts are moved into texts and referenced by their
+        index, so that they can be interned later without parsing the XML
+        again, see intern_prepared_item_xml().  This does not access the
+        database.  Note that the given elements are modified in place.
+
         """
+        _prepared = []
+        for _seg in segments:
+            _texts = []
+            for _child in _seg.iter():
+                if _child.tag in INTERNED_TEXT_TAGS and _child.text is not None:
+                    _child.set(TEXT_ID_ATTRIBUTE, '#{0}'.format(len(_texts)))
+                    _texts.append(_child.text)
+                    _child.text = None
+
+            _prepared.append((tostring(_seg), _texts))
+
+        return _prepared
+
+    @classmethod
+    def intern_prepared_item_xml(cls, prepared):
+        """
+        Returns item_xml values for the given prepared item_xml values.
+
+        Texts are interned as TextSegment instances in one batch and their
+        indices replaced by text-id attributes.
+
+        """
+        _text_ids = TextSegment.intern_texts([x for _, _texts in prepared
+          for x in _texts])
+
+        _item_xmls = []
+        for _item_xml, _texts in prepared:
+            _ids = [_text_ids[x] for x in _texts]
+            _item_xmls.append(TEXT_INDEX_PATTERN.sub(lambda x: '{0}="{1}"'.format(
+              TEXT_ID_ATTRIBUTE, _ids[int(x.group(1))]), _item_xml))
+
+        return _item_xmls
+
+    @classmethod
+    def intern_item_xml(cls, segments):
+        """
+        Returns item_xml values for the given <seg> elements.
+
+        Source, reference and translation texts are interned as TextSegment
+        instances in one batch and replaced by text-id attributes.  Note
+        that the given elements are modified in place.
+
+        """
+        return cls.intern_prepared_item_xml(cls.prepare_item_xml(segments))
+
+    @classmethod
+    def prefetch_texts(cls, queryset):
+        """
+        Loads texts referenced by the given RankingTask queryset into cache.
+
+        This allows to instantiate many RankingTask objects without a text
+        lookup query for each of them.
+
+        """
+        _text_ids = set()
+        for _item_xml in queryset.values_list('item_xml', flat=True):
+            _text_ids.update(TEXT_ID_PATTERN.findall(decompress_text(_item_xml)))
+
+        TextSegment.get_texts(_text_ids)
+
+    @staticmethod
+    def _resolve_texts(item_xml):
+        """
+        Replaces text-id attributes in the given element by interned texts.
+        """
+        _elements = [x for x in item_xml.iter()
+          if TEXT_ID_ATTRIBUTE in x.attrib]
+        if not _elements:
+            return
+
+        _texts = TextSegment.get_texts([x.get(TEXT_ID_ATTRIBUTE)
+          for x in _elements])
+        for _element in _elements:
+            _text_id = int(_element.attrib.pop(TEXT_ID_ATTRIBUTE))
+            _element.text = _texts.get(_text_id)
+
+    @staticmethod
+    def _context_texts(element):
+        """
+        Returns (source, reference) texts for the given context element.
+        """
+        if element is None:
+            return None
+
+        _texts = [element.find(x) for x in ('source', 'reference')]
+        return tuple([getattr(x, 'text', None) for x in _texts])
+
+    @cached_property
+    def _dynamic_fields(self):
+        """
+        Parses attributes, source, reference, translations and context.
+        """
+        _fields = dict.fromkeys(('attributes', 'source', 'reference',
+          'translations', 'context'))
         if self.item_xml:
             try:
                 _item_xml = fromstring(self.item_xml)
+                self._resolve_texts(_item_xml)
 
-                self.attributes = _item_xml.attrib
+                _fields['attributes'] = _item_xml.attrib
 
                 _source = _item_xml.find('source')
                 if _source is not None:
-                    self.source = (_source.text, _source.attrib)
+                    _fields['source'] = (_source.text, _source.attrib)
 
                 _reference = _item_xml.find('reference')
                 if _reference is not None:
-                    self.reference = (_reference.text, _reference.attrib)
+                    _fields['reference'] = (_reference.text,
+                      _reference.attrib)
 
-                self.translations = []
+                _fields['translations'] = []
                 for _translation in _item_xml.iterfind('translation'):
-                    self.translations.append((_translation.text,
+                    _fields['translations'].append((_translation.text,
                       _translation.attrib))
 
+                # Items imported before context was precomputed have none.
+                _context = _item_xml.find(CONTEXT_TAG)
+                if _context is not None:
+                    _fields['context'] = tuple([self._context_texts(
+                      _context.find(x)) for x in CONTEXT_SIDES])
+
             except ParseError:
-                self.source = None
-                self.reference = None
-                self.translations = None
+                _fields = dict.fromkeys(_fields.keys())
+
+        return _fields
+
+    def reload_dynamic_fields(self):
+        """
+        Reloads source, reference, and translations from self.item_xml.
+
+        Fields are parsed again on next access.
+
+        """
+        self.__dict__.pop('_dynamic_fields', None)
 
 
 class RankingResult(models.Model):
@@ -584,11 +1134,7 @@ class RankingResult(models.Model):
         """
         return '{}'.format(self.duration)
 
-    raw_result = models.TextField(editable=False, blank=False)
-
-    results = None
-
-    systems = 0
+    raw_result = CompressedTextField(editable=False, blank=False)
 
     class Meta:
         """
@@ -598,36 +1144,52 @@ class RankingResult(models.Model):
         verbose_name = "RankingResult object"
         verbose_name_plural = "RankingResult objects"
 
-    # pylint: disable-msg=E1002
-    def __init__(self, *args, **kwargs):
-        """
-        Makes sure that self.results are available.
-        """
-        super(RankingResult, self).__init__(*args, **kwargs)
-
-        # If raw_result is available, populate dynamic field.
-        self.reload_dynamic_fields()
-
     def __unicode__(self):
         """
         Returns a Unicode String for this RankingResult object.
         """
         return u'<ranking-result id="{0}">'.format(self.id)
 
-    def reload_dynamic_fields(self):
+    @cached_property
+    def results(self):
         """
-        Reloads source, reference, and translations from self.item_xml.
+        Ranks parsed from self.raw_result on first access, None if skipped.
         """
-        if self.raw_result and self.raw_result != 'SKIPPED':
-            try:
-                self.results = self.raw_result.split(',')
-                self.results = [int(x) for x in self.results]
+        if not self.raw_result or self.raw_result == 'SKIPPED':
+            return None
+
+        try:
+            return [int(x) for x in self.raw_result.split(',')]
+
+        # pylint: disable-msg=W0703
+        except Exception, msg:
+            return msg
 
-                self.systems = sum([len(x[1]['system'].split(',')) for x in self.item.translations])
+    @cached_property
+    def systems(self):
+        """
+        Number of ranked systems, computed on first access.
+
+        This loads the item, hence it is only computed when needed.
+
+        """
+        if not isinstance(self.results, list):
+            return 0
+
+        try:
+            return sum([len(x[1]['system'].split(','))
+              for x in self.item.translations])
 
-            # pylint: disable-msg=W0703
-            except Exception, msg:
-                self.results = msg
+        # pylint: disable-msg=W0703
+        except Exception:
+            return 0
+
+    def reload_dynamic_fields(self):
+        """
+        Reloads results and systems from self.raw_result on next access.
+        """
+        self.__dict__.pop('results', None)
+        self.__dict__.pop('systems', None)
 
     def export_to_xml(self):
         """
@@ -971,36 +1533,46 @@ class RankingResult(models.Model):
 @receiver(models.signals.post_save, sender=RankingResult)
 def update_user_hit_mappings(sender, instance, created, **kwargs):
     """
-    Updates the User/Project/HIT mappings.
+    Marks the HIT as completed by the user once all items are ranked.
+
+    On the request path, this only costs two count queries per new result;
+    updated results, e.g., judgments resent by the annotation API, are
+    skipped.  Once a new result completes the HIT, removing the stale
+    User/HIT mapping, computing the user's next HIT and updating status
+    counters is deferred to a queued "complete_hit" task, see
+    appraise.wmt16.tasks.  Until then, the stale mapping is detected by
+    HIT.compute_next_task_for_user() as before.
+
     """
-    hit = instance.item.hit
+    if not created:
+        return
+
+    hit_id = instance.item.hit_id
     user = instance.user
-    results = RankingResult.objects.filter(user=user, item__hit=hit)
+    items = RankingTask.objects.filter(hit=hit_id)
+    results = RankingResult.objects.filter(user=user, item__in=items)
 
-    if len(results) > 2:
-        from appraise.wmt16.views import _compute_next_task_for_user
-        LOGGER.debug('Deleting stale User/HIT mapping {0}->{1}'.format(
-          user, hit))
+    if results.count() == items.count():
+        hit = HIT.objects.defer('hit_xml').get(pk=hit_id)
         hit.users.add(user)
-        for project in hit.project_set.all():
-            UserHITMapping.objects.filter(user=user, project=project, hit=hit).delete()
-            _compute_next_task_for_user(user, project, hit.language_pair)
+        QueuedTask.enqueue('complete_hit', user_id=user.id, hit_id=hit.id)
 
 @receiver(models.signals.post_delete, sender=RankingResult)
 def remove_user_from_hit(sender, instance, **kwargs):
     """
     Removes user from list of users who have completed corresponding HIT.
+
+    Computing the user's next HIT is deferred to a queued "reset_hit" task.
+
     """
     user = instance.user
 
     try:
         hit = instance.item.hit
 
-        LOGGER.debug('Removing user "{0}" from HIT {1}'.format(user, hit))
+        LOGGER.debug('Removing user "%s" from HIT %s', user, hit)
         hit.users.remove(user)
-
-        from appraise.wmt16.views import _compute_next_task_for_user
-        _compute_next_task_for_user(user, hit.project, hit.language_pair)
+        QueuedTask.enqueue('reset_hit', user_id=user.id, hit_id=hit.id)
     
     except (HIT.DoesNotExist, RankingTask.DoesNotExist):
         pass
@@ -1104,11 +1676,32 @@ class UserInviteToken(models.Model):
     @classmethod
     def _create_token(cls):
         """Creates a random UUID-4 8-digit hex number for use as a token."""
-        new_token = uuid.uuid4().hex[:8]
-        while cls.objects.filter(token=new_token):
-            new_token = uuid.uuid4().hex[:8]
+        return INVITE_TOKEN_ALLOCATOR.next_id()
+
+    @classmethod
+    def _create_tokens(cls, count):
+        """Creates count random 8-digit hex numbers for use as tokens."""
+        return INVITE_TOKEN_ALLOCATOR.allocate(count)
+
+
+# Allocates invite tokens in batches, see HIT_ID_ALLOCATOR.
+INVITE_TOKEN_ALLOCATOR = RandomIdAllocator(UserInviteToken, 'token')
+
+
+TIME_SERIES_RESOLUTION_CHOICES = (
+  ('hour', 'Hourly'),
+  ('day', 'Daily'),
+)
+
 
-        return new_token
+def _start_of_period(value, resolution):
+    """
+    Truncates the given datetime value to the start of its hour or day.
+    """
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if resolution == 'day':
+        value = value.replace(hour=0)
+    return value
 
 
 class TimedKeyValueData(models.Model):
@@ -1118,29 +1711,357 @@ class TimedKeyValueData(models.Model):
     key = models.CharField(max_length=100, blank=False, null=False)
     value = models.TextField(blank=False, null=False)
     date_and_time = models.DateTimeField(blank=False, null=False, editable=False, auto_now_add=True)
-    
+
     @classmethod
     def update_status_if_changed(cls, key, new_value):
         """
         Stores a new TimedKeyValueData instance if value for key has changed
         """
-        _latest_values = cls.objects.filter(key=key).order_by('date_and_time').reverse().values_list('value', flat=True)
-        if not _latest_values or _latest_values[0] != new_value:
+        cls.update_statuses_if_changed({key: new_value})
+
+    @classmethod
+    def update_statuses_if_changed(cls, values):
+        """
+        Stores new TimedKeyValueData instances for all changed (key, value) pairs.
+
+        Comparison happens against LatestKeyValueData which holds one row per
+        key, so this costs one query for all keys instead of an ordered scan
+        over the full history of each key.  Changed values are also recorded
+        in the hourly and daily RollupKeyValueData buckets.
+
+        """
+        _latest = {}
+        for latest in LatestKeyValueData.objects.filter(key__in=values.keys()):
+            _latest[latest.key] = latest
+
+        for key, new_value in values.items():
+            latest = _latest.get(key)
+
+            # Keys recorded before LatestKeyValueData existed are seeded from
+            # their most recent history entry, once.
+            if latest is None:
+                latest = LatestKeyValueData.seed_from_history(key)
+
+            if latest is not None and latest.value == new_value:
+                continue
+
             new_data = cls(key=key, value=new_value)
             new_data.save()
+            new_data.record_time_series(latest)
+
+    def record_time_series(self, latest=None):
+        """
+        Updates the latest value index and rollups for this instance.
+        """
+        if latest is None:
+            latest = LatestKeyValueData(key=self.key)
+
+        latest.value = self.value
+        latest.date_and_time = self.date_and_time
+        latest.save()
+
+        for resolution, _ in TIME_SERIES_RESOLUTION_CHOICES:
+            RollupKeyValueData.record(self.key, self.value,
+              self.date_and_time, resolution)
+
+        return latest
+
+    @classmethod
+    def get_time_series(cls, key, resolution='day', since=None):
+        """
+        Returns list of (period_start, value) tuples for the given key.
+
+        Values are read from RollupKeyValueData, hence the number of rows is
+        bounded by the requested resolution, not by the number of updates.
+
+        """
+        rollups = RollupKeyValueData.objects.filter(key=key,
+          resolution=resolution)
+        if since is not None:
+            rollups = rollups.filter(period_start__gte=since)
+
+        return list(rollups.order_by('period_start').values_list(
+          'period_start', 'value'))
+
+    @classmethod
+    def rebuild_time_series(cls):
+        """
+        Rebuilds LatestKeyValueData and RollupKeyValueData from the history.
+
+        Only needed once for databases which contain TimedKeyValueData rows
+        created before the time series tables existed.
+
+        """
+        LatestKeyValueData.objects.all().delete()
+        RollupKeyValueData.objects.all().delete()
+
+        _latest = {}
+        for data in cls.objects.order_by('date_and_time', 'id').iterator():
+            _latest[data.key] = data.record_time_series(_latest.get(data.key))
+
+
+class LatestKeyValueData(models.Model):
+    """
+    Stores the latest value for each TimedKeyValueData key.
+    """
+    key = models.CharField(max_length=100, blank=False, null=False, unique=True)
+    value = models.TextField(blank=False, null=False)
+    date_and_time = models.DateTimeField(blank=False, null=False, editable=False)
+
+    @classmethod
+    def seed_from_history(cls, key):
+        """
+        Creates the latest value for key from TimedKeyValueData, if any.
+        """
+        _history = TimedKeyValueData.objects.filter(key=key).order_by(
+          '-date_and_time', '-id')[:1]
+        if not _history:
+            return None
+
+        latest = cls(key=key, value=_history[0].value,
+          date_and_time=_history[0].date_and_time)
+        latest.save()
+        return latest
+
+
+class RollupKeyValueData(models.Model):
+    """
+    Stores the last TimedKeyValueData value per key, hour or day.
+    """
+    key = models.CharField(max_length=100, blank=False, null=False, db_index=True)
+    resolution = models.CharField(max_length=4, blank=False, null=False,
+      choices=TIME_SERIES_RESOLUTION_CHOICES)
+    period_start = models.DateTimeField(blank=False, null=False, editable=False)
+    value = models.TextField(blank=False, null=False)
+    updates = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        """
+        Metadata options for the RollupKeyValueData object model.
+        """
+        unique_together = ('key', 'resolution', 'period_start')
+
+    @classmethod
+    def record(cls, key, value, date_and_time, resolution):
+        """
+        Records value as the latest value of its hour or day bucket.
+        """
+        period_start = _start_of_period(date_and_time, resolution)
+        rollups = cls.objects.filter(key=key, resolution=resolution,
+          period_start=period_start)
+
+        if not rollups.update(value=value, updates=models.F('updates') + 1):
+            cls.objects.create(key=key, resolution=resolution,
+              period_start=period_start, value=value)
+
+
+class QueuedTask(models.Model):
+    """
+    Stores deferred work, to be processed by process_wmt16_tasks.py.
+
+    Tasks are identified by name and get their arguments as JSON encoded
+    keyword arguments, see appraise.wmt16.tasks for available tasks.  A
+    task is locked for TASK_QUEUE_LOCK_SECONDS while being processed, so
+    several workers can drain the queue and tasks of crashed workers are
+    retried.  Failed tasks are retried, with increasing delays, up to
+    TASK_QUEUE_MAX_ATTEMPTS times and kept afterwards with their last error.
+
+    """
+    name = models.CharField(max_length=100, db_index=True)
+    arguments = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+    locked_until = models.DateTimeField(blank=True, null=True, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        """
+        Metadata options for the QueuedTask object model.
+        """
+        ordering = ('id',)
+
+    def __unicode__(self):
+        """
+        Returns a Unicode String for this QueuedTask object.
+        """
+        return u'<queued-task id="{0}" name="{1}" attempts="{2}">'.format(
+          self.id, self.name, self.attempts)
+
+    @classmethod
+    def enqueue(cls, name, **kwargs):
+        """
+        Queues the task with the given name and keyword arguments.
+        """
+        return cls.objects.create(name=name,
+          arguments=json.dumps(kwargs, sort_keys=True))
+
+    @classmethod
+    def pending(cls, now=None):
+        """
+        Returns a QuerySet of tasks which can be processed now.
+        """
+        if now is None:
+            now = datetime.now()
+
+        unlocked = models.Q(locked_until__isnull=True) \
+          | models.Q(locked_until__lt=now)
+        return cls.objects.filter(unlocked,
+          attempts__lt=TASK_QUEUE_MAX_ATTEMPTS)
+
+    @classmethod
+    def claim_next(cls, batch_size=10):
+        """
+        Locks and returns the next pending task or None, if there is none.
+
+        A task is claimed using a conditional UPDATE, so concurrent workers
+        never process the same task at the same time.
+
+        """
+        now = datetime.now()
+        for task in cls.pending(now)[:batch_size]:
+            claimed = cls.pending(now).filter(pk=task.pk,
+              attempts=task.attempts).update(attempts=task.attempts + 1,
+              locked_until=now + timedelta(seconds=TASK_QUEUE_LOCK_SECONDS))
+            if claimed:
+                task.attempts += 1
+                return task
+
+        return None
+
+    def get_arguments(self):
+        """
+        Returns the keyword arguments for this task.
+        """
+        return json.loads(self.arguments or '{}')
+
+    def release(self, error):
+        """
+        Stores the given error after a failed attempt.
+
+        The task is retried after one minute per failed attempt so far.
+
+        """
+        QueuedTask.objects.filter(pk=self.pk).update(last_error=error,
+          locked_until=datetime.now() + timedelta(minutes=self.attempts))
+
+
+# Composite indexes for the hottest multi-column filters, as (name, model,
+# field names).  Django 1.4 cannot declare these in Meta, hence they are
+# created by create_composite_indexes().  RankingResult(item, user) also
+# serves a user's results for a HIT if these are filtered on a subquery for
+# the HIT's items, as in _find_next_items_to_process(), and not ordered by
+# id;  otherwise, planners may start from all results of the user instead.
+# Filters on user alone use the user foreign key index.
+COMPOSITE_INDEXES = (
+  ('wmt16_hit_status', HIT,
+    ('language_pair', 'active', 'mturk_only', 'completed')),
+  ('wmt16_rankingresult_item_user', RankingResult, ('item', 'user')),
+  ('wmt16_userhitmapping_user_project', UserHITMapping,
+    ('user', 'project')),
+  ('wmt16_timedkeyvaluedata_key_date', TimedKeyValueData,
+    ('key', 'date_and_time')),
+)
+
+
+def _index_exists(cursor, table, name):
+    """
+    Checks if an index with the given name exists on table.
+
+    Returns None if this cannot be checked for the current database.
+
+    """
+    if connection.vendor == 'sqlite':
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' " \
+          "AND tbl_name = %s AND name = %s", [table, name])
+
+    elif connection.vendor == 'postgresql':
+        cursor.execute('SELECT 1 FROM pg_indexes WHERE tablename = %s ' \
+          'AND indexname = %s', [table, name])
+
+    elif connection.vendor == 'mysql':
+        cursor.execute('SELECT 1 FROM information_schema.statistics WHERE ' \
+          'table_schema = DATABASE() AND table_name = %s AND index_name = %s',
+          [table, name])
+
+    else:
+        return None
+
+    return cursor.fetchone() is not None
+
+
+def create_composite_indexes(dry_run=False):
+    """
+    Creates missing COMPOSITE_INDEXES in the database.
+
+    This is idempotent and can be run on existing databases.  Returns the
+    names of created indexes, or of missing indexes if dry_run is True.
+
+    """
+    created_names = []
+    cursor = connection.cursor()
+    quote_name = connection.ops.quote_name
+    for name, model, field_names in COMPOSITE_INDEXES:
+        table = model._meta.db_table
+        if _index_exists(cursor, table, name):
+            continue
+
+        created_names.append(name)
+        if dry_run:
+            continue
+
+        columns = [model._meta.get_field(x).column for x in field_names]
+        sql = 'CREATE INDEX {0} ON {1} ({2})'.format(quote_name(name),
+          quote_name(table), ', '.join([quote_name(x) for x in columns]))
+        LOGGER.debug('Creating index: %s', sql)
+        try:
+            with transaction.commit_on_success():
+                cursor.execute(sql)
+                transaction.set_dirty()
+
+        # Databases we cannot check report existing indexes here.
+        except DatabaseError, msg:
+            LOGGER.info('Skipping index %s: %s', name, msg)
+            created_names.remove(name)
+
+    return created_names
+
+
+def initialize_database(dry_run=False):
+    """
+    Initializes database with required language code and WMT16 groups.
+
+    This is idempotent;  existing groups are looked up using one query and
+    only missing groups are created.  Returns the names of created groups,
+    or of missing groups if dry_run is True.
+
+    """
+    group_names = set(GROUP_HIT_REQUIREMENTS.keys())
+    group_names.update(x[0] for x in LANGUAGE_PAIR_CHOICES)
+    group_names.add('WMT16')
+
+    # Some names are UTF-8 encoded byte strings, the database returns text.
+    group_names = set(x.decode('utf-8') if isinstance(x, str) else x
+      for x in group_names)
+
+    existing_names = set(Group.objects.filter(name__in=group_names
+      ).values_list('name', flat=True))
+    missing_names = sorted(group_names - existing_names)
+    if not dry_run:
+        for group_name in missing_names:
+            LOGGER.debug("Creating group '%s'", group_name)
+
+        Group.objects.bulk_create([Group(name=x) for x in missing_names])
+
+    return missing_names
 
 
-def initialize_database():
+@receiver(models.signals.post_syncdb)
+def initialize_database_after_syncdb(sender, app, **kwargs):
     """
-    Initializes database with required language code and WMT16 groups
+    Runs initialize_database() and create_composite_indexes() once syncdb
+    has created the WMT16 tables.  For existing databases, running syncdb
+    again adds missing indexes.
     """
-    researcher_group_names = set(GROUP_HIT_REQUIREMENTS.keys())
-    for researcher_group_name in researcher_group_names:
-        LOGGER.debug("Validating researcher group '{0}'".format(researcher_group_name))
-        _ = Group.objects.get_or_create(name=researcher_group_name)
-    language_pair_codes = set(x[0] for x in LANGUAGE_PAIR_CHOICES)
-    for language_pair_code in language_pair_codes:
-        LOGGER.debug("Validating group '{0}'".format(language_pair_code))
-        _ = Group.objects.get_or_create(name=language_pair_code)
-    LOGGER.debug("Validating group 'WMT16'")
-    _ = Group.objects.get_or_create(name='WMT16')
\ No newline at end of file
+    if app.__name__ == __name__:
+        initialize_database()
+        create_composite_indexes()
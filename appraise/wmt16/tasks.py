@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Project: Appraise evaluation system
+ Author: Christian Federmann <cfedermann@gmail.com>
+"""
+import logging
+
+from traceback import format_exc
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from appraise.wmt16.models import HIT, QueuedTask, TimedKeyValueData, \
+  UserHITMapping
+from appraise.settings import LOG_LEVEL, LOG_HANDLER
+
+# Setup logging support.
+logging.basicConfig(level=LOG_LEVEL)
+LOGGER = logging.getLogger('appraise.wmt16.tasks')
+LOGGER.addHandler(LOG_HANDLER)
+
+# Maps QueuedTask names to the functions processing them.
+TASK_HANDLERS = {}
+
+
+def task_handler(name):
+    """
+    Registers the decorated function as handler for tasks with this name.
+    """
+    def _register(func):
+        TASK_HANDLERS[name] = func
+        return func
+
+    return _register
+
+
+def _get_user_and_hit(user_id, hit_id):
+    """
+    Returns (user, hit) for the given ids, or None if one does not exist.
+    """
+    try:
+        return User.objects.get(pk=user_id), HIT.objects.get(pk=hit_id)
+
+    except (User.DoesNotExist, HIT.DoesNotExist):
+        return None
+
+
+@task_handler('complete_hit')
+def complete_hit(user_id, hit_id):
+    """
+    Follow-up work after the given user has completed the given HIT.
+
+    Removes the stale User/HIT mappings, computes the user's next HIT for
+    each project of the HIT, marks the HIT completed and updates the HIT
+    completion counters shown on the status page.
+
+    """
+    user_and_hit = _get_user_and_hit(user_id, hit_id)
+    if user_and_hit is None:
+        return
+
+    user, hit = user_and_hit
+    for project in hit.project_set.all():
+        LOGGER.debug('Deleting stale User/HIT mapping %s->%s', user, hit)
+        UserHITMapping.objects.filter(user=user, project=project,
+          hit=hit).delete()
+        HIT.compute_next_task_for_user(user, project, hit.language_pair)
+
+    # Same rule as _compute_global_stats(): one annotator completes a HIT.
+    if hit.mturk_only or hit.completed:
+        return
+
+    HIT.objects.filter(pk=hit.pk).update(completed=True)
+    _completed_hits = HIT.objects.filter(completed=True, mturk_only=False)
+    TimedKeyValueData.update_statuses_if_changed({
+      'hits_completed': str(_completed_hits.count()),
+      'hits_completed_{0}'.format(hit.language_pair): str(
+        _completed_hits.filter(language_pair=hit.language_pair).count()),
+    })
+
+
+@task_handler('reset_hit')
+def reset_hit(user_id, hit_id):
+    """
+    Follow-up work after a result of the given user and HIT was deleted.
+    """
+    user_and_hit = _get_user_and_hit(user_id, hit_id)
+    if user_and_hit is None:
+        return
+
+    user, hit = user_and_hit
+    for project in hit.project_set.all():
+        HIT.compute_next_task_for_user(user, project, hit.language_pair)
+
+
+def process_task(task):
+    """
+    Runs the given QueuedTask, deleting it if it succeeds.
+
+    The handler and the deletion run in one transaction.  If the handler
+    fails, the task keeps the error and is retried later, see
+    QueuedTask.release().  Returns True if the task succeeded.
+
+    """
+    try:
+        with transaction.commit_on_success():
+            handler = TASK_HANDLERS[task.name]
+            handler(**task.get_arguments())
+            QueuedTask.objects.filter(pk=task.pk).delete()
+
+    # pylint: disable-msg=W0703
+    except Exception:
+        LOGGER.warning('Task %s failed, attempt %s:\n%s', task, task.attempts,
+          format_exc())
+        task.release(format_exc())
+        return False
+
+    return True
+
+
+def process_tasks(max_tasks=None):
+    """
+    Processes pending tasks until the queue is empty or max_tasks are done.
+
+    Returns a tuple (succeeded, failed) containing the number of tasks.
+
+    """
+    succeeded = 0
+    failed = 0
+    while max_tasks is None or succeeded + failed < max_tasks:
+        task = QueuedTask.claim_next()
+        if task is None:
+            break
+
+        if process_task(task):
+            succeeded += 1
+
+        else:
+            failed += 1
+
+    return succeeded, failed
@@ -5,7 +5,7 @@ Project: Appraise evaluation system
 """
 import logging
 
-from xml.etree.ElementTree import Element, fromstring, ParseError
+from xml.etree.ElementTree import Element, fromstring, iterparse, ParseError
 
 from django.core.exceptions import ValidationError
 
@@ -50,6 +50,62 @@ def validate_hits_xml_file(value):
     return value
 
 
+def iter_hits_xml_file(source):
+    """
+    Validates and yields all <hit> elements from the given HITs XML file.
+    
+    The given source can either be a file name or a file object.  We parse
+    the file incrementally using iterparse();  each <hit> is validated when
+    it has been read and removed from the tree when the next one is read,
+    so memory usage does not depend on the file size.  Callers must not
+    keep references to yielded elements or their children.
+    
+    """
+    _root = None
+    _depth = 0
+    _hit = None
+    try:
+        for _event, _elem in iterparse(source, events=('start', 'end')):
+            if _event == 'start':
+                if _root is None:
+                    _root = _elem
+                    assert(_root.tag == 'hits'), 'expected <hits> on top-level'
+                
+                # We only yield a <hit> once the next one starts as only
+                # then its tail text is guaranteed to be complete.
+                elif _depth == 1 and _hit is not None:
+                    yield _hit
+                    _root.remove(_hit)
+                    _hit = None
+                
+                _depth += 1
+                continue
+            
+            _depth -= 1
+            if _depth == 1:
+                validate_hit_xml(_elem)
+                _hit = _elem
+        
+        if _hit is not None:
+            yield _hit
+    
+    except (AssertionError, ParseError), msg:
+        raise ValidationError('Invalid XML: "{0}".'.format(msg))
+
+
+def validate_hits_xml_stream(source):
+    """
+    Validates the given HITs XML file without loading it into memory.
+    
+    The given source can either be a file name or a file object.
+    
+    """
+    for _ in iter_hits_xml_file(source):
+        pass
+    
+    return source
+
+
 def validate_hit_xml(value):
     """
     Validates the given single HIT XML source value.
@@ -102,7 +158,22 @@ def validate_hit_xml(value):
     return value
 
 
-def validate_segment_xml(value, require_systems=False):
+def _has_text(element, allow_text_ids=False):
+    """
+    Checks that the given element has a text value or an interned text-id.
+    
+    Uploaded XML has to contain text values;  text-id attributes are only
+    allowed if allow_text_ids is set.
+    
+    """
+    if 'text-id' in element.attrib:
+        assert(allow_text_ids), 'unexpected text-id attribute'
+        return True
+    
+    return element.text is not None
+
+
+def validate_segment_xml(value, require_systems=False, allow_text_ids=False):
     """
     Checks that the given segment XML value contains all required elements.
     
@@ -111,7 +182,9 @@ def validate_segment_xml(value, require_systems=False):
     - one <reference> element; and
     - five <translation> elements.
     
-    The given value can either be an XML string or an ElementTree.
+    The given value can either be an XML string or an ElementTree.  Texts
+    may only be referenced using text-id attributes if allow_text_ids is
+    set, see validate_item_xml().
     
     """
     try:
@@ -128,20 +201,20 @@ def validate_segment_xml(value, require_systems=False):
         assert(len(_tree.findall('source')) == 1), \
           'exactly one <source> element expected'
         
-        assert(_tree.find('source').text is not None), \
+        assert(_has_text(_tree.find('source'), allow_text_ids)), \
           'missing required <source> text value'
         
         assert(len(_tree.findall('reference')) == 1), \
           'exactly one <reference> element expected'
         
-        assert(_tree.find('reference').text is not None), \
+        assert(_has_text(_tree.find('reference'), allow_text_ids)), \
           'missing required <reference> text value'
         
         assert(len(_tree.findall('translation')) > 0), \
           'one or more <translation> elements expected'
         
         for _translation in _tree.iterfind('translation'):
-            assert(_translation.text is not None), \
+            assert(_has_text(_translation, allow_text_ids)), \
               'missing required <translation> text value'
             if require_systems:
                 assert('system' in _translation.attrib.keys()), \
@@ -149,3 +222,34 @@ def validate_segment_xml(value, require_systems=False):
     
     except (AssertionError, ParseError), msg:
         raise ValidationError('Invalid XML: "{0}".'.format(msg))
+
+
+def validate_item_xml(value):
+    """
+    Validates the given RankingTask item XML value.
+    
+    Items reference interned texts using text-id attributes, hence we check
+    that all referenced TextSegment instances exist, using a single query.
+    
+    """
+    from appraise.wmt16.models import TextSegment
+    
+    try:
+        if isinstance(value, Element):
+            _tree = value
+        
+        else:
+            _tree = fromstring(value.encode("utf-8"))
+        
+        validate_segment_xml(_tree, allow_text_ids=True)
+        
+        _text_ids = set([int(x.get('text-id')) for x in _tree.iter()
+          if 'text-id' in x.attrib])
+        if _text_ids:
+            _existing = TextSegment.objects.filter(id__in=_text_ids).count()
+            assert(_existing == len(_text_ids)), 'unknown text-id attribute'
+    
+    except (AssertionError, ParseError, ValueError), msg:
+        raise ValidationError('Invalid XML: "{0}".'.format(msg))
+    
+    return value
@@ -3,6 +3,7 @@
 Project: Appraise evaluation system
  Author: Christian Federmann <cfedermann@gmail.com>
 """
+import json
 import logging
 
 from datetime import datetime, timedelta
@@ -18,17 +19,23 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import Group, User
 from django.core.urlresolvers import reverse
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
-from django.http import HttpResponse, HttpResponseForbidden
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import HttpResponse, HttpResponseBadRequest, \
+  HttpResponseForbidden
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template import Context
 from django.template.loader import get_template
+from django.views.decorators.http import condition
 
 from appraise.wmt16.models import LANGUAGE_PAIR_CHOICES, UserHITMapping, \
   HIT, RankingTask, RankingResult, UserHITMapping, UserInviteToken, Project, \
-  GROUP_HIT_REQUIREMENTS, MAX_USERS_PER_HIT, initialize_database, \
-  TimedKeyValueData
+  GROUP_HIT_REQUIREMENTS, \
+  TimedKeyValueData, TIME_SERIES_RESOLUTION_CHOICES
+from appraise.middleware import query_budget
 from appraise.settings import LOG_LEVEL, LOG_HANDLER, COMMIT_TAG, ROOT_PATH, STATIC_URL
-from appraise.utils import datetime_to_seconds, seconds_to_timedelta
+from appraise.utils import BoundedCache, datetime_to_seconds, \
+  seconds_to_timedelta
 
 # Setup logging support.
 logging.basicConfig(level=LOG_LEVEL)
@@ -44,13 +51,28 @@ BASE_CONTEXT = {
 }
 
 # We keep status and ranking information available in memory to speed up
-# access and avoid lengthy delays caused by computation of this data.
-STATUS_CACHE = {}
-RANKINGS_CACHE = {}
+# access and avoid lengthy delays caused by computation of this data.  Both
+# caches only hold a few keys and are refreshed explicitly, so there is no
+# expiry;  see update_status() and update_ranking().
+STATUS_CACHE = BoundedCache('wmt16.status', max_size=32)
+RANKINGS_CACHE = BoundedCache('wmt16.rankings', max_size=32)
 
-# Initalized database
-initialize_database()
+# Status sub keys which are required to render the status view.
+STATUS_KEYS = ('global_stats', 'language_pair_stats', 'group_stats',
+  'user_stats')
 
+# Number of upcoming items returned by the annotation API by default, and
+# at most.  Clients show the first one and prefetch the others.
+API_DEFAULT_ITEMS = 2
+API_MAX_ITEMS = 10
+
+# Maximum number of judgments per annotation API request;  clients send
+# larger backlogs in several requests.
+API_MAX_JUDGMENTS = 10
+
+# TimedKeyValueData keys returned by the progress view unless specified.
+PROGRESS_KEYS = ('hits_completed', 'hits_remaining', 'ranking_results',
+  'system_comparisons')
 
 def _identify_groups_for_user(user):
     """
@@ -81,119 +103,12 @@ def _get_active_users_for_group(group_to_check):
     return active_users
 
 
-def _compute_next_task_for_user(user, project, language_pair):
-    """
-    Computes the next task for the given user, project and language pair combination.
-
-    This may either be the HIT the given user is currently working on or a
-    new HIT in case the user has completed all previous HITs already.
-
-    By convention, language_pair is a String in format xxx2yyy where both
-    xxx and yyy are ISO-639-3 language codes.
-
-    """
-    # Check if project is valid for the given user.
-    if not project in user.project_set.all():
-        LOGGER.debug('User {0} does not work on project {1}.'.format(
-          user, project
-        ))
-        return None
-    
-    # Check if language_pair is valid for the given user.
-    if not user.groups.filter(name=language_pair):
-        LOGGER.debug('User {0} does not know language pair {1}.'.format(
-          user, language_pair))
-        return None
-
-    # Check if there exists a current HIT for the given user.
-    current_hitmap = UserHITMapping.objects.filter(user=user,
-      project=project, hit__language_pair=language_pair)
-
-    # If there is no current HIT to continue with, find a random HIT for the
-    # given user.  We keep generating a random block_id in [1, 1000] until we
-    # find a matching HIT which the current user has not yet completed.
-    if not current_hitmap:
-        LOGGER.debug('No current HIT for user {0}, fetching HIT.'.format(
-          user))
-        
-        # Compatible HIT instances need to match the given language pair!
-        # Furthermore, they need to be active and not reserved for MTurk.
-        hits = HIT.objects.filter(active=True, mturk_only=False,
-          completed=False, project=project, language_pair=language_pair)
-        
-        LOGGER.debug("HITs = {0}".format(hits))
-        
-        # Compute list of compatible block ids and randomise its order.
-        #
-        # cfedermann: for WMT14 Matt did not provide block ids anymore.
-        #   This meant that our shuffled list of block ids only contained
-        #   [-1, ..., -1] entries;  using these to filter and check for
-        #   respective HIT status is a quadratic increase of redundant work
-        #   which will take prohibitively long when there is no next HIT.
-        #
-        #   Converting to unique HIT ids will speed up things drastically.
-        hit_ids = list(set(hits.values_list('hit_id', flat=True)))
-        shuffle(hit_ids)
-        LOGGER.debug("HIT IDs = {0}".format(hit_ids))
-        
-        # Find the next HIT for the current user.
-        random_hit = None
-        for hit_id in hit_ids:
-            for hit in hits.filter(hit_id=hit_id):
-                hit_users = list(hit.users.all())
-                
-                # Check if this HIT is mapped to users.  This code prevents
-                # that more than MAX_USERS_PER_HIT users complete a HIT.
-                for hitmap in UserHITMapping.objects.filter(hit=hit):
-                    if not hitmap.user in hit_users:
-                        hit_users.append(hitmap.user)
-                
-                if not user in hit_users:
-                    if len(hit_users) < MAX_USERS_PER_HIT:
-                        random_hit = hit
-                        break
-            
-            if random_hit:
-                break
-        
-        # If we still haven't found a next HIT, there simply is none...
-        if not random_hit:
-            # TODO: We should now investigate if there is any HIT assigned
-            #   to a user but has not been finished in a certain time span.
-            #   Such a HIT can be freed and assigned to the current user.            
-            return None
-        
-        # Update User/HIT mappings s.t. the system knows about the next HIT.
-        current_hitmap = UserHITMapping.objects.create(user=user,
-          project=project, hit=random_hit)
-    
-    # Otherwise, select first match from QuerySet.
-    else:
-        current_hitmap = current_hitmap[0]
-        
-        # Sanity check preventing stale User/HIT mappings to screw up things.
-        #
-        # Before we checked if `len(hit_users) >= 3`.
-        hit_users = list(current_hitmap.hit.users.all())
-        if user in hit_users or len(hit_users) >= 1 \
-          or not current_hitmap.hit.active:
-            LOGGER.debug('Detected stale User/HIT mapping {0}->{1}'.format(
-              user, current_hitmap.hit))
-            current_hitmap.delete()
-            return _compute_next_task_for_user(user, project, language_pair)
-    
-    LOGGER.debug('User {0} currently working on HIT {1}'.format(user,
-      current_hitmap.hit))
-    
-    return current_hitmap.hit
-
-
 def _save_results(item, user, duration, raw_result):
     """
     Creates or updates the RankingResult for the given item and user.
     """
-    LOGGER.debug('item: {}, user: {}, duration: {}, raw_result: {}'.format(
-      item, user, duration, raw_result.encode('utf-8')))
+    LOGGER.debug(u'item: %s, user: %s, duration: %s, raw_result: %s', item,
+      user, duration, raw_result)
     
     _existing_result = RankingResult.objects.filter(item=item, user=user)
     
@@ -203,9 +118,10 @@ def _save_results(item, user, duration, raw_result):
     else:
         _result = RankingResult(item=item, user=user)
     
-    LOGGER.debug(u'\n\nResults data for user "{0}":\n\n{1}\n'.format(
-      user.username or "Anonymous",
-      u'\n'.join([str(x) for x in [_result, duration, raw_result]])))
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        LOGGER.debug(u'\n\nResults data for user "%s":\n\n%s\n',
+          user.username or "Anonymous",
+          u'\n'.join([unicode(x) for x in [_result, duration, raw_result]]))
     
     _result.duration = str(duration)
     _result.raw_result = raw_result
@@ -213,20 +129,33 @@ def _save_results(item, user, duration, raw_result):
     _result.save()
 
 
-def _find_next_item_to_process(items, user, random_order=False):
+def _find_next_items_to_process(items, user, count, random_order=False):
     """
-    Computes the next item the current user should process or None, if done.
+    Computes up to count items the current user should process next.
+    
+    Only the user's results for the given items are considered, using a
+    subquery, so this does not depend on how many results the user has
+    submitted overall.  Random order is computed by the database.
+    
     """
-    user_results = RankingResult.objects.filter(user=user)
+    user_results = RankingResult.objects.filter(user=user, item__in=items)
     
-    processed_items = user_results.values_list('item__pk', flat=True)
+    processed_items = user_results.values_list('item', flat=True)
+    
+    unprocessed_items = items.exclude(pk__in=processed_items)
     
-    # cfedermann: this might be sub optimal wrt. performance!
-    unprocessed_items = list(items.exclude(pk__in=processed_items))
-
     if random_order:
-        shuffle(unprocessed_items)
+        unprocessed_items = unprocessed_items.order_by('?')
     
+    return list(unprocessed_items[:count])
+
+
+def _find_next_item_to_process(items, user, random_order=False):
+    """
+    Computes the next item the current user should process or None, if done.
+    """
+    unprocessed_items = _find_next_items_to_process(items, user, 1,
+      random_order)
     if unprocessed_items:
         return unprocessed_items[0]
     
@@ -238,35 +167,45 @@ def _compute_context_for_item(item):
     Computes the source and reference texts for item, including context.
     
     Left/right context is only displayed if it belongs to the same document,
-    hence we check the doc-id attribute before adding context.
+    hence we check for equal, non-empty doc-ids before adding context.
+    Context is precomputed on import, see RankingTask.add_document_context();  only
+    items imported before need to look up their neighbours.
     
     """
     source_text = [None, None, None]
     reference_text = [None, None, None]
     
-    left_context = RankingTask.objects.filter(hit=item.hit, pk=item.id-1)
-    right_context = RankingTask.objects.filter(hit=item.hit, pk=item.id+1)
-    
-    _item_doc_id = getattr(item.attributes, 'doc-id', None)
-    
     # Item text and, if available, reference text are always set.
     source_text[1] = item.source[0]
     if item.reference:
         reference_text[1] = item.reference[0]
     
-    # Only display context if left/right doc-ids match current item's doc-id.
-    if left_context:
+    if item.context is not None:
+        for index, _context in zip((0, 2), item.context):
+            if _context is not None:
+                source_text[index], reference_text[index] = _context
+        
+        return (source_text, reference_text)
+    
+    left_context = RankingTask.objects.filter(hit=item.hit, pk=item.id-1)
+    right_context = RankingTask.objects.filter(hit=item.hit, pk=item.id+1)
+    
+    _item_doc_id = item.attributes.get('doc-id', None)
+    
+    # Only display context if left/right doc-ids match current item's doc-id;
+    # items without doc-id do not get any context.
+    if _item_doc_id and left_context:
         _left = left_context[0]
-        _left_doc_id = getattr(_left.attributes, 'doc-id', None)
+        _left_doc_id = _left.attributes.get('doc-id', None)
         
         if _left_doc_id == _item_doc_id:
             source_text[0] = _left.source[0]
             if _left.reference:
                 reference_text[0] = _left.reference[0]
     
-    if right_context:
+    if _item_doc_id and right_context:
         _right = right_context[0]
-        _right_doc_id = getattr(_right.attributes, 'doc-id', None)
+        _right_doc_id = _right.attributes.get('doc-id', None)
         
         if _right_doc_id == _item_doc_id:
             source_text[2] = _right.source[0]
@@ -276,6 +215,79 @@ def _compute_context_for_item(item):
     return (source_text, reference_text)
 
 
+def _save_ranking(item, user, start_timestamp, end_timestamp, order_random,
+  ranks, submit_button):
+    """
+    Saves the ranking submitted by user for the given item.
+    
+    The ranks are given in display order, order_random maps them back to
+    the order of item.translations.  If submit_button is "FLAG_ERROR", the
+    item is saved as skipped.
+    
+    """
+    # Compute duration for this item.
+    start_datetime = datetime.fromtimestamp(float(start_timestamp))
+    end_datetime = datetime.fromtimestamp(float(end_timestamp))
+    duration = end_datetime - start_datetime
+    
+    # Initialise order from order_random.
+    order = [int(x) for x in order_random.split(',')]
+    
+    # Compute ranks for translation alternatives using order.
+    _ranks = {}
+    for index in range(len(item.translations)):
+        _ranks[order[index]] = int(ranks[index])
+    
+    # If "Flag Error" was clicked, _raw_result is set to "SKIPPED".
+    if submit_button == 'FLAG_ERROR':
+        _raw_result = 'SKIPPED'
+    
+    # Otherwise, the _raw_result is a comma-separated list of ranks.
+    elif submit_button == 'SUBMIT':
+        _raw_result = range(len(item.translations))
+        _raw_result = ','.join([str(_ranks[x]) for x in _raw_result])
+    
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        _results_data = [item, type(item), user, type(user), duration,
+          type(duration), _raw_result, type(_raw_result)]
+        LOGGER.debug(u'\n\nResults data for user "%s":\n\n%s\n',
+          user.username or "Anonymous",
+          u'\n'.join([unicode(x) for x in _results_data]))
+    
+    # Save results for this item to the Django database.
+    _save_results(item, user, duration, _raw_result)
+
+
+def _compute_item_data(item, finished_items):
+    """
+    Computes the data needed to render the given item for annotation.
+    
+    Translations are shuffled;  the order value has to be submitted back
+    with the ranks, see _save_ranking().
+    
+    """
+    # Compute source and reference texts including context where possible.
+    source_text, reference_text = _compute_context_for_item(item)
+    
+    # Create list of translation alternatives in randomised order.
+    translations = []
+    order = range(len(item.translations))
+    shuffle(order)
+    for index in order:
+        translations.append(item.translations[index])
+    
+    return {
+      'item_id': item.id,
+      'sentence_id': item.source[1]['id'],
+      'language_pair': item.hit.get_language_pair_display(),
+      'order': ','.join([str(x) for x in order]),
+      'reference_text': reference_text,
+      'source_text': source_text,
+      'task_progress': '{0}/3'.format(finished_items),
+      'translations': translations,
+    }
+
+
 @login_required
 def _handle_ranking(request, task, items):
     """
@@ -304,77 +316,37 @@ def _handle_ranking(request, task, items):
         # Retrieve EvalutionItem instance for the given id or raise Http404.
         current_item = get_object_or_404(RankingTask, pk=int(item_id))
         
-        # Compute duration for this item.
-        start_datetime = datetime.fromtimestamp(float(start_timestamp))
-        end_datetime = datetime.fromtimestamp(float(end_timestamp))
-        duration = end_datetime - start_datetime
-        
-        # Initialise order from order_random.
-        order = [int(x) for x in order_random.split(',')]
-        
-        # Compute ranks for translation alternatives using order.
-        ranks = {}
-        for index in range(len(current_item.translations)):
-            rank = request.POST.get('rank_{0}'.format(index), -1)
-            ranks[order[index]] = int(rank)
+        ranks = [request.POST.get('rank_{0}'.format(index), -1)
+          for index in range(len(current_item.translations))]
         
-        # If "Flag Error" was clicked, _raw_result is set to "SKIPPED".
-        if submit_button == 'FLAG_ERROR':
-            _raw_result = 'SKIPPED'
-        
-        # Otherwise, the _raw_result is a comma-separated list of ranks.
-        elif submit_button == 'SUBMIT':
-            _raw_result = range(len(current_item.translations))
-            _raw_result = ','.join([str(ranks[x]) for x in _raw_result])
-        
-        _results_data = [current_item, type(current_item), request.user,
-          type(request.user), duration, type(duration), _raw_result,
-          type(_raw_result)]
-        LOGGER.debug(u'\n\nResults data for user "{0}":\n\n{1}\n'.format(
-          request.user.username or "Anonymous",
-          u'\n'.join([str(x) for x in _results_data])))
-        
-        # Save results for this item to the Django database.
-        _save_results(current_item, request.user, duration, _raw_result)
+        _save_ranking(current_item, request.user, start_timestamp,
+          end_timestamp, order_random, ranks, submit_button)
     
     # Find next item the current user should process or return to overview.
     item = _find_next_item_to_process(items, request.user, False)
     if not item:
         return redirect('appraise.wmt16.views.overview')
-
-    # Compute source and reference texts including context where possible.
-    source_text, reference_text = _compute_context_for_item(item)
     
     # Retrieve the number of finished items for this user and task. We
     # increase finished_items by one as we are processing the first
     # unfinished item.
     finished_items = 1 + RankingResult.objects.filter(user=request.user,
-      item__hit=item.hit).count()
+      item__in=items).count()
     
-    # Create list of translation alternatives in randomised order.
-    translations = []
-    order = range(len(item.translations))
-    shuffle(order)
-    for index in order:
-        translations.append(item.translations[index])
-    
-    dictionary = {
+    dictionary = _compute_item_data(item, finished_items)
+    dictionary.update({
       'action_url': request.path,
-      'item_id': item.id,
-      'sentence_id': item.source[1]['id'],
-      'language_pair': item.hit.get_language_pair_display(),
-      'order': ','.join([str(x) for x in order]),
-      'reference_text': reference_text,
-      'source_text': source_text,
-      'task_progress': '{0}/3'.format(finished_items),
+      'api_url': reverse('appraise.wmt16.views.annotation_api',
+        kwargs={'hit_id': task.hit_id}),
+      'api_max_judgments': API_MAX_JUDGMENTS,
       'title': 'Ranking',
-      'translations': translations,
-    }
+    })
     dictionary.update(BASE_CONTEXT)
     
     return render(request, 'wmt16/ranking.html', dictionary)
 
 
+@query_budget(40)
 @login_required
 def hit_handler(request, hit_id):
     """
@@ -383,17 +355,17 @@ def hit_handler(request, hit_id):
     Finds the task with the given hit_id and redirects to its task handler.
     
     """
-    LOGGER.info('Rendering task handler view for user "{0}".'.format(
-      request.user.username or "Anonymous"))
+    LOGGER.info('Rendering task handler view for user "%s".',
+      request.user.username or "Anonymous")
     
-    hit = get_object_or_404(HIT, hit_id=hit_id)
+    hit = get_object_or_404(HIT.objects.defer('hit_xml'), hit_id=hit_id)
     if not hit.active:
-        LOGGER.debug('Detected inactive User/HIT mapping {0}->{1}'.format(
-          request.user, hit))
+        LOGGER.debug('Detected inactive User/HIT mapping %s->%s',
+          request.user, hit)
         # Try to find a new HIT for the current annotation project
         if hit.project_set.count() > 0:
             annotation_project = list(hit.project_set.all())[0]
-            new_hit = _compute_next_task_for_user(request.user, annotation_project, hit.language_pair)
+            new_hit = HIT.compute_next_task_for_user(request.user, annotation_project, hit.language_pair)
             if new_hit:
                 return redirect('appraise.wmt16.views.hit_handler',
                   hit_id=new_hit.hit_id)
@@ -402,19 +374,156 @@ def hit_handler(request, hit_id):
         return redirect('appraise.wmt16.views.overview')
     
     items = RankingTask.objects.filter(hit=hit)
+    RankingTask.prefetch_texts(items)
     if not items:
         return redirect('appraise.wmt16.views.overview')
     
     return _handle_ranking(request, hit, items)
 
 
+def _json_response(data, status=200):
+    """
+    Returns an HttpResponse containing the given data serialised as JSON.
+    """
+    response = HttpResponse(json.dumps(data), mimetype='application/json')
+    response.status_code = status
+    return response
+
+
+@query_budget(40)
+@login_required
+def annotation_api(request, hit_id):
+    """
+    JSON annotation API for the ranking interface.
+    
+    A POST request may contain a list of judgments for items of the given
+    HIT, which are saved in a single transaction;  at most API_MAX_JUDGMENTS
+    judgments are accepted per request.  Both GET and POST return
+    the next items the current user should process, so that the client can
+    render these without waiting for another page load.  Translations are
+    sent without system ids.  Saving a judgment again updates its result,
+    hence clients can safely resend judgments after a failed request.
+    
+    Request body (POST):
+    
+      {"judgments": [{"item_id": 1, "order": "2,0,1", "ranks": [1, 2, 3],
+        "start_timestamp": 0.0, "end_timestamp": 1.0, "skipped": false}],
+       "count": 2}
+    
+    Response:
+    
+      {"hit_id": "...", "saved": [1], "items": [...], "next_url": null}
+    
+    If no items are left, next_url points to the overview page.  Invalid
+    judgments do not prevent the valid ones from being saved;  if there are
+    any, the response has status 400 and additionally contains the error
+    and the indexes of the rejected judgments:
+    
+      {"error": "Invalid judgments.", "rejected": [0], "saved": [], ...}
+    
+    Judgments for an inactive HIT are not saved and rejected as a whole.
+    
+    """
+    LOGGER.info('Rendering annotation API view for user "%s".',
+      request.user.username or "Anonymous")
+    
+    hit = get_object_or_404(HIT.objects.defer('hit_xml'), hit_id=hit_id)
+    items = RankingTask.objects.filter(hit=hit)
+    
+    count = request.GET.get('count', API_DEFAULT_ITEMS)
+    judgments = []
+    if request.method == "POST":
+        try:
+            data = json.loads(request.body)
+            judgments = data.get('judgments', [])
+            count = data.get('count', count)
+        
+        except (AttributeError, ValueError), msg:
+            return _json_response({'error': 'Invalid JSON: {0}'.format(msg)},
+              400)
+    
+    try:
+        count = max(0, min(int(count), API_MAX_ITEMS))
+    
+    except (TypeError, ValueError):
+        return _json_response({'error': 'Invalid count value.'}, 400)
+    
+    if not isinstance(judgments, list):
+        return _json_response({'error': 'Invalid judgments.'}, 400)
+    
+    if len(judgments) > API_MAX_JUDGMENTS:
+        error = 'At most {0} judgments allowed.'.format(API_MAX_JUDGMENTS)
+        return _json_response({'error': error}, 400)
+    
+    # _save_ranking() validates a judgment before saving it, hence rejected
+    # judgments leave no partial results behind.
+    saved = []
+    rejected = []
+    error = 'Invalid judgments.'
+    if judgments and not hit.active:
+        rejected = range(len(judgments))
+        error = 'Inactive HIT.'
+    
+    elif judgments:
+        with transaction.commit_on_success():
+            for index, judgment in enumerate(judgments):
+                try:
+                    item = items.get(pk=int(judgment['item_id']))
+                    submit_button = 'FLAG_ERROR' \
+                      if judgment.get('skipped') else 'SUBMIT'
+                    ranks = judgment.get('ranks') \
+                      or [-1] * len(item.translations)
+                    _save_ranking(item, request.user,
+                      judgment['start_timestamp'],
+                      judgment['end_timestamp'], judgment['order'], ranks,
+                      submit_button)
+                
+                except (KeyError, IndexError, TypeError, ValueError,
+                  AttributeError, RankingTask.DoesNotExist), msg:
+                    LOGGER.debug('Invalid judgment #%d for HIT %s: %r',
+                      index, hit_id, msg)
+                    rejected.append(index)
+                    continue
+                
+                saved.append(item.id)
+    
+    next_items = []
+    if hit.active:
+        RankingTask.prefetch_texts(items)
+        next_items = _find_next_items_to_process(items, request.user, count)
+    
+    finished_items = 0
+    if next_items:
+        finished_items = RankingResult.objects.filter(user=request.user,
+          item__in=items).count()
+    
+    payload = []
+    for index, item in enumerate(next_items):
+        item.hit = hit
+        item_data = _compute_item_data(item, finished_items + index + 1)
+        item_data['translations'] = [x[0] for x in item_data['translations']]
+        payload.append(item_data)
+    
+    next_url = None
+    if not payload:
+        next_url = reverse('appraise.wmt16.views.overview')
+    
+    data = {'hit_id': hit.hit_id, 'saved': saved, 'items': payload,
+      'next_url': next_url}
+    if rejected:
+        data.update({'error': error, 'rejected': rejected})
+        return _json_response(data, 400)
+    
+    return _json_response(data)
+
+
 @login_required
 def overview(request):
     """
     Renders the evaluation tasks overview.
     """
-    LOGGER.info('Rendering WMT16 HIT overview for user "{0}".'.format(
-      request.user.username or "Anonymous"))
+    LOGGER.info('Rendering WMT16 HIT overview for user "%s".',
+      request.user.username or "Anonymous")
     
     # Re-initialise random number generator.
     seed(None)
@@ -431,7 +540,7 @@ def overview(request):
 
     for language_pair in language_pairs:
         for annotation_project in annotation_projects:
-            hit = _compute_next_task_for_user(request.user, annotation_project, language_pair)
+            hit = HIT.compute_next_task_for_user(request.user, annotation_project, language_pair)
             user_status = HIT.compute_status_for_user(request.user, annotation_project, language_pair)
             for i in range(3):
                 total[i] = total[i] + user_status[i]
@@ -457,10 +566,9 @@ def overview(request):
     groups = _identify_groups_for_user(request.user)
     group = None
     if len(groups) > 1:
-        LOGGER.debug(u'User "{0}" assigned to multiple annotation groups: {1}'.format(
+        LOGGER.debug(u'User "%s" assigned to multiple annotation groups: %s',
           request.user.username or u'Anonymous',
           u', '.join([x.name for x in groups]))
-        )
         group = groups[0]
     
     if group is not None:
@@ -473,9 +581,10 @@ def overview(request):
         group_status = None
         group_name = None
     
-    LOGGER.debug(u'\n\nHIT data for user "{0}":\n\n{1}\n'.format(
-      request.user.username or "Anonymous",
-      u'\n'.join([u'{0}\t{1}\t{2}\t{3}'.format(*x) for x in hit_data])))
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        LOGGER.debug(u'\n\nHIT data for user "%s":\n\n%s\n',
+          request.user.username or "Anonymous",
+          u'\n'.join([u'{0}\t{1}\t{2}\t{3}'.format(*x) for x in hit_data]))
 
     # Compute admin URL for super users.
     admin_url = None
@@ -494,18 +603,64 @@ def overview(request):
     }
     dictionary.update(BASE_CONTEXT)
     
-    LOGGER.info(dictionary.values())
+    LOGGER.debug('Overview context: %s', dictionary)
     
     return render(request, 'wmt16/overview.html', dictionary)
 
 
+def _compute_status_validator():
+    """
+    Computes a cheap validator for the data shown on the status page.
+
+    Returns a dictionary with the number of ranking results and the latest
+    completion time.  update_status() and update_ranking() store it with
+    the data they compute, so workers which computed their caches from the
+    same data use the same validator.
+
+    """
+    return RankingResult.objects.aggregate(results=Count('id'),
+      completion=Max('completion'))
+
+
+def _status_etag(request):
+    """
+    Computes the ETag for the status view from the status cache validators.
+
+    The status page only renders cached data, hence the ETag changes when
+    update_status() or update_ranking() refresh the caches from changed
+    data.  Returns None if the caches have not been completely filled yet.
+
+    """
+    for key in STATUS_KEYS + ('validator',):
+        if not STATUS_CACHE.has_key(key):
+            return None
+    
+    _validators = [x.get('validator') or {}
+      for x in (STATUS_CACHE, RANKINGS_CACHE)]
+    _etag = u'{0}/{1}/{2}'.format(request.user.username,
+      request.user.is_superuser, u'/'.join([u'{0}/{1}'.format(
+      x.get('results'), x.get('completion')) for x in _validators]))
+    return md5(_etag.encode('utf-8')).hexdigest()
+
+
+def _status_last_modified(request):
+    """
+    Returns the latest completion time of the data in the status caches.
+    """
+    _validators = [x.get('validator') for x in (STATUS_CACHE, RANKINGS_CACHE)]
+    _completion = [x['completion'] for x in _validators
+      if x is not None and x['completion'] is not None]
+    return max(_completion or [None])
+
+
 @login_required
+@condition(etag_func=_status_etag, last_modified_func=_status_last_modified)
 def status(request):
     """
     Renders the status overview.
     """
-    LOGGER.info('Rendering WMT16 HIT status for user "{0}".'.format(
-      request.user.username or "Anonymous"))
+    LOGGER.info('Rendering WMT16 HIT status for user "%s".',
+      request.user.username or "Anonymous")
     
     if not STATUS_CACHE.has_key('global_stats'):
         update_status(key='global_stats')
@@ -539,6 +694,49 @@ def status(request):
     return render(request, 'wmt16/status.html', dictionary)
 
 
+@login_required
+def progress(request):
+    """
+    Returns campaign progress curves as JSON for plotting.
+
+    Optional GET parameters:
+    - keys: comma-separated TimedKeyValueData keys;
+    - resolution: either "hour" or "day" (default);
+    - days: only return data for the given number of most recent days.
+
+    """
+    LOGGER.info('Rendering WMT16 progress data for user "%s".',
+      request.user.username or "Anonymous")
+
+    keys = request.GET.get('keys', None)
+    if keys:
+        keys = [x for x in keys.split(',') if x]
+    else:
+        keys = PROGRESS_KEYS
+
+    resolution = request.GET.get('resolution', 'day')
+    if not resolution in [x[0] for x in TIME_SERIES_RESOLUTION_CHOICES]:
+        return HttpResponseBadRequest('Invalid resolution "{0}"'.format(
+          resolution))
+
+    since = None
+    try:
+        days = int(request.GET.get('days', 0))
+        if days > 0:
+            since = datetime.now() - timedelta(days=days)
+
+    except ValueError:
+        return HttpResponseBadRequest('Invalid number of days')
+
+    series = {}
+    for key in keys:
+        _series = TimedKeyValueData.get_time_series(key, resolution, since)
+        series[key] = [(x[0].isoformat(), x[1]) for x in _series]
+
+    data = {'resolution': resolution, 'series': series}
+    return HttpResponse(json.dumps(data), mimetype='application/json')
+
+
 def update_ranking(request=None):
     """
     Updates the in-memory RANKINGS_CACHE dictionary.
@@ -549,6 +747,8 @@ def update_ranking(request=None):
     based solution...
     
     """
+    # The validator is computed first, so it never claims newer data.
+    RANKINGS_CACHE['validator'] = _compute_status_validator()
     if request is not None:
         RANKINGS_CACHE['clusters'] = _compute_ranking_clusters(load_file=True)
         return HttpResponse('Ranking updated successfully')
@@ -568,6 +768,10 @@ def update_status(request=None, key=None):
     if key:
         status_keys = (key,)
     
+    # Remember which data the status is computed from, needed for
+    # conditional GET support.  Computed first to never claim newer data.
+    _validator = _compute_status_validator()
+    
     for status_key in status_keys:
         if status_key == 'global_stats':
             STATUS_CACHE[status_key] = _compute_global_stats()
@@ -583,6 +787,8 @@ def update_status(request=None, key=None):
             user_stats = _compute_user_stats()
             STATUS_CACHE[status_key] = user_stats[:25]
     
+    STATUS_CACHE['validator'] = _validator
+    
     if request is not None:
         return HttpResponse('Status updated successfully')
 
@@ -603,7 +809,8 @@ def _compute_global_stats():
     hits_completed = HIT.objects.filter(mturk_only=False, completed=True).count()
     
     # Check any remaining active HITs which are not yet marked complete.
-    for hit in HIT.objects.filter(active=True, mturk_only=False, completed=False):
+    for hit in HIT.objects.filter(active=True, mturk_only=False,
+      completed=False).defer('hit_xml'):
         if hit.users.count() >= 1:
             hits_completed = hits_completed + 1
             hit.completed = True
@@ -615,11 +822,12 @@ def _compute_global_stats():
     # Compute number of results contributed so far.
     ranking_results = RankingResult.objects.filter(
       item__hit__completed=True, item__hit__mturk_only=False)
+    RankingTask.prefetch_texts(RankingTask.objects.filter(
+      hit__completed=True, hit__mturk_only=False, rankingresult__isnull=False))
     
     from math import factorial
     system_comparisons = 0
-    for result in ranking_results:
-        result.reload_dynamic_fields()
+    for result in ranking_results.select_related('item'):
         # TODO: this implicitly counts A=B comparisons for multi systems.
         # Basically, inflating the number of pairwise comparisons... Fix!
         combinations = factorial(result.systems)/(factorial(result.systems-2) * 2) if result.systems > 2 else 0
@@ -648,15 +856,17 @@ def _compute_global_stats():
     global_stats.append(('Total duration', seconds_to_timedelta(total_time)))
     
     # Create new status data snapshot
-    TimedKeyValueData.update_status_if_changed('users', str(len(wmt16_users)))
-    TimedKeyValueData.update_status_if_changed('groups', str(len(groups)))
-    TimedKeyValueData.update_status_if_changed('hits_completed', str(hits_completed))
-    TimedKeyValueData.update_status_if_changed('hits_remaining', str(hits_remaining))
-    TimedKeyValueData.update_status_if_changed('ranking_results', str(ranking_results.count()))
-    TimedKeyValueData.update_status_if_changed('system_comparisons', str(system_comparisons))
-    TimedKeyValueData.update_status_if_changed('duration_per_hit', str(seconds_to_timedelta(avg_time)))
-    TimedKeyValueData.update_status_if_changed('duration_per_task', str(seconds_to_timedelta(avg_user_time)))
-    TimedKeyValueData.update_status_if_changed('duration_total', str(seconds_to_timedelta(total_time)))
+    TimedKeyValueData.update_statuses_if_changed({
+      'users': str(len(wmt16_users)),
+      'groups': str(len(groups)),
+      'hits_completed': str(hits_completed),
+      'hits_remaining': str(hits_remaining),
+      'ranking_results': str(ranking_results.count()),
+      'system_comparisons': str(system_comparisons),
+      'duration_per_hit': str(seconds_to_timedelta(avg_time)),
+      'duration_per_task': str(seconds_to_timedelta(avg_user_time)),
+      'duration_total': str(seconds_to_timedelta(total_time)),
+    })
     
     return global_stats
 
@@ -675,16 +885,21 @@ def _compute_language_pair_stats():
         _name = choice[1]
         _remaining_hits = HIT.compute_remaining_hits(language_pair=_code)
         _completed_hits = HIT.objects.filter(completed=True, mturk_only=False,
-          language_pair=_code)
+          language_pair=_code).defer('hit_xml')
+        
+        # Systems are collected from all items with results, at once.
+        _items = RankingTask.objects.filter(hit__in=_completed_hits,
+          rankingresult__isnull=False).distinct()
+        RankingTask.prefetch_texts(_items)
         
         _unique_systems_for_language_pair = set()
-        for _hit in _completed_hits:
-            for _result in RankingResult.objects.filter(item__hit=_hit):
-                for _translation in _result.item.translations:
-                    for _system in set(_translation[1]['system'].split(',')):
-                         _unique_systems_for_language_pair.add(_system)
+        for _item in _items:
+            for _translation in _item.translations:
+                for _system in set(_translation[1]['system'].split(',')):
+                     _unique_systems_for_language_pair.add(_system)
         
-        LOGGER.info(_unique_systems_for_language_pair)
+        LOGGER.debug('Systems for %s: %s', _code,
+          _unique_systems_for_language_pair)
         _completed_hits = _completed_hits.count()
         _total_hits = _remaining_hits + _completed_hits
                 
@@ -696,6 +911,12 @@ def _compute_language_pair_stats():
         )
         
         language_pair_stats.append(_data)
+        
+        # Create new status data snapshot for this language pair.
+        TimedKeyValueData.update_statuses_if_changed({
+          'hits_remaining_{0}'.format(_code): str(_remaining_hits),
+          'hits_completed_{0}'.format(_code): str(_completed_hits),
+        })
     
     return language_pair_stats
 
@@ -812,7 +1033,7 @@ def _compute_ranking_clusters(load_file=False):
             outfile.write(export_csv)
         
         # Run Philipp's Perl script to compute ranking clusters.
-        PERL_OUTPUT = check_output(['perl', _script, _wmt16], shell=True)
+        PERL_OUTPUT = check_output(['perl', _script, _wmt16])
         
         with open(_dump, 'w') as outfile:
             outfile.write(PERL_OUTPUT)
@@ -842,8 +1063,9 @@ def _compute_ranking_clusters(load_file=False):
     _sorted_language_pairs = [x[1].decode('utf-8') for x in LANGUAGE_PAIR_CHOICES]
     for language_pair in _sorted_language_pairs:
         _language_data = []
-        for cluster_id in sorted(CLUSTER_DATA[language_pair].keys()):
-           _data = CLUSTER_DATA[language_pair][cluster_id]
+        _clusters = CLUSTER_DATA.get(language_pair, {})
+        for cluster_id in sorted(_clusters.keys()):
+           _data = _clusters[cluster_id]
            _language_data.append((cluster_id, _data))
         _cluster_data.append((language_pair, _language_data))
     
@@ -1093,70 +1315,188 @@ def profile_update(request):
     return render(request, 'wmt16/profile_update.html', context)
     
 
+def _export_validator(request, token, project):
+    """
+    Computes a cheap validator for the results exported for the given project.
+
+    Returns a dictionary with the number of results and the latest completion
+    time for completed HITs of the project, or None if the token is invalid.
+    The value is memoized on the request as both ETag and Last-Modified use it.
+
+    """
+    if not hasattr(request, '_export_validator'):
+        from appraise.local_settings import EXPORT_TOKEN
+        _validator = None
+        if token == EXPORT_TOKEN:
+            _validator = RankingResult.objects.filter(
+              item__hit__completed=True, item__hit__project__name=project
+            ).aggregate(results=Count('id'), completion=Max('completion'))
+        
+        request._export_validator = _validator
+    
+    return request._export_validator
+
+
+def _export_etag(request, token, project):
+    """
+    Computes the ETag for export views from the project's result validator.
+    """
+    _validator = _export_validator(request, token, project)
+    if _validator is None or not _validator['results']:
+        return None
+    
+    _etag = u'{0}/{1}/{2}'.format(project, _validator['results'],
+      _validator['completion'])
+    return md5(_etag.encode('utf-8')).hexdigest()
+
+
+def _export_last_modified(request, token, project):
+    """
+    Returns the latest completion time of results exported for project.
+    """
+    _validator = _export_validator(request, token, project)
+    if _validator is None:
+        return None
+    
+    return _validator['completion']
+
+
+def _export_results_for_project(request, annotation_project):
+    """
+    Returns (queryset, resumed) for the results exported for given project.
+
+    Clients can resume an export by passing the last RankingResult id they
+    have seen as since_id GET parameter;  only newer results are returned
+    then.  Raises ValueError for invalid since_id values.
+
+    """
+    queryset = RankingResult.objects.filter(item__hit__completed=True,
+      item__hit__project=annotation_project).order_by('id')
+    
+    since_id = request.GET.get('since_id', None)
+    if since_id is not None:
+        queryset = queryset.filter(id__gt=int(since_id))
+    
+    return (queryset, since_id is not None)
+
+
+def _iter_results_with_texts(queryset, chunk_size=500):
+    """
+    Yields the RankingResult instances in queryset, fetching related data.
+
+    Results are loaded in chunks of chunk_size, together with their items
+    and HITs;  item texts are prefetched with one batched lookup per chunk.
+
+    """
+    result_ids = list(queryset.values_list('id', flat=True))
+    for i in range(0, len(result_ids), chunk_size):
+        _chunk = result_ids[i:i+chunk_size]
+        RankingTask.prefetch_texts(RankingTask.objects.filter(
+          rankingresult__id__in=_chunk))
+        
+        _results = RankingResult.objects.filter(id__in=_chunk)
+        for result in _results.select_related('item__hit').order_by('id'):
+            yield result
+
+
+def _export_csv_response(results, last_result_id):
+    """
+    Returns plain text HttpResponse for exported CSV lines.
+
+    The X-Appraise-Last-Result-Id header tells clients which since_id value
+    to use when resuming the export later.
+
+    """
+    export_csv = u"\n".join(results)
+    if export_csv:
+        export_csv = export_csv + u"\n"
+    
+    response = HttpResponse(export_csv, mimetype='text/plain')
+    if last_result_id is not None:
+        response['X-Appraise-Last-Result-Id'] = str(last_result_id)
+    
+    return response
+
+
+@condition(etag_func=_export_etag, last_modified_func=_export_last_modified)
 def export_to_pairwise_csv(request, token, project):
     """
     Exports all annotations for the given project in pairwise CSV format.
     
     Requires that given token matches the secret token set in local config.
+    Supports conditional GET and resuming via since_id, see above.
     """
     from appraise.local_settings import EXPORT_TOKEN
     if not token == EXPORT_TOKEN:
         return HttpResponseForbidden()
         
     annotation_project = get_object_or_404(Project, name=project)
-        
-    queryset = RankingResult.objects.filter(item__hit__completed=True)
-
-    results = [u'srclang,trglang,srcIndex,segmentId,judgeId,' \
-      'system1Id,system1rank,system2Id,system2rank,rankingID']
     
-    for result in queryset:
-        if isinstance(result, RankingResult):
-            if result.item.hit.project_set.filter(id=annotation_project.id):
-                current_csv = result.export_to_pairwise_csv()
-                if current_csv is None:
-                    continue
-                results.append(current_csv)
+    try:
+        queryset, resumed = _export_results_for_project(request,
+          annotation_project)
     
-    export_csv = u"\n".join(results)
-    export_csv = export_csv + u"\n"
-    return HttpResponse(export_csv, mimetype='text/plain')
+    except ValueError:
+        return HttpResponseBadRequest('Invalid since_id')
+    
+    results = []
+    if not resumed:
+        results.append(u'srclang,trglang,srcIndex,segmentId,judgeId,' \
+          'system1Id,system1rank,system2Id,system2rank,rankingID')
+    
+    last_result_id = request.GET.get('since_id', None)
+    for result in _iter_results_with_texts(queryset):
+        last_result_id = result.id
+        current_csv = result.export_to_pairwise_csv()
+        if current_csv is None:
+            continue
+        results.append(current_csv)
+    
+    return _export_csv_response(results, last_result_id)
 
 
+@condition(etag_func=_export_etag, last_modified_func=_export_last_modified)
 def export_to_ranking_csv(request, token, project):
     """
     Exports all annotations for the given project in ranking CSV format.
     
     Requires that given token matches the secret token set in local config.
+    Supports conditional GET and resuming via since_id, see above.
     """
     from appraise.local_settings import EXPORT_TOKEN
     if not token == EXPORT_TOKEN:
         return HttpResponseForbidden()
         
     annotation_project = get_object_or_404(Project, name=project)
-        
-    queryset = RankingResult.objects.filter(item__hit__completed=True)
-
-    results = [u'srclang,trglang,srcIndex,doucmentId,segmentId,judgeId,' \
-      'system1Number,system1Id,system2Number,system2Id,system3Number,' \
-      'system3Id,system4Number,system4Id,system5Number,system5Id,' \
-      'system1rank,system2rank,system3rank,system4rank,system5rank']
-    
-    for result in queryset:
-        if isinstance(result, RankingResult):
-            if result.item.hit.project_set.filter(id=annotation_project.id):
-                # Current implementation of export_to_pairwise_csv() is weird.
-                # By contrast, export_to_csv() generates the right thing...
-                current_csv = result.export_to_csv()
-                if current_csv is None:
-                    continue
-                results.append(current_csv)
     
-    export_csv = u"\n".join(results)
-    export_csv = export_csv + u"\n"
-    return HttpResponse(export_csv, mimetype='text/plain')
+    try:
+        queryset, resumed = _export_results_for_project(request,
+          annotation_project)
+    
+    except ValueError:
+        return HttpResponseBadRequest('Invalid since_id')
+    
+    results = []
+    if not resumed:
+        results.append(u'srclang,trglang,srcIndex,doucmentId,segmentId,judgeId,' \
+          'system1Number,system1Id,system2Number,system2Id,system3Number,' \
+          'system3Id,system4Number,system4Id,system5Number,system5Id,' \
+          'system1rank,system2rank,system3rank,system4rank,system5rank')
+    
+    last_result_id = request.GET.get('since_id', None)
+    for result in _iter_results_with_texts(queryset):
+        last_result_id = result.id
+        # Current implementation of export_to_pairwise_csv() is weird.
+        # By contrast, export_to_csv() generates the right thing...
+        current_csv = result.export_to_csv()
+        if current_csv is None:
+            continue
+        results.append(current_csv)
+    
+    return _export_csv_response(results, last_result_id)
 
 
+@condition(etag_func=_export_etag, last_modified_func=_export_last_modified)
 def export_to_ranking_xml(request, token, project):
     """
     Exports all annotations for the given project in ranking XML format.
@@ -1171,13 +1511,11 @@ def export_to_ranking_xml(request, token, project):
     
     template = get_template('wmt16/result_export.xml')
     
-    queryset = HIT.objects.filter(completed=True)
+    queryset = HIT.objects.filter(completed=True, project=annotation_project)
     
     results = []
     for task in queryset:
-        if isinstance(task, HIT):
-            if task.project_set.filter(id=annotation_project.id):
-                results.append(task.export_to_xml())
+        results.append(task.export_to_xml())
     
     export_xml = template.render(Context({'tasks': results}))
     return HttpResponse(export_xml, mimetype='text/xml; charset=UTF-8')
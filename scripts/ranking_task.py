@@ -34,26 +34,28 @@ class Control(RankingTask):
 
     @staticmethod
     def load(filename):
-        controls = []
+        return list(Control.iterate(filename))
+
+    @staticmethod
+    def iterate(filename):
+        """Yields the controls in `filename' one by one, without reading the whole file."""
         control = None
 
-        fh = open(filename)
-        for line in fh:
-            line = line.rstrip()
-            if line.startswith('SENTENCE '):
-                control = Control()
-                control.id = int(line.split()[-1])
-            elif line.startswith('SOURCE '):
-                control.source = ' '.join(line.split()[1:])
-            elif line.startswith('REFERENCE '):
-                control.reference = ' '.join(line.split()[1:])
-            elif line.startswith('SYSTEMS '):
-                control.system_names = line.split()[1:]
-                control.system_outputs = [fh.next().rstrip() for x in control.system_names]
-                control.ranks = [fh.next().rstrip().split() for x in control.system_names]
-                controls.append(control)
-
-        return controls
+        with open(filename) as fh:
+            for line in fh:
+                line = line.rstrip()
+                if line.startswith('SENTENCE '):
+                    control = Control()
+                    control.id = int(line.split()[-1])
+                elif line.startswith('SOURCE '):
+                    control.source = ' '.join(line.split()[1:])
+                elif line.startswith('REFERENCE '):
+                    control.reference = ' '.join(line.split()[1:])
+                elif line.startswith('SYSTEMS '):
+                    control.system_names = line.split()[1:]
+                    control.system_outputs = [fh.next().rstrip() for x in control.system_names]
+                    control.ranks = [fh.next().rstrip().split() for x in control.system_names]
+                    yield control
 
     def __init__(self):
         self.ranks = None
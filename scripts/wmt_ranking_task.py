@@ -12,12 +12,16 @@ will have a control), and so on.
 """
 
 import os
+import re
 import sys
 import glob
 import math
 import random
 import hashlib
 import argparse
+from array import array
+from collections import defaultdict
+from itertools import islice
 from ranking_task import RankingTask, Control
 
 PARSER = argparse.ArgumentParser(description="Build evaluation task input file.")
@@ -39,22 +43,64 @@ PARSER.add_argument('-controls', type=str, default=None, dest="controlFile", hel
 PARSER.add_argument('-control_prob', type=float, default=1.0, dest="control_prob", help='probability of inserting a control into a HIT')
 PARSER.add_argument('-save', type=str, default=None, dest="saveDir", help='directory to save reduced corpora to')
 
+WHITESPACE = re.compile('\s{2,}')
+
 def cleanup_translation(input_str):
     """Cleans a translation for identity comparison.
     
     Removes superfluous whitespace.
     
     """
-    import re
-    whitespace = re.compile('\s{2,}')
-    cleaned_str = whitespace.sub(' ', input_str)
+    cleaned_str = WHITESPACE.sub(' ', input_str)
     return cleaned_str
 
+class IndexedFile:
+    """Random access to the lines of a text file, which is not loaded into memory.
+
+    The byte offset of each line is recorded on first access; lines are then read on demand."""
+
+    def __init__(self, input):
+        self.input = input
+        self.name = input.name
+        self._offsets = None
+
+    def _index(self):
+        if self._offsets is None:
+            self._offsets = array('l')
+            self.input.seek(0)
+            offset = 0
+            for line in self.input:
+                self._offsets.append(offset)
+                offset += len(line)
+        return self._offsets
+
+    def __len__(self):
+        return len(self._index())
+
+    def __getitem__(self, line_no):
+        self.input.seek(self._index()[line_no])
+        return self.input.readline().decode("utf-8").strip()
+
+    def __iter__(self):
+        self.input.seek(0)
+        for line in self.input:
+            yield line.decode("utf-8").strip()
+
+def partial_fisher_yates(range_max, num_draws):
+    """Yields `num_draws' unique random integers from the range (0, range_max-1). This is a partial Fisher-Yates shuffle: only swapped positions are stored, so time and memory are linear in `num_draws', not in `range_max'."""
+
+    if num_draws > range_max:
+        raise ValueError('cannot draw %d unique numbers from %d' % (num_draws, range_max))
+
+    swapped = {}
+    for i in xrange(num_draws):
+        j = random.randint(i, range_max - 1)
+        yield swapped.get(j, j)
+        swapped[j] = swapped.get(i, i)
+
 def random_from_range(range_max, num_draws, tuple_size = 3, sequential = True):
     """Returns a set of tuples (of size `size') of numbers, representing sentences to use in constructing a HIT. `range_max' is the number of sentences, `num_draws' is the number of HITs to create, `tuple_size' is the number of sentences in each HIT, and `sequential' indicates that we should draw sentences in block groups."""
     
-    """Returns a set of 'num' unique integers from the range (0, max-1)."""
-
     blocks = []
     if sequential is True:
         num_blocks = int(math.ceil(1.0 * range_max / tuple_size))
@@ -62,13 +108,20 @@ def random_from_range(range_max, num_draws, tuple_size = 3, sequential = True):
         random.shuffle(sentences)
         blocks = [tuple(range(block, block + tuple_size)) for block in sentences]
     else:
-        sentences = range(range_max)
-        random.shuffle(sentences)
-
-        blocks = [tuple([sentences.pop(random.randint(0, len(sentences) - 1)) for x in range(tuple_size)]) for x in range(num_draws)]
+        sentences = partial_fisher_yates(range_max, num_draws * tuple_size)
+        blocks = [tuple(islice(sentences, tuple_size)) for x in range(num_draws)]
 
     return blocks
 
+def dump_system(system_file, lines):
+    outfile = os.path.join(args.saveDir, os.path.basename(system_file))
+    if not os.path.exists(outfile):
+        sys.stderr.write('DUMPING TO %s\n' % (outfile))
+        out = open(outfile, 'w')
+        for line in lines:
+            out.write(u'{0}\n'.format(line).encode('utf-8'))
+        out.close()
+
 if __name__ == "__main__":
     args = PARSER.parse_args()
 
@@ -83,24 +136,20 @@ if __name__ == "__main__":
     if args.controlFile is not None:
         args.sequential = False
 
-        controls = Control.load(args.controlFile)
-#        print 'Read %d controls, keeping %d best' % (len(controls), args.numhits - args.redundancy)
-        controls = controls[:args.numhits-args.redundancy]
+        controls = list(islice(Control.iterate(args.controlFile), num_unique_hits))
 
         if len(controls) < num_unique_hits:
             sys.stderr.write('* WARNING: not enough controls (%d < %d)\n' % (len(controls), num_unique_hits))
 
     # BEGIN 
 
-    source = []
-    for line in args.source:
-        source.append(line.decode("utf-8").strip())
-    
-    reference = []
-    if args.reference:
-        for line in args.reference:
-            reference.append(line.decode("utf-8").strip())
+    source = IndexedFile(args.source)
     
+    if not args.reference:
+        sys.stderr.write('* FATAL: reference length (0) != source length (%d)\n' % (len(source)))
+        sys.exit(1)
+
+    reference = IndexedFile(args.reference)
     if len(reference) != len(source):
         sys.stderr.write('* FATAL: reference length (%d) != source length (%d)\n' % (len(reference), len(source)))
         sys.exit(1)
@@ -109,12 +158,9 @@ if __name__ == "__main__":
     system_names = []
     if len(args.system):
         for i, system in enumerate(glob.glob(args.system)):
-            systems.append([])
             system_name = os.path.basename(system)
             system_names.append(system_name)
-            with open(system, "r") as input:
-                for line in input:
-                    systems[i].append(line.decode("utf-8").strip())
+            systems.append(IndexedFile(open(system, "r")))
             
             if len(systems[i]) != len(source):
                 sys.stderr.write('* FATAL: system %s length (%d) != source length (%d)\n' % (system_name, len(systems[i]), len(source)))
@@ -124,33 +170,40 @@ if __name__ == "__main__":
 
     # Make a list of all eligible sentences
     eligible = []
-    for i in range(len(source)):
-        if len(source[i].split()) <= args.maxlen:
+    for i, line in enumerate(source):
+        if len(line.split()) <= args.maxlen:
             eligible.append(i)
 
-    def dump_system(system_file, lines):
-        outfile = os.path.join(args.saveDir, os.path.basename(system_file))
-        if not os.path.exists(outfile):
-            sys.stderr.write('DUMPING TO %s\n' % (outfile))
-            out = open(outfile, 'w')
-            for line in lines:
-                out.write(u'{0}\n'.format(line).encode('utf-8'))
-            out.close()
-
     # Save corpora if requested and not already existing
     if args.saveDir is not None:
         if not os.path.exists(args.saveDir):
             os.makedirs(args.saveDir)
         dump_system(args.source.name, source)
         dump_system(args.reference.name, reference)
-        for i, system in enumerate(glob.glob(args.system)):
-            dump_system(system, systems[i])
+        for system in systems:
+            dump_system(system.name, system)
         dump_system('line_numbers', [x + 1 for x in eligible])
 
-    random_blocks = random_from_range(len(eligible), args.numhits - args.redundancy, tuple_size = args.tasksperhit, sequential = args.sequential)
-    hits = []
+    # Redundant HITs are copies of randomly chosen HITs, appended after all unique HITs.  We choose
+    # them up front so that only these HITs have to be kept in memory while writing the output.
+    redundant_numbers = []
+    try:
+        random_blocks = random_from_range(len(eligible), num_unique_hits, tuple_size = args.tasksperhit, sequential = args.sequential)
+        if args.redundancy > 0:
+            redundant_numbers = [x[0] for x in random_from_range(len(random_blocks), args.redundancy, tuple_size = 1, sequential = False)]
+    except ValueError, msg:
+        sys.stderr.write('* FATAL: %s\n' % msg)
+        sys.exit(1)
+    redundant_hits = dict.fromkeys(redundant_numbers)
+
+    # Controls are drawn lazily and without replacement, see random_from_range().
+    control_numbers = partial_fisher_yates(len(controls), len(controls))
+    remaining_controls = len(controls)
+
+    out = open(args.output, 'w')
+    out.write(u'<hits>\n'.encode('utf-8'))
     
-    for sentnos_tuple in random_blocks:
+    for hit_number, sentnos_tuple in enumerate(random_blocks):
 
         # We need to avoid duplicate candidate translations.  To do so, we have to check
         # which systems have identical translations -- this may be different across tasks.
@@ -160,12 +213,12 @@ if __name__ == "__main__":
         tasks = []
         
         for current_id in sentnos_tuple:
-            from collections import defaultdict
             unique_translations_to_system_ids_map = defaultdict(list)
+            system_outputs = [system[eligible[current_id]] for system in systems]
             
             # Then we iterate over all systems and map unique translations to system IDs. 
-            for system_id in range(len(systems)):
-                current_translation = cleanup_translation(systems[system_id][eligible[current_id]])
+            for system_id, system_output in enumerate(system_outputs):
+                current_translation = cleanup_translation(system_output)
                 unique_translations_to_system_ids_map[current_translation].append(system_id)
             
             # To randomize the selection of systems, we have to generate the list of unique translations.
@@ -180,7 +233,7 @@ if __name__ == "__main__":
             for deduped_id in deduped_system_indexes:
                 deduped_system_names.append(u','.join([system_names[system_id] for system_id in deduped_system_ids[deduped_id]]))
                 system_id = deduped_system_ids[deduped_id][0] 
-                deduped_system_output.append(systems[system_id][eligible[current_id]])
+                deduped_system_output.append(system_outputs[system_id])
             
             tasks.append(
               RankingTask(
@@ -207,9 +260,10 @@ if __name__ == "__main__":
         # is, we roll a dice to see whether to insert a control (determined by
         # args.control_prob). If so, we randomly choose which HIT to replace, and then randomly
         # choose one of the remaining controls to put there.
-        if len(controls):
+        if remaining_controls:
             if random.random() < args.control_prob:
-                tasks[random.randint(0, len(tasks)-1)] = controls.pop(random.randint(0,len(controls)-1))
+                tasks[random.randint(0, len(tasks)-1)] = controls[next(control_numbers)]
+                remaining_controls -= 1
 
         # sentnos_str = ",".join([`x.id` for x in tasks])
         sentnos_str = u"-1"
@@ -217,16 +271,16 @@ if __name__ == "__main__":
         hit += u''.join([task.xml() for task in tasks])
         hit += u'\n  </hit>'
 
-        hits.append(hit)
+        if hit_number > 0:
+            out.write(u'\n'.encode('utf-8'))
+        out.write(hit.encode('utf-8'))
+        
+        if hit_number in redundant_hits:
+            redundant_hits[hit_number] = hit
 
     # Now create redundant HITs
-    if args.redundancy > 0:
-        numbers = random_from_range(len(hits), args.redundancy, tuple_size = 1, sequential = False)
+    for hit_number in redundant_numbers:
+        out.write(u'\n{0}'.format(redundant_hits[hit_number]).encode('utf-8'))
 
-        hits += [hits[x[0]] for x in numbers]
-
-    result_xml = u'<hits>\n{0}\n</hits>'.format(u'\n'.join(hits))
-    
-    out = open(args.output, 'w')
-    out.write(result_xml.encode('utf-8'))
+    out.write(u'\n</hits>'.encode('utf-8'))
     out.close()